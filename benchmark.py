@@ -0,0 +1,352 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import datetime
+import platform
+import tempfile
+import functools
+import statistics
+import subprocess
+import importlib.util
+import contextlib
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+ENTRY_MODULE = 'personal_assistant'
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Модули, которые не должны загружаться при простом запуске программы
+HEAVY_MODULES = ('pandas', 'numpy')
+SCALES = {'1k': 1000, '100k': 100000, '1m': 1000000}
+DEFAULT_SCALES = '1k,100k'
+DEFAULT_SEED = 42
+# Число добавлений, чтений и удалений по ID в каждом прогоне
+OPERATIONS = 1000
+BASELINE_FILE = os.path.join(PROJECT_DIR, 'benchmark_baseline.json')
+REGRESSION_THRESHOLD = 0.2
+# Метрики сравниваются по суффиксу; разница меньше порога считается шумом, а не регрессией
+METRIC_NOISE = {'_s': 0.005, '_ms': 5, '_kb': 1024}
+REPORT_PERIOD = ('01-01-2022', '31-12-2022')
+
+WORDS = ('проект', 'встреча', 'отчёт', 'бюджет', 'покупки', 'идея', 'звонок', 'договор', 'поездка',
+         'ремонт', 'план', 'список', 'заказ', 'оплата', 'врач', 'книга', 'спорт', 'курс', 'подарок', 'дача')
+FIRST_NAMES = ('Иван', 'Мария', 'Алексей', 'Ольга', 'Сергей', 'Анна', 'Дмитрий', 'Елена', 'Павел', 'Наталья')
+LAST_NAMES = ('Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов', 'Михайлов',
+              'Новиков', 'Фёдоров')
+CATEGORIES = ('Продукты', 'Транспорт', 'Жильё', 'Связь', 'Здоровье', 'Развлечения', 'Зарплата', 'Подработка')
+PRIORITIES = ('Высокий', 'Средний', 'Низкий')
+FIRST_DAY = datetime.date(2020, 1, 1).toordinal()
+LAST_DAY = datetime.date(2025, 12, 31).toordinal()
+
+
+def run_python(args, cwd=PROJECT_DIR):
+    return subprocess.run([sys.executable] + args, cwd=cwd, capture_output=True, text=True, check=True)
+
+
+def parse_importtime(stderr):
+    # Строка -X importtime: "import time: self [us] | cumulative | imported package",
+    # отступ перед именем модуля - глубина вложенного импорта
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append({'module': name.strip(),
+                        'depth': (len(name) - len(name.lstrip()) - 1) // 2,
+                        'self_us': int(self_us),
+                        'cumulative_us': int(cumulative_us)})
+    return modules
+
+
+def benchmark_startup(options):
+    # Время импорта точки входа по -X importtime и полное время запуска интерпретатора с ней
+    import_times = []
+    wall_times = []
+    bare_times = []
+    modules = []
+    for _ in range(options.runs):
+        modules = parse_importtime(run_python(['-X', 'importtime', '-c', f'import {ENTRY_MODULE}']).stderr)
+        import_times.append(next(module['cumulative_us'] for module in modules
+                                 if module['module'] == ENTRY_MODULE))
+
+        started = time.perf_counter()
+        run_python(['-c', f'import {ENTRY_MODULE}'])
+        wall_times.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        run_python(['-c', 'pass'])
+        bare_times.append(time.perf_counter() - started)
+
+    loaded = {module['module'] for module in modules}
+    top_level = sorted((module for module in modules if module['depth'] == 0),
+                       key=lambda module: -module['cumulative_us'])
+    return {
+        'runs': options.runs,
+        'import_ms': round(statistics.median(import_times) / 1000, 3),
+        'process_ms': round(statistics.median(wall_times) * 1000, 3),
+        'interpreter_ms': round(statistics.median(bare_times) * 1000, 3),
+        'heavy_modules_loaded': [name for name in HEAVY_MODULES if name in loaded],
+        'slowest_imports': [{'module': module['module'], 'cumulative_ms': module['cumulative_us'] / 1000}
+                            for module in top_level[:10]],
+    }
+
+
+def random_words(rng, count):
+    return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+
+def random_date(rng):
+    return datetime.date.fromordinal(rng.randint(FIRST_DAY, LAST_DAY)).strftime("%d-%m-%Y")
+
+
+def random_phone(rng):
+    return f"+7 9{rng.randrange(10 ** 9):09d}"
+
+
+# Генераторы записей в формате файлов данных; при одном и том же seed данные совпадают
+def generate_notes(rng, count):
+    for note_id in range(1, count + 1):
+        yield {'note_id': note_id, 'title': random_words(rng, 3), 'content': random_words(rng, 30),
+               'timestamp': random_date(rng) + ' 12:00:00'}
+
+
+def generate_tasks(rng, count):
+    for task_id in range(1, count + 1):
+        yield {'task_id': task_id, 'title': random_words(rng, 4), 'description': random_words(rng, 12),
+               'done': rng.random() < 0.3, 'priority': rng.choice(PRIORITIES), 'due_date': random_date(rng)}
+
+
+def generate_contacts(rng, count):
+    for contact_id in range(1, count + 1):
+        yield {'contact_id': contact_id, 'name': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+               'phone': random_phone(rng), 'email': f"user{contact_id}@example.com"}
+
+
+def generate_finance_records(rng, count):
+    for record_id in range(1, count + 1):
+        yield {'record_id': record_id, 'amount': round(rng.uniform(-5000, 5000), 2),
+               'category': rng.choice(CATEGORIES), 'date': random_date(rng), 'description': random_words(rng, 3)}
+
+
+COLLECTIONS = {
+    'notes': {
+        'file': 'NOTES_FILE', 'key': 'note_id', 'generate': generate_notes,
+        'manager': 'NoteManager', 'records': 'notes', 'dump': 'dump_notes',
+        'add': lambda manager, rng: manager.add_note(random_words(rng, 3), random_words(rng, 30)),
+        'get': 'get_note_by_id', 'delete': 'delete_note',
+    },
+    'tasks': {
+        'file': 'TASKS_FILE', 'key': 'task_id', 'generate': generate_tasks,
+        'manager': 'TaskManager', 'records': 'tasks', 'dump': 'dump_tasks',
+        'add': lambda manager, rng: manager.add_task(random_words(rng, 4), random_words(rng, 12),
+                                                     rng.choice(PRIORITIES), random_date(rng)),
+        'get': 'get_task_by_id', 'delete': 'delete_task',
+    },
+    'contacts': {
+        'file': 'CONTACTS_FILE', 'key': 'contact_id', 'generate': generate_contacts,
+        'manager': 'ContactManager', 'records': 'contacts', 'dump': 'dump_contacts',
+        'add': lambda manager, rng: manager.add_contact(f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                                                        random_phone(rng)),
+        'get': 'get_contact_by_id', 'delete': 'delete_contact',
+    },
+    'finance': {
+        'file': 'FINANCE_FILE', 'key': 'record_id', 'generate': generate_finance_records,
+        'manager': 'FinanceManager', 'records': 'records', 'dump': 'dump_finance_records',
+        'add': lambda manager, rng: manager.add_finance_record(round(rng.uniform(-5000, 5000), 2),
+                                                               rng.choice(CATEGORIES), random_date(rng)),
+        'get': 'get_record_by_id', 'delete': 'delete_finance_record',
+    },
+}
+
+
+def measure(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return round(time.perf_counter() - started, 6), result
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В macOS ru_maxrss в байтах, в Linux - в килобайтах
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def prepare_dataset(name, count, seed):
+    # Отдельный процесс: сгенерированные данные не должны попасть в пиковую память замеров
+    import personal_assistant as pa
+    spec = COLLECTIONS[name]
+    pa.save_data(getattr(pa, spec['file']), spec['generate'](random.Random(seed), count), {'next_id': count + 1})
+
+
+def open_manager(pa, spec):
+    manager = getattr(pa, spec['manager'])()
+    getattr(manager, spec['records']).ensure_loaded()
+    return manager
+
+
+def run_worker(name, count, seed):
+    # Замеры горячих путей одной коллекции на заранее подготовленном файле данных в текущем каталоге
+    import personal_assistant as pa
+    spec = COLLECTIONS[name]
+    file_path = getattr(pa, spec['file'])
+    rng = random.Random(seed + 1)
+    operations = min(OPERATIONS, count)
+    ids = rng.sample(range(1, count + 1), operations)
+    results = {'records': count, 'operations': operations}
+
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+        results['load_data_s'], data = measure(pa.load_data, file_path, [], spec['key'])
+        del data
+        results['open_s'], manager = measure(open_manager, pa, spec)
+        records = getattr(manager, spec['records'])
+        results['save_data_s'], _ = measure(lambda: pa.save_data(file_path, getattr(manager, spec['dump'])(),
+                                                                 records.meta()))
+
+        results['add_s'], _ = measure(lambda: [spec['add'](manager, rng) for _ in range(operations)])
+        get_record = getattr(manager, spec['get'])
+        results['get_by_id_s'], _ = measure(lambda: [get_record(record_id) for record_id in ids])
+        delete_record = getattr(manager, spec['delete'])
+        results['delete_s'], _ = measure(lambda: [delete_record(record_id) for record_id in ids])
+        results['flush_s'], _ = measure(pa.flush_pending)
+
+        if name == 'finance':
+            results['view_filtered_records_s'], _ = measure(manager.view_filtered_records, *REPORT_PERIOD)
+            results['generate_report_s'], _ = measure(manager.generate_report, *REPORT_PERIOD)
+            results['generate_report_all_s'], _ = measure(manager.generate_report)
+
+        import_method, export_method = pa.CSV_METHODS[name]
+        csv_file = name + '.csv'
+        results['export_csv_s'], exported = measure(getattr(manager, export_method), csv_file)
+        # Импорт - в пустую коллекцию, чтобы число записей после него совпало с выгрузкой
+        del manager, records
+        pa.save_data(file_path, [], {'next_id': 1})
+        importer = open_manager(pa, spec)
+        results['import_csv_s'], imported = measure(lambda: (getattr(importer, import_method)(csv_file),
+                                                             pa.flush_pending())[0])
+
+    if exported is None or imported is None or imported['imported'] != exported:
+        raise RuntimeError(f"{name}: экспортировано {exported}, импортировано {imported}")
+    results['peak_rss_kb'] = peak_rss_kb()
+    return results
+
+
+def benchmark_collection(name, options):
+    results = {}
+    for scale in options.scales:
+        count = SCALES[scale]
+        with tempfile.TemporaryDirectory(prefix=f'pa-bench-{name}-') as data_dir:
+            worker = [os.path.join(PROJECT_DIR, 'benchmark.py'), '--seed', str(options.seed)]
+            run_python(worker + ['--prepare', name, str(count)], cwd=data_dir)
+            results[scale] = json.loads(run_python(worker + ['--worker', name, str(count)], cwd=data_dir).stdout)
+    return results
+
+
+BENCHMARKS = {
+    'startup': benchmark_startup,
+    'notes': functools.partial(benchmark_collection, 'notes'),
+    'tasks': functools.partial(benchmark_collection, 'tasks'),
+    'contacts': functools.partial(benchmark_collection, 'contacts'),
+    'finance': functools.partial(benchmark_collection, 'finance'),
+}
+
+
+def environment(options):
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'storage': os.environ.get('PA_STORAGE', 'journal'),
+        'write_behind': os.environ.get('PA_WRITE_BEHIND', '1') != '0',
+        'lazy_load': os.environ.get('PA_LAZY_LOAD', '1') != '0',
+        'optional_modules': [name for name in ('orjson', 'pandas', 'numpy') if importlib.util.find_spec(name)],
+        'seed': options.seed,
+    }
+
+
+def flatten_metrics(results, prefix=''):
+    # Пути вида finance.100k.load_data_s для числовых метрик, где меньше - лучше
+    for key, value in results.items():
+        path = f'{prefix}.{key}' if prefix else key
+        if isinstance(value, dict):
+            yield from flatten_metrics(value, path)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and key.endswith(tuple(METRIC_NOISE)):
+            yield path, value
+
+
+def compare_with_baseline(results, baseline, threshold):
+    previous = dict(flatten_metrics(baseline))
+    changes = []
+    regressions = []
+    for path, value in flatten_metrics(results):
+        old = previous.get(path)
+        if not old:
+            continue
+        change = {'metric': path, 'baseline': old, 'current': value, 'ratio': round(value / old, 3)}
+        changes.append(change)
+        noise = next(limit for suffix, limit in METRIC_NOISE.items() if path.endswith(suffix))
+        if value > old * (1 + threshold) and value - old > noise:
+            regressions.append(change)
+    return {'threshold': threshold, 'changes': changes, 'regressions': regressions}
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="Бенчмарки персонального помощника. Результат - JSON в stdout.")
+    parser.add_argument('names', nargs='*', help=f"бенчмарки: {', '.join(BENCHMARKS)} (по умолчанию все)")
+    parser.add_argument('--scales', default=DEFAULT_SCALES,
+                        help=f"объёмы данных через запятую из {', '.join(SCALES)} (по умолчанию {DEFAULT_SCALES})")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--runs', type=int, default=5, help="число запусков для замера старта")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="файл с базовыми результатами для сравнения")
+    parser.add_argument('--save-baseline', action='store_true', help="сохранить результаты как базовые")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="допустимое относительное замедление")
+    parser.add_argument('--prepare', nargs=2, metavar=('NAME', 'COUNT'), help=argparse.SUPPRESS)
+    parser.add_argument('--worker', nargs=2, metavar=('NAME', 'COUNT'), help=argparse.SUPPRESS)
+    options = parser.parse_args(argv)
+    options.scales = [scale.strip().lower() for scale in options.scales.split(',') if scale.strip()]
+    return options
+
+
+def main(argv):
+    options = parse_arguments(argv)
+    if options.prepare:
+        prepare_dataset(options.prepare[0], int(options.prepare[1]), options.seed)
+        return 0
+    if options.worker:
+        print(json.dumps(run_worker(options.worker[0], int(options.worker[1]), options.seed)))
+        return 0
+
+    names = options.names or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        print(f"Неизвестные бенчмарки: {', '.join(unknown)}. Доступны: {', '.join(BENCHMARKS)}", file=sys.stderr)
+        return 2
+    unknown = [scale for scale in options.scales if scale not in SCALES]
+    if unknown:
+        print(f"Неизвестные объёмы: {', '.join(unknown)}. Доступны: {', '.join(SCALES)}", file=sys.stderr)
+        return 2
+
+    report = {'environment': environment(options), 'results': {name: BENCHMARKS[name](options) for name in names}}
+    exit_code = 0
+    if options.save_baseline:
+        with open(options.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
+    elif os.path.exists(options.baseline):
+        with open(options.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        report['comparison'] = compare_with_baseline(report['results'], baseline['results'], options.threshold)
+        report['comparison']['baseline'] = options.baseline
+        if report['comparison']['regressions']:
+            exit_code = 1
+    print(json.dumps(report, ensure_ascii=False, indent=4))
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -1,35 +1,1414 @@
 import os
+import sys
 import json
+import re
+import sqlite3
 import csv
+import time
 import datetime
-import pandas as pd
+import itertools
+import decimal
+import bisect
+import math
+import zlib
+import gzip
+import threading
+import atexit
+import importlib.util
+import ast
+import operator
+import functools
+import argparse
+import contextlib
+import shlex
+import stat
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# pandas и numpy импортируются внутри функций при первом использовании, а не при запуске программы.
+# Без pandas импорт CSV идёт построчно через csv, без numpy отчёты за период считаются циклом.
+PANDAS_AVAILABLE = importlib.util.find_spec('pandas') is not None
+NUMPY_AVAILABLE = importlib.util.find_spec('numpy') is not None
 
 
 NOTES_FILE = 'notes.json'
 TASKS_FILE = 'tasks.json'
 CONTACTS_FILE = 'contacts.json'
 FINANCE_FILE = 'finance.json'
+SQLITE_FILE = 'assistant.db'
+
+
+STORAGE_BACKEND = os.environ.get('PA_STORAGE', 'journal')
+JOURNAL_SUFFIX = '.journal'
+JOURNAL_COMPACT_THRESHOLD = 1000
+LAZY_LOAD = os.environ.get('PA_LAZY_LOAD', '1') != '0'
+SNAPSHOT_HEAD_SIZE = 4096
+SEARCH_INDEX_SUFFIX = '.index'
+BACKUP_SUFFIX = '.bak'
+CORRUPT_SUFFIX = '.corrupt'
+SNAPSHOT_ITEMS_KEY = b'"items":'
+SERIALIZE_CHUNK_SIZE = 10000
+CSV_IMPORT_CHUNK_SIZE = 50000
+CHECKPOINT_SUFFIX = '.checkpoint'
+LOCK_SUFFIX = '.lock'
+WRITE_BEHIND = os.environ.get('PA_WRITE_BEHIND', '1') != '0'
+WRITE_BEHIND_DELAY = 1.0
+WRITE_BEHIND_MAX_PENDING = 1000
+CALC_MAX_LENGTH = 1000
+CALC_MAX_NODES = 300
+CALC_MAX_INT_BITS = 4096
+CALC_CACHE_SIZE = 256
+QUERY_CACHE_SIZE = 128
+# Адрес сервера: путь к Unix-сокету или хост:порт; пустая строка - не обращаться к серверу
+DAEMON_ADDRESS = os.environ.get('PA_DAEMON', 'assistant.sock')
+DAEMON_FLUSH_INTERVAL = 5.0
+DAEMON_MAX_REQUEST = 1 << 20
+# PA_PROFILE=1 включает сбор задержек операций и объёма ввода-вывода (команда stats);
+# PA_PROFILE_DUMP - файл для метрик в формате Prometheus при выходе, PA_CPROFILE - файл профиля cProfile
+PROFILING = os.environ.get('PA_PROFILE', '0') not in ('', '0')
+PROFILE_DUMP_FILE = os.environ.get('PA_PROFILE_DUMP')
+CPROFILE_FILE = os.environ.get('PA_CPROFILE')
+# Границы корзин гистограммы задержек: от 1 мкс до ~2 минут, каждая вдвое больше предыдущей
+LATENCY_BUCKETS = tuple(1e-6 * 2 ** power for power in range(28))
+
+
+class LatencyHistogram:
+    # Счётчики по корзинам LATENCY_BUCKETS (верхние границы, в секундах); перцентили оцениваются
+    # интерполяцией внутри корзины, так что память не зависит от числа вызовов
+    __slots__ = ('buckets', 'count', 'total', 'max')
 
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction):
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            if count and seen + count >= rank:
+                lower = LATENCY_BUCKETS[index - 1] if index else 0.0
+                upper = LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / count, self.max)
+            seen += count
+        return self.max
+
+
+class Metrics:
+    # Задержки операций и объём чтения/записи по файлам за время работы процесса
+    def __init__(self):
+        self.latencies = {}
+        self.files = {}
+        self.caches = {}
+        self.lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self.latencies.get(name)
+            if histogram is None:
+                histogram = self.latencies[name] = LatencyHistogram()
+            histogram.add(seconds)
+
+    def add_bytes(self, file_path, direction, size):
+        with self.lock:
+            counters = self.files.setdefault(file_path, {'read': 0, 'written': 0})
+            counters[direction] += size
+
+    def register_cache(self, cache):
+        # Попадания считает сам кэш и без PA_PROFILE. Кэш менеджера, открытого заново (например, после
+        # перечитывания файла), продолжает счёт прежнего
+        with self.lock:
+            previous = self.caches.get(cache.name)
+            if previous is not None:
+                cache.hits, cache.misses = previous.hits, previous.misses
+            self.caches[cache.name] = cache
+
+    def snapshot(self):
+        with self.lock:
+            operations = {name: {'count': histogram.count,
+                                 'total_s': round(histogram.total, 6),
+                                 'p50_ms': round(histogram.percentile(0.5) * 1000, 3),
+                                 'p95_ms': round(histogram.percentile(0.95) * 1000, 3),
+                                 'p99_ms': round(histogram.percentile(0.99) * 1000, 3),
+                                 'max_ms': round(histogram.max * 1000, 3)}
+                          for name, histogram in sorted(self.latencies.items())}
+            files = {file_path: dict(counters) for file_path, counters in sorted(self.files.items())}
+            caches = {name: cache.counters() for name, cache in sorted(self.caches.items())}
+        return {'enabled': PROFILING, 'operations': operations, 'files': files, 'caches': caches}
+
+    def prometheus(self):
+        # Текстовый формат экспозиции Prometheus
+        lines = ["# HELP pa_operation_seconds Длительность операций персонального помощника.",
+                 "# TYPE pa_operation_seconds histogram"]
+        with self.lock:
+            for name, histogram in sorted(self.latencies.items()):
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, histogram.buckets):
+                    cumulative += count
+                    lines.append(f'pa_operation_seconds_bucket{{operation="{name}",le="{bound:g}"}} {cumulative}')
+                lines.append(f'pa_operation_seconds_bucket{{operation="{name}",le="+Inf"}} {histogram.count}')
+                lines.append(f'pa_operation_seconds_sum{{operation="{name}"}} {histogram.total!r}')
+                lines.append(f'pa_operation_seconds_count{{operation="{name}"}} {histogram.count}')
+            lines += ["# HELP pa_file_bytes_total Байты, прочитанные из файлов данных и записанные в них.",
+                      "# TYPE pa_file_bytes_total counter"]
+            for file_path, counters in sorted(self.files.items()):
+                for direction, size in counters.items():
+                    lines.append(f'pa_file_bytes_total{{file="{file_path}",direction="{direction}"}} {size}')
+            lines += ["# HELP pa_cache_requests_total Обращения к кэшам результатов запросов.",
+                      "# TYPE pa_cache_requests_total counter"]
+            for name, counters in sorted((name, cache.counters()) for name, cache in self.caches.items()):
+                lines.append(f'pa_cache_requests_total{{cache="{name}",result="hit"}} {counters["hits"]}')
+                lines.append(f'pa_cache_requests_total{{cache="{name}",result="miss"}} {counters["misses"]}')
+        return '\n'.join(lines) + '\n'
+
+    def dump_prometheus(self, file_path):
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus())
+
+
+METRICS = Metrics()
+if PROFILING and PROFILE_DUMP_FILE:
+    atexit.register(METRICS.dump_prometheus, PROFILE_DUMP_FILE)
+
+
+def timed(name):
+    # Без PA_PROFILE декоратор возвращает функцию как есть, и выключенный профиль ничего не стоит
+    def decorate(function):
+        if not PROFILING:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                METRICS.observe(name, time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+
+def start_cprofile(file_path):
+    # Профиль cProfile всего запуска (основного потока) сохраняется при выходе; смотреть через pstats
+    import cProfile
+    profiler = cProfile.Profile()
+
+    def save():
+        profiler.disable()
+        profiler.dump_stats(file_path)
+    atexit.register(save)
+    profiler.enable()
+
+
+def encode_json(obj):
+    # Файлы данных пишутся без отступов; orjson, если установлен, кодирует в разы быстрее json
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def decode_json(content):
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+@timed('storage.serialize')
+def encode_items(records, chunk_size=SERIALIZE_CHUNK_SIZE):
+    # Записи кодируются пачками, поэтому словари всей коллекции не держатся в памяти одновременно
+    records = iter(records)
+    parts = []
+    count = 0
+    for chunk in iter(lambda: list(itertools.islice(records, chunk_size)), []):
+        parts.append(encode_json(chunk)[1:-1])
+        count += len(chunk)
+    return b'[' + b','.join(parts) + b']', count
+
+
+def fsync_directory(file_path):
+    # После переименования синхронизируем каталог, иначе сама подмена файла может не пережить сбой питания
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(os.path.dirname(os.path.abspath(file_path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def apply_change(items, op, record_id, record):
+    # Правка записи, которую уже удалили (например, в другом процессе), её не воскрешает
+    if op == 'delete':
+        items.pop(record_id, None)
+    elif op == 'add' or record_id in items:
+        items[record_id] = record
 
-def save_data(file_path, data):
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
 
+def merge_meta(meta, disk_meta):
+    merged = dict(disk_meta or {}, **(meta or {}))
+    merged['next_id'] = max((meta or {}).get('next_id', 1), (disk_meta or {}).get('next_id', 1))
+    return merged
 
-def load_data(file_path, default_data):
-    if not os.path.exists(file_path):
-        save_data(file_path, default_data)
-        return default_data
-    with open(file_path, 'r', encoding='utf-8') as f:
+
+class JsonStorage:
+    # Вся коллекция хранится одним JSON-документом и переписывается целиком при каждом изменении.
+    # Служебные данные (например, счётчик ID) лежат в том же файле: {"meta": {...}, "items": [...]}
+    #
+    # С одними файлами могут работать несколько процессов. Чтение и запись идут под блокировкой
+    # fcntl.flock на файле .lock рядом с данными, а в нём хранится штамп {"version", "next_id"}:
+    # версия растёт при каждой записи, а ID выдаются из общего счётчика и не совпадают между процессами.
+    # Если версия на диске не та, что процесс видел последней, файл изменил кто-то другой - тогда
+    # на его версию накладываются только свои изменённые записи, а не вся коллекция из памяти.
+    journaled = False
+    indexed = False
+
+    def __init__(self):
+        self.stamps = {}
+        self.versions = {}
+        # Файлы, где в памяти нет чужих изменений: полный снимок из памяти их бы затёр
+        self.diverged = set()
+
+    @contextlib.contextmanager
+    def locked(self, file_path):
+        # Повторный захват в том же процессе не нужен: flock на втором дескрипторе ждал бы сам себя.
+        # Вызовы хранилища внутри процесса уже упорядочены STORAGE_LOCK
+        if file_path in self.stamps:
+            yield self.stamps[file_path]
+            return
+        fd = os.open(file_path + LOCK_SUFFIX, os.O_RDWR | os.O_CREAT, 0o644)
         try:
-            return json.load(f)
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            stamp = self.read_stamp(fd)
+            original = dict(stamp)
+            self.stamps[file_path] = stamp
+            try:
+                yield stamp
+            finally:
+                del self.stamps[file_path]
+                if stamp != original:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    os.ftruncate(fd, 0)
+                    os.write(fd, encode_json(stamp))
+        finally:
+            # Закрытие дескриптора снимает блокировку
+            os.close(fd)
+
+    def read_stamp(self, fd):
+        content = b''
+        while True:
+            chunk = os.read(fd, 4096)
+            if not chunk:
+                break
+            content += chunk
+        try:
+            stamp = decode_json(content)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            stamp = None
+        # Пустой или испорченный штамп начинается заново: несовпадение версий приведёт лишь к слиянию
+        if not isinstance(stamp, dict):
+            stamp = {}
+        return {'version': stamp.get('version', 0), 'next_id': stamp.get('next_id', 1)}
+
+    def is_current(self, file_path, stamp):
+        return file_path not in self.diverged and self.versions.get(file_path) == stamp['version']
+
+    def seen(self, file_path, stamp):
+        # Память процесса совпадает с версией на диске (файл только что прочитан целиком)
+        self.versions[file_path] = stamp['version']
+        self.diverged.discard(file_path)
+
+    def stamp_write(self, file_path, stamp, meta):
+        stamp['version'] += 1
+        stamp['next_id'] = max(stamp['next_id'], (meta or {}).get('next_id', 1))
+        self.versions[file_path] = stamp['version']
+
+    def changed_elsewhere(self, file_path):
+        # Версия в штампе сменилась не нашей записью, или наши записи уже сливались с чужими
+        with self.locked(file_path) as stamp:
+            return not self.is_current(file_path, stamp)
+
+    def reserve_ids(self, file_path, count, next_id):
+        with self.locked(file_path) as stamp:
+            first_id = max(stamp['next_id'], next_id)
+            stamp['next_id'] = first_id + count
+            return first_id
+
+    @timed('storage.write_snapshot')
+    def write_snapshot(self, file_path, data, meta=None):
+        # Записи сериализуются отдельно, чтобы посчитать их контрольную сумму и положить её в meta
+        items, count = encode_items(data)
+        meta = dict(meta or {}, checksum=zlib.crc32(items))
+        content = b'{"meta":' + encode_json(meta) + b',' + SNAPSHOT_ITEMS_KEY + items + b'}\n'
+        # Новое поколение пишется во временный файл и подменяет снимок только после fsync,
+        # а предыдущее поколение остаётся в .bak для восстановления
+        temp_path = file_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        if PROFILING:
+            METRICS.add_bytes(file_path, 'written', len(content))
+        if os.path.exists(file_path):
+            os.replace(file_path, file_path + BACKUP_SUFFIX)
+        os.replace(temp_path, file_path)
+        fsync_directory(file_path)
+        return count
+
+    @timed('storage.parse_snapshot')
+    def parse_snapshot(self, file_path):
+        # None - файла нет, он оборван или не сходится контрольная сумма
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, 'rb') as f:
+            content = f.read()
+        if PROFILING:
+            METRICS.add_bytes(file_path, 'read', len(content))
+        try:
+            document = decode_json(content)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return None
+        # Старый формат файла: просто список записей
+        if isinstance(document, list):
+            return document, {}
+        if not isinstance(document, dict) or 'items' not in document:
+            return None
+        meta = dict(document.get('meta') or {})
+        checksum = meta.pop('checksum', None)
+        if checksum is not None:
+            # Сумма считается по тексту списка записей между ключом "items" и закрывающей скобкой документа
+            start = content.find(SNAPSHOT_ITEMS_KEY)
+            end = content.rfind(b'}')
+            if start < 0:
+                return None
+            items = content[start + len(SNAPSHOT_ITEMS_KEY):end].strip()
+            if zlib.crc32(items) != checksum:
+                return None
+        return document['items'], meta
+
+    def read_snapshot(self, file_path, default_data):
+        snapshot = self.parse_snapshot(file_path)
+        if snapshot is not None:
+            return snapshot
+        backup_path = file_path + BACKUP_SUFFIX
+        if not os.path.exists(backup_path) and (not os.path.exists(file_path) or os.path.getsize(file_path) == 0):
+            # Новый или пустой файл без резервной копии - просто начинаем с данных по умолчанию
+            self.write_snapshot(file_path, default_data)
+            return default_data, {}
+
+        # Повреждённый снимок откладываем в сторону и восстанавливаем последнее целое поколение
+        if os.path.exists(file_path):
+            os.replace(file_path, file_path + CORRUPT_SUFFIX)
+        recovered = self.recover_snapshot(file_path)
+        if recovered is None:
+            print(f"Файл {file_path} поврежден, резервной копии нет. Начинаем с пустых данных, "
+                  f"повреждённый файл сохранён как {file_path + CORRUPT_SUFFIX}.")
+            data, meta = default_data, {}
+        else:
+            print(f"Файл {file_path} поврежден. Данные восстановлены из предыдущей версии.")
+            data, meta = recovered
+        # Основного снимка уже нет, поэтому запись не вытесняет целую резервную копию
+        self.write_snapshot(file_path, data, meta)
+        return data, meta
+
+    def recover_snapshot(self, file_path):
+        return self.parse_snapshot(file_path + BACKUP_SUFFIX)
+
+    def read_snapshot_meta(self, file_path):
+        # Читаем только начало файла: meta записывается перед списком записей.
+        # None - meta из заголовка не получить (старый формат), нужен полный разбор файла.
+        if not os.path.exists(file_path):
+            return {}
+        with open(file_path, 'r', encoding='utf-8') as f:
+            head = f.read(SNAPSHOT_HEAD_SIZE)
+        match = re.match(r'\s*\{\s*"meta"\s*:\s*', head)
+        if not match:
+            return None
+        try:
+            meta, _ = json.JSONDecoder().raw_decode(head, match.end())
         except json.JSONDecodeError:
-            print(f"Файл {file_path} поврежден или пуст. Восстанавливаем данные по умолчанию.")
-            save_data(file_path, default_data)
-            return default_data
+            return None
+        meta.pop('checksum', None)
+        return meta
+
+    def load_meta(self, file_path, key_field=None):
+        with self.locked(file_path) as stamp:
+            meta = self.read_snapshot_meta(file_path)
+            self.seen(file_path, stamp)
+            return meta
+
+    def load(self, file_path, default_data, key_field=None):
+        with self.locked(file_path) as stamp:
+            data, meta = self.read_snapshot(file_path, default_data)
+            self.seen(file_path, stamp)
+            return data, meta
+
+    def read_current(self, file_path, key_field):
+        return self.read_snapshot(file_path, [])
+
+    def save(self, file_path, data, meta=None):
+        # Полная запись: переданные данные и есть новое состояние файла
+        with self.locked(file_path) as stamp:
+            self.write_snapshot(file_path, data, meta)
+            self.stamp_write(file_path, stamp, meta)
+            self.diverged.discard(file_path)
+
+    def save_changes(self, file_path, key_field, changes, get_data, meta=None):
+        with self.locked(file_path) as stamp:
+            if self.is_current(file_path, stamp):
+                data = get_data()
+            else:
+                data, disk_meta = self.read_current(file_path, key_field)
+                items = {item[key_field]: item for item in data}
+                for op, record in changes:
+                    apply_change(items, op, record[key_field], record)
+                data, meta = list(items.values()), merge_meta(meta, disk_meta)
+                self.diverged.add(file_path)
+            self.write_snapshot(file_path, data, meta)
+            self.stamp_write(file_path, stamp, meta)
+
+    def append(self, file_path, op, key_field, records, get_data, meta=None):
+        self.save_changes(file_path, key_field, [(op, record) for record in records], get_data, meta)
+
+
+class JournalStorage(JsonStorage):
+    # Снимок в JSON-файле плюс журнал операций add/edit/delete (JSON Lines) рядом с ним.
+    # Каждое изменение дописывает в журнал одну строку, а журнал периодически сворачивается в снимок.
+    journaled = True
+
+    def __init__(self, compact_threshold=JOURNAL_COMPACT_THRESHOLD):
+        super().__init__()
+        self.compact_threshold = compact_threshold
+        self.journal_sizes = {}
+        self.snapshot_sizes = {}
+
+    def needs_compaction(self, file_path, journal_size):
+        # Журнал сворачивается, когда он не меньше порога и самого снимка: при массовом импорте
+        # снимок переписывается всё реже, и суммарная стоимость сжатий остаётся линейной
+        return journal_size >= max(self.compact_threshold, self.snapshot_sizes.get(file_path, 0))
+
+    def journal_path(self, file_path):
+        return file_path + JOURNAL_SUFFIX
+
+    @timed('storage.read_journal')
+    def read_journal(self, file_path, journal_path=None):
+        journal_path = journal_path or self.journal_path(file_path)
+        if not os.path.exists(journal_path):
+            return []
+        entries = []
+        valid_size = 0
+        with open(journal_path, 'rb+') as f:
+            for line in f:
+                try:
+                    if line.strip():
+                        entries.append(decode_json(line))
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    # Оборванная при сбое последняя строка: отрезаем её, чтобы новые записи не склеились с ней
+                    print(f"Журнал {journal_path} оборван, последние изменения пропущены.")
+                    f.truncate(valid_size)
+                    break
+                valid_size += len(line)
+        if PROFILING:
+            METRICS.add_bytes(journal_path, 'read', valid_size)
+        return entries
+
+    def count_journal(self, file_path):
+        # Число операций в журнале без разбора JSON: оно нужно только для решения о сжатии
+        journal_path = self.journal_path(file_path)
+        if not os.path.exists(journal_path):
+            return 0
+        with open(journal_path, 'rb') as f:
+            return sum(chunk.count(b'\n') for chunk in iter(functools.partial(f.read, 1 << 20), b''))
+
+    def load_meta(self, file_path, key_field=None):
+        # Журнал сворачивается лишь когда дорастает до размера снимка, поэтому счётчик ID берётся
+        # из штампа, а не из операций журнала
+        with self.locked(file_path) as stamp:
+            meta = self.read_snapshot_meta(file_path)
+            if meta is None:
+                return None
+            next_id = max(meta.get('next_id', 1), stamp['next_id'])
+            if stamp['version'] == 0:
+                # Файлы прежних версий без штампа: ID добавленных записей есть только в журнале
+                for entry in self.read_journal(file_path):
+                    next_id = max(next_id, entry['id'] + 1)
+            self.seen(file_path, stamp)
+        return dict(meta, next_id=next_id)
+
+    def load(self, file_path, default_data, key_field=None):
+        with self.locked(file_path) as stamp:
+            data, meta = self.read_snapshot(file_path, default_data)
+            self.snapshot_sizes[file_path] = len(data)
+            entries = self.read_journal(file_path)
+            if entries:
+                data, meta = self.replay_journal(data, meta, entries, key_field)
+                if self.needs_compaction(file_path, len(entries)):
+                    self.compact(file_path, data, meta, stamp)
+                else:
+                    self.journal_sizes[file_path] = len(entries)
+            else:
+                self.journal_sizes[file_path] = 0
+            self.seen(file_path, stamp)
+        return data, meta
+
+    def read_current(self, file_path, key_field):
+        data, meta = self.read_snapshot(file_path, [])
+        entries = self.read_journal(file_path)
+        if not entries:
+            return data, meta
+        return self.replay_journal(data, meta, entries, key_field)
+
+    @timed('storage.replay_journal')
+    def replay_journal(self, data, meta, entries, key_field=None):
+        key_field = key_field or entries[0]['key']
+        items = {item[key_field]: item for item in data}
+        next_id = meta.get('next_id', 1)
+        for entry in entries:
+            apply_change(items, entry['op'], entry['id'], entry.get('record'))
+            # Удалённый ID тоже занят: отложенная запись может свернуть add и delete в один delete
+            next_id = max(next_id, entry['id'] + 1)
+        return list(items.values()), dict(meta, next_id=next_id)
+
+    def recover_snapshot(self, file_path):
+        # Предыдущее поколение снимка плюс журнал, который был свёрнут в повреждённый снимок
+        recovered = self.parse_snapshot(file_path + BACKUP_SUFFIX)
+        if recovered is None:
+            return None
+        entries = self.read_journal(file_path, self.journal_path(file_path) + BACKUP_SUFFIX)
+        if not entries:
+            return recovered
+        return self.replay_journal(*recovered, entries)
+
+    def save(self, file_path, data, meta=None):
+        with self.locked(file_path) as stamp:
+            self.compact(file_path, data, meta, stamp)
+            self.diverged.discard(file_path)
+
+    def compact(self, file_path, data, meta, stamp):
+        # Сначала пишем снимок, потом убираем журнал: повторное применение операций к новому снимку безвредно.
+        # Свёрнутый журнал хранится рядом с предыдущим снимком, вместе они дают то же поколение данных.
+        self.snapshot_sizes[file_path] = self.write_snapshot(file_path, data, meta)
+        journal_path = self.journal_path(file_path)
+        if os.path.exists(journal_path):
+            os.replace(journal_path, journal_path + BACKUP_SUFFIX)
+        elif os.path.exists(journal_path + BACKUP_SUFFIX):
+            os.remove(journal_path + BACKUP_SUFFIX)
+        self.journal_sizes[file_path] = 0
+        self.stamp_write(file_path, stamp, meta)
+
+    @timed('storage.journal_append')
+    def append(self, file_path, op, key_field, records, get_data, meta=None):
+        # Операции над записями дописываются в журнал как есть, поэтому чужие изменения в нём не теряются.
+        # Счётчик ID в журнал не пишется: при воспроизведении он восстанавливается по операциям add
+        with self.locked(file_path) as stamp:
+            if not self.is_current(file_path, stamp):
+                self.diverged.add(file_path)
+            if file_path not in self.journal_sizes:
+                self.journal_sizes[file_path] = self.count_journal(file_path)
+            written = 0
+            with open(self.journal_path(file_path), 'ab') as f:
+                for record in records:
+                    entry = {'op': op, 'key': key_field, 'id': record[key_field]}
+                    if op != 'delete':
+                        entry['record'] = record
+                    written += f.write(encode_json(entry) + b'\n')
+                f.flush()
+                os.fsync(f.fileno())
+            if PROFILING:
+                METRICS.add_bytes(self.journal_path(file_path), 'written', written)
+            self.stamp_write(file_path, stamp, meta)
+
+            size = self.journal_sizes[file_path] + len(records)
+            self.journal_sizes[file_path] = size
+            # Без get_data (фоновая запись) сжатие откладывается до следующей записи из основного потока
+            if get_data is None or not self.needs_compaction(file_path, size):
+                return
+            if file_path in self.diverged:
+                # В памяти нет чужих изменений: снимок собирается из файла и журнала
+                data, disk_meta = self.read_current(file_path, key_field)
+                self.compact(file_path, data, merge_meta(meta, disk_meta), stamp)
+            else:
+                data = list(get_data())
+                # Ленивая коллекция дочитывает файл внутри get_data, и эта загрузка могла уже свернуть журнал:
+                # второе сжатие затёрло бы предыдущее поколение снимка в .bak
+                if self.journal_sizes[file_path]:
+                    self.compact(file_path, data, meta, stamp)
+
+
+# Таблица SQLite для каждого файла данных: ключ, обычные колонки, вычисляемые колонки для индексов
+# и преобразования значений при чтении
+SQLITE_TABLES = {
+    NOTES_FILE: {
+        'table': 'notes',
+        'key': 'note_id',
+        'columns': ('title', 'content', 'timestamp'),
+        'derived': {},
+        'readers': {},
+    },
+    TASKS_FILE: {
+        'table': 'tasks',
+        'key': 'task_id',
+        'columns': ('title', 'description', 'done', 'priority', 'due_date'),
+        'derived': {'due_ordinal': lambda task: parse_date(task['due_date']),
+                    'priority_rank': lambda task: task_priority_rank(task['priority'])},
+        'readers': {'done': bool},
+    },
+    CONTACTS_FILE: {
+        'table': 'contacts',
+        'key': 'contact_id',
+        'columns': ('name', 'phone', 'email'),
+        'derived': {'name_key': lambda contact: ContactIndex.name_key(contact['name']),
+                    'phone_key': lambda contact: normalize_phone(contact['phone'])},
+        'readers': {},
+    },
+    FINANCE_FILE: {
+        'table': 'finance',
+        'key': 'record_id',
+        'columns': ('amount', 'category', 'date', 'description'),
+        'derived': {'date_ordinal': lambda record: parse_date(record['date']),
+                    'category_key': lambda record: (record['category'] or '').lower()},
+        'readers': {},
+    },
+}
+
+SQLITE_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS tasks_due ON tasks (done, due_ordinal)",
+    "CREATE INDEX IF NOT EXISTS tasks_priority ON tasks (done, priority_rank, due_ordinal)",
+    "CREATE INDEX IF NOT EXISTS contacts_phone ON contacts (phone_key)",
+    "CREATE INDEX IF NOT EXISTS contacts_name ON contacts (name_key)",
+    "CREATE INDEX IF NOT EXISTS finance_date ON finance (date_ordinal)",
+    "CREATE INDEX IF NOT EXISTS finance_category ON finance (category_key, date_ordinal)",
+)
+
+
+class SqliteStorage:
+    # Все коллекции в одной базе SQLite (режим WAL). Каждое изменение - одна транзакция над
+    # затронутыми строками, а поиск и фильтры менеджеры выполняют индексированными запросами.
+    journaled = True
+    indexed = True
+
+    def __init__(self, db_path=SQLITE_FILE):
+        self.db_path = db_path
+        # Соединение SQLite нельзя использовать из другого потока, поэтому у фоновой записи своё
+        self.local = threading.local()
+
+    def connect(self):
+        if getattr(self.local, 'connection', None) is None:
+            connection = sqlite3.connect(self.db_path)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=FULL")
+            with connection:
+                for schema in SQLITE_TABLES.values():
+                    # Колонки без объявленного типа сохраняют int/float такими, какими их записали
+                    columns = ', '.join(list(schema['columns']) + list(schema['derived']))
+                    connection.execute(f"CREATE TABLE IF NOT EXISTS {schema['table']} "
+                                       f"({schema['key']} INTEGER PRIMARY KEY, {columns})")
+                connection.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, next_id INTEGER)")
+                for statement in SQLITE_INDEXES:
+                    connection.execute(statement)
+            self.local.connection = connection
+        return self.local.connection
+
+    def row_values(self, schema, record):
+        return ([record[schema['key']]] + [record.get(column) for column in schema['columns']]
+                + [derive(record) for derive in schema['derived'].values()])
+
+    def row_to_record(self, schema, row):
+        record = {schema['key']: row[schema['key']]}
+        for column in schema['columns']:
+            reader = schema['readers'].get(column)
+            record[column] = reader(row[column]) if reader and row[column] is not None else row[column]
+        return record
+
+    def query(self, file_path, where='', params=(), order_by=None):
+        schema = SQLITE_TABLES[file_path]
+        sql = f"SELECT * FROM {schema['table']}"
+        if where:
+            sql += f" WHERE {where}"
+        sql += f" ORDER BY {order_by or schema['key']}"
+        for row in self.connect().execute(sql, params):
+            yield self.row_to_record(schema, row)
+
+    def execute(self, sql, params=()):
+        return self.connect().execute(sql, params).fetchall()
+
+    def read_meta(self, file_path):
+        row = self.connect().execute("SELECT next_id FROM meta WHERE name = ?",
+                                     (SQLITE_TABLES[file_path]['table'],)).fetchone()
+        return {'next_id': row['next_id']} if row else {}
+
+    def write_meta(self, connection, file_path, meta):
+        if meta:
+            connection.execute("INSERT INTO meta (name, next_id) VALUES (?, ?) "
+                               "ON CONFLICT (name) DO UPDATE SET next_id = MAX(next_id, excluded.next_id)",
+                               (SQLITE_TABLES[file_path]['table'], meta['next_id']))
+
+    @timed('storage.sqlite_load')
+    def load(self, file_path, default_data, key_field=None):
+        return list(self.query(file_path)), self.read_meta(file_path)
+
+    def changed_elsewhere(self, file_path):
+        # Записи SQLite читаются запросами и всегда актуальны
+        return False
+
+    def reserve_ids(self, file_path, count, next_id):
+        # Счётчик ID общий для всех процессов: BEGIN IMMEDIATE сразу берёт блокировку записи базы
+        connection = self.connect()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            first_id = max(self.read_meta(file_path).get('next_id', 1), next_id)
+            self.write_meta(connection, file_path, {'next_id': first_id + count})
+        return first_id
+
+    @timed('storage.sqlite_save')
+    def save(self, file_path, data, meta=None):
+        schema = SQLITE_TABLES[file_path]
+        placeholders = ', '.join('?' * (1 + len(schema['columns']) + len(schema['derived'])))
+        # Данные могут читаться из этой же таблицы, поэтому строки собираются до очистки
+        rows = [self.row_values(schema, record) for record in data]
+        connection = self.connect()
+        with connection:
+            connection.execute(f"DELETE FROM {schema['table']}")
+            connection.executemany(f"INSERT INTO {schema['table']} VALUES ({placeholders})", rows)
+            self.write_meta(connection, file_path, meta)
+
+    @timed('storage.sqlite_append')
+    def append(self, file_path, op, key_field, records, get_data, meta=None):
+        schema = SQLITE_TABLES[file_path]
+        connection = self.connect()
+        with connection:
+            if op == 'delete':
+                connection.executemany(f"DELETE FROM {schema['table']} WHERE {schema['key']} = ?",
+                                       ((record[schema['key']],) for record in records))
+            else:
+                placeholders = ', '.join('?' * (1 + len(schema['columns']) + len(schema['derived'])))
+                connection.executemany(f"INSERT OR REPLACE INTO {schema['table']} VALUES ({placeholders})",
+                                       (self.row_values(schema, record) for record in records))
+            self.write_meta(connection, file_path, meta)
+
+
+STORAGE_BACKENDS = {
+    'json': JsonStorage,
+    'journal': JournalStorage,
+    'sqlite': SqliteStorage,
+}
+
+STORAGE = STORAGE_BACKENDS[STORAGE_BACKEND]()
+# Весь ввод-вывод хранилища идёт под этой блокировкой: фоновая запись не пересекается с чтением
+STORAGE_LOCK = threading.RLock()
+
+
+class WriteBehindQueue:
+    # Отложенная запись: изменения копятся по файлам (последняя операция над каждым ID) и
+    # записываются одной пачкой по таймеру, при переполнении очереди, на выходе из меню и при завершении.
+    def __init__(self, storage, delay=WRITE_BEHIND_DELAY, max_pending=WRITE_BEHIND_MAX_PENDING):
+        self.storage = storage
+        self.delay = delay
+        self.max_pending = max_pending
+        self.pending = {}
+        self.timer = None
+        self.last_change = 0
+
+    def append(self, file_path, op, key_field, records, get_data, meta=None):
+        with STORAGE_LOCK:
+            entry = self.pending.setdefault(file_path, {'ops': {}})
+            entry.update(key_field=key_field, get_data=get_data, meta=meta)
+            ops = entry['ops']
+            for record in records:
+                record_id = record[key_field]
+                # Правка ещё не записанной записи остаётся добавлением
+                if op == 'edit' and ops.get(record_id, ('',))[0] == 'add':
+                    ops[record_id] = ('add', record)
+                else:
+                    ops[record_id] = (op, record)
+            self.last_change = time.monotonic()
+            if sum(len(entry['ops']) for entry in self.pending.values()) >= self.max_pending:
+                self.flush()
+            elif self.storage.journaled and self.timer is None:
+                # Полный снимок собирается из данных менеджера, поэтому в фоне пишется только журнал
+                self.schedule(self.delay)
+
+    def schedule(self, delay):
+        self.timer = threading.Timer(delay, self.on_timer)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def on_timer(self):
+        with STORAGE_LOCK:
+            self.timer = None
+            if not self.pending:
+                return
+            # Пока изменения продолжаются, запись откладывается
+            quiet = time.monotonic() - self.last_change
+            if quiet < self.delay:
+                self.schedule(self.delay - quiet)
+            else:
+                self.flush(background=True)
+
+    def pending_change(self, file_path, record_id):
+        with STORAGE_LOCK:
+            entry = self.pending.get(file_path)
+            return entry['ops'].get(record_id) if entry else None
+
+    def discard(self, file_path):
+        with STORAGE_LOCK:
+            self.pending.pop(file_path, None)
+
+    @timed('write_behind.flush')
+    def flush(self, file_path=None, background=False):
+        with STORAGE_LOCK:
+            paths = [file_path] if file_path is not None else list(self.pending)
+            for path in paths:
+                entry = self.pending.pop(path, None)
+                if entry is None:
+                    continue
+                try:
+                    self.write(path, entry, background)
+                except (OSError, sqlite3.Error) as e:
+                    print(f"Ошибка записи {path}: {e}. Изменения будут записаны позже.")
+                    self.requeue(path, entry)
+
+    def write(self, file_path, entry, background):
+        if not self.storage.journaled:
+            self.storage.save_changes(file_path, entry['key_field'], list(entry['ops'].values()),
+                                      entry['get_data'], entry['meta'])
+            return
+        groups = {}
+        for op, record in entry['ops'].values():
+            groups.setdefault(op, []).append(record)
+        get_data = None if background else entry['get_data']
+        for op, records in groups.items():
+            self.storage.append(file_path, op, entry['key_field'], records, get_data, entry['meta'])
+
+    def requeue(self, file_path, entry):
+        current = self.pending.get(file_path)
+        if current is None:
+            self.pending[file_path] = entry
+        else:
+            for record_id, change in entry['ops'].items():
+                current['ops'].setdefault(record_id, change)
+
+
+WRITE_QUEUE = WriteBehindQueue(STORAGE)
+
+
+def file_signature(*paths):
+    signature = []
+    for path in paths:
+        if os.path.exists(path):
+            st = os.stat(path)
+            signature.append([path, st.st_mtime_ns, st.st_size])
+    return signature
+
+
+def data_signature(file_path):
+    # Размер и время изменения снимка и журнала: по ним проверяется, что сохранённый индекс не устарел
+    if STORAGE.indexed:
+        return None
+    return file_signature(file_path, file_path + JOURNAL_SUFFIX)
+
+
+@timed('save_data')
+def save_data(file_path, data, meta=None):
+    # Полное сохранение перекрывает все отложенные изменения файла
+    with STORAGE_LOCK:
+        WRITE_QUEUE.discard(file_path)
+        STORAGE.save(file_path, data, meta)
+
+
+@timed('load_data')
+def load_store(file_path, default_data, key_field=None):
+    with STORAGE_LOCK:
+        return STORAGE.load(file_path, default_data, key_field)
+
 
+def load_data(file_path, default_data, key_field=None):
+    data, _ = load_store(file_path, default_data, key_field)
+    return data
+
+
+def reserve_ids(file_path, count, next_id):
+    # Первый из count свободных ID, не меньше next_id и не выданный ни одному процессу
+    with STORAGE_LOCK:
+        return STORAGE.reserve_ids(file_path, count, next_id)
+
+
+def changed_elsewhere(file_path):
+    with STORAGE_LOCK:
+        return STORAGE.changed_elsewhere(file_path)
+
+
+@timed('append_data')
+def append_data(file_path, op, key_field, records, get_data, meta=None):
+    if WRITE_BEHIND:
+        WRITE_QUEUE.append(file_path, op, key_field, records, get_data, meta)
+    else:
+        with STORAGE_LOCK:
+            STORAGE.append(file_path, op, key_field, records, get_data, meta)
+
+
+def flush_pending(file_path=None):
+    WRITE_QUEUE.flush(file_path)
+
+
+atexit.register(flush_pending)
+
+
+class RecordCollection:
+    # Записи в порядке добавления с доступом по ID за O(1).
+    # next_id только растёт, поэтому ID удалённых записей повторно не выдаются.
+    # С file_path ID берутся из общего для всех процессов счётчика хранилища.
+    indexed = False
+    loaded = True
+
+    def __init__(self, key_field, records=(), next_id=1, file_path=None):
+        self.key_field = key_field
+        self.file_path = file_path
+        # Добавление записи вместе с обновлением индексов менеджера выполняется под этой блокировкой,
+        # чтобы фоновая загрузка не закончилась между ними
+        self.lock = threading.RLock()
+        self.records = {}
+        for record in records:
+            self.records[getattr(record, key_field)] = record
+        self.next_id = max(next_id, max(self.records, default=0) + 1)
+
+    def __iter__(self):
+        return iter(self.records.values())
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, record_id):
+        return record_id in self.records
+
+    def allocate_ids(self, count=1):
+        first_id = self.next_id if self.file_path is None else reserve_ids(self.file_path, count, self.next_id)
+        self.next_id = first_id + count
+        return first_id
+
+    def get(self, record_id):
+        return self.records.get(record_id)
+
+    def add(self, record):
+        self.records[getattr(record, self.key_field)] = record
+
+    def extend(self, records):
+        for record in records:
+            self.add(record)
+
+    def remove(self, record):
+        del self.records[getattr(record, self.key_field)]
+
+    def meta(self):
+        return {'next_id': self.next_id}
+
+    def ensure_loaded(self):
+        pass
+
+
+class LazyRecordCollection(RecordCollection):
+    # Коллекция, которая разбирает файл только при первом обращении к записям.
+    # Для добавления нужен лишь счётчик ID из заголовка снимка; добавленные до загрузки
+    # записи хранятся в pending и накладываются на прочитанные данные.
+    def __init__(self, key_field, load_records, next_id=None, on_load=None, file_path=None, on_index=None):
+        super().__init__(key_field, file_path=file_path)
+        self.load_records = load_records
+        self.on_load = on_load
+        self.on_index = on_index
+        self.loader = threading.RLock()
+        self.filling = False
+        self.loaded = False
+        self.pending = {}
+        self.next_id = next_id
+
+    def ensure_loaded(self):
+        # Загружает один поток, остальные чтения ждут его. Добавления из других потоков тем временем
+        # копятся в pending и не ждут ни разбора файла, ни индексов, которые строит on_load
+        if self.loaded:
+            return
+        with self.loader:
+            if self.loaded or self.filling:
+                return
+            self.filling = True
+            try:
+                records, next_id = self.load_records()
+                for record in records:
+                    self.records[getattr(record, self.key_field)] = record
+                with self.lock:
+                    self.records.update(self.pending)
+                    self.pending = {}
+                if self.on_load:
+                    self.on_load()
+                # Записи, добавленные, пока строились индексы, попадают в них по одной через on_index
+                with self.lock:
+                    late = list(self.pending.values())
+                    self.records.update(self.pending)
+                    self.pending = {}
+                    self.next_id = max(self.next_id or 1, next_id, max(self.records, default=0) + 1)
+                    self.loaded = True
+                    if self.on_index:
+                        for record in late:
+                            self.on_index(record)
+            finally:
+                self.filling = False
+
+    def __iter__(self):
+        self.ensure_loaded()
+        return super().__iter__()
+
+    def __len__(self):
+        self.ensure_loaded()
+        return super().__len__()
+
+    def __contains__(self, record_id):
+        self.ensure_loaded()
+        return super().__contains__(record_id)
+
+    def allocate_ids(self, count=1):
+        if self.next_id is None:
+            self.ensure_loaded()
+        with self.lock:
+            return super().allocate_ids(count)
+
+    def get(self, record_id):
+        self.ensure_loaded()
+        return super().get(record_id)
+
+    def add(self, record):
+        with self.lock:
+            if self.loaded:
+                super().add(record)
+            else:
+                self.pending[getattr(record, self.key_field)] = record
+
+    def remove(self, record):
+        self.ensure_loaded()
+        super().remove(record)
+
+    def meta(self):
+        if self.next_id is None:
+            self.ensure_loaded()
+        return super().meta()
+
+
+class SqliteCollection:
+    # Ленивое представление таблицы SQLite с интерфейсом RecordCollection: при открытии читается
+    # только счётчик ID, записи выбираются запросами по мере надобности. Изменения в базу пишет
+    # SqliteStorage.append при сохранении менеджера, поэтому add/extend/remove здесь ничего не делают.
+    indexed = True
+    loaded = True
+
+    def __init__(self, storage, file_path, key_field, record_class):
+        self.lock = threading.RLock()
+        self.storage = storage
+        self.file_path = file_path
+        self.key_field = key_field
+        self.record_class = record_class
+        table = SQLITE_TABLES[file_path]['table']
+        max_id = self.execute(f"SELECT MAX({key_field}) FROM {table}")[0][0] or 0
+        self.next_id = max(storage.read_meta(file_path).get('next_id', 1), max_id + 1)
+
+    def __iter__(self):
+        return self.select()
+
+    def __len__(self):
+        return self.execute(f"SELECT COUNT(*) FROM {SQLITE_TABLES[self.file_path]['table']}")[0][0]
+
+    def __contains__(self, record_id):
+        return self.get(record_id) is not None
+
+    def execute(self, sql, params=()):
+        # Отложенные изменения записываются до запроса, чтобы он видел их
+        flush_pending(self.file_path)
+        return self.storage.execute(sql, params)
+
+    def select(self, where='', params=(), order_by=None):
+        flush_pending(self.file_path)
+        for record in self.storage.query(self.file_path, where, params, order_by):
+            yield self.record_class(**record)
+
+    def first(self, where, params=()):
+        return next(self.select(where, params), None)
+
+    def allocate_ids(self, count=1):
+        first_id = reserve_ids(self.file_path, count, self.next_id)
+        self.next_id = first_id + count
+        return first_id
+
+    def get(self, record_id):
+        # Ещё не записанная запись берётся из очереди, чтобы поиск по ID не сбрасывал её на диск
+        change = WRITE_QUEUE.pending_change(self.file_path, record_id)
+        if change is not None:
+            op, record = change
+            return None if op == 'delete' else self.record_class(**record)
+        return self.first(f"{self.key_field} = ?", (record_id,))
+
+    def add(self, record):
+        pass
+
+    def extend(self, records):
+        pass
+
+    def remove(self, record):
+        pass
+
+    def meta(self):
+        return {'next_id': self.next_id}
+
+    def ensure_loaded(self):
+        pass
+
+
+def open_collection(file_path, key_field, record_class, on_load=None, on_index=None):
+    # on_load вызывается после отложенной загрузки, чтобы менеджер построил свои индексы,
+    # on_index - для записей, добавленных во время их построения
+    flush_pending(file_path)
+    if STORAGE.indexed:
+        return SqliteCollection(STORAGE, file_path, key_field, record_class)
+
+    def load_records():
+        data, meta = load_store(file_path, [], key_field)
+        return [record_class(**record) for record in data], meta.get('next_id', 1)
+
+    if LAZY_LOAD:
+        with STORAGE_LOCK:
+            meta = STORAGE.load_meta(file_path, key_field)
+        next_id = None if meta is None else meta.get('next_id', 1)
+        return LazyRecordCollection(key_field, load_records, next_id, on_load, file_path, on_index)
+    records, next_id = load_records()
+    return RecordCollection(key_field, records, next_id, file_path)
+
+
+def migrate_json_to_sqlite(db_path=SQLITE_FILE):
+    # Разовый перенос JSON-файлов (вместе с неприменёнными журналами) в базу SQLite
+    source = JournalStorage()
+    target = SqliteStorage(db_path)
+    for file_path, schema in SQLITE_TABLES.items():
+        if not os.path.exists(file_path):
+            continue
+        data, meta = source.load(file_path, [], schema['key'])
+        target.save(file_path, data, meta or {'next_id': max((item[schema['key']] for item in data), default=0) + 1})
+        print(f"{file_path}: перенесено записей: {len(data)}")
+
+
+def open_csv_file(csv_file, mode):
+    # Имя с расширением .gz - сжатый CSV
+    if csv_file.endswith('.gz'):
+        return gzip.open(csv_file, mode + 't', encoding='utf-8', newline='')
+    return open(csv_file, mode, encoding='utf-8', newline='')
+
+
+def read_csv_chunks(csv_file, normalize_frame, normalize_row, skip_rows=0, chunk_size=CSV_IMPORT_CHUNK_SIZE):
+    # Чанки CSV в виде (номер первой строки, число строк, нормализованные строки, номера отклонённых строк).
+    # Номер строки - порядковый номер записи без заголовка, многострочное поле не сбивает нумерацию.
+    # С pandas чанк проверяется векторно через normalize_frame, без него - построчно через normalize_row.
+    if PANDAS_AVAILABLE:
+        import pandas as pd
+        # Все колонки читаем как строки: иначе телефоны и даты превращаются в float. Распознавание пропусков
+        # отключено: "NA", "null" или "n/a" в заголовке или имени остаются текстом, как у модуля csv
+        for df in pd.read_csv(csv_file, dtype=str, keep_default_na=False, na_filter=False, chunksize=chunk_size):
+            if df.empty or df.index[-1] < skip_rows:
+                continue
+            df = df[df.index >= skip_rows]
+            frame, valid = normalize_frame(df)
+            yield (int(df.index[0]), len(df), list(frame[valid].itertuples(index=False, name=None)),
+                   valid.index[~valid].tolist())
+        return
+
+    with open_csv_file(csv_file, 'r') as f:
+        reader = csv.DictReader(f)
+        for _ in itertools.islice(reader, skip_rows):
+            pass
+        first = skip_rows
+        for chunk in iter(lambda: list(itertools.islice(reader, chunk_size)), []):
+            rows, rejected = [], []
+            for index, row in enumerate(chunk, first):
+                normalized = normalize_row(row)
+                if normalized is None:
+                    rejected.append(index)
+                else:
+                    rows.append(normalized)
+            yield first, len(chunk), rows, rejected
+            first += len(chunk)
+
+
+def csv_source_signature(csv_file):
+    st = os.stat(csv_file)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def import_checkpoint_owner(csv_file, data_file):
+    # Чьи это строки: какой CSV импортируется, в какую коллекцию и через какое хранилище
+    return {'csv': os.path.abspath(csv_file), 'data_file': os.path.abspath(data_file),
+            'collection': SQLITE_TABLES[data_file]['table'], 'storage': STORAGE_BACKEND}
+
+
+def read_import_checkpoint(csv_file, data_file):
+    # Контрольная точка лежит рядом с файлом данных и годится только для того же самого CSV,
+    # импортируемого в ту же коллекцию
+    try:
+        with open(data_file + CHECKPOINT_SUFFIX, 'rb') as f:
+            checkpoint = decode_json(f.read())
+    except (OSError, ValueError):
+        return None
+    if checkpoint.get('source') != csv_source_signature(csv_file):
+        return None
+    if checkpoint.get('owner') != import_checkpoint_owner(csv_file, data_file):
+        return None
+    return checkpoint
+
+
+def write_import_checkpoint(data_file, checkpoint):
+    temp_path = data_file + CHECKPOINT_SUFFIX + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(encode_json(checkpoint))
+    os.replace(temp_path, data_file + CHECKPOINT_SUFFIX)
+
+
+@timed('csv.import')
+def import_csv_in_chunks(csv_file, data_file, normalize_frame, normalize_row, persist,
+                         chunk_size=CSV_IMPORT_CHUNK_SIZE):
+    # Конвейер импорта по чанкам: проверка и нормализация -> сохранение. Одинаковые строки - разные записи
+    # (например, несколько одинаковых покупок за день), поэтому все они импортируются.
+    # normalize_frame(df) возвращает (нормализованные колонки, маску корректных строк), normalize_row(row) -
+    # кортеж полей или None; persist(rows) сохраняет кортежи и возвращает их число. После каждого чанка
+    # изменения сбрасываются на диск и пишется контрольная точка, так что прерванный импорт
+    # продолжается с первой несохранённой строки.
+    started = time.perf_counter()
+    checkpoint = read_import_checkpoint(csv_file, data_file) or {
+        'source': csv_source_signature(csv_file), 'owner': import_checkpoint_owner(csv_file, data_file),
+        'rows': 0, 'imported': 0, 'rejected': 0, 'rejected_lines': []}
+    # Точка пишется и до первого чанка: если её нельзя записать, импорт остановится, ничего не сохранив,
+    # и повтор не задвоит строки
+    write_import_checkpoint(data_file, checkpoint)
+    done_rows = checkpoint['rows']
+    if done_rows:
+        print(f"Продолжаем прерванный импорт со строки {done_rows + 2}.")
+    processed = 0
+    for first, count, rows, rejected in read_csv_chunks(csv_file, normalize_frame, normalize_row,
+                                                         done_rows, chunk_size):
+        imported = persist(rows)
+        flush_pending(data_file)
+
+        checkpoint['rows'] = first + count
+        checkpoint['imported'] += imported
+        checkpoint['rejected'] += len(rejected)
+        # +2: заголовок и нумерация строк CSV с единицы
+        checkpoint['rejected_lines'] = (checkpoint['rejected_lines']
+                                        + [int(index) + 2 for index in rejected[:20]])[:20]
+        write_import_checkpoint(data_file, checkpoint)
+        processed += count
+    if os.path.exists(data_file + CHECKPOINT_SUFFIX):
+        os.remove(data_file + CHECKPOINT_SUFFIX)
+    if PROFILING:
+        METRICS.add_bytes(csv_file, 'read', os.path.getsize(csv_file))
+    return checkpoint, processed, time.perf_counter() - started
+
+
+def csv_column(df, name):
+    import pandas as pd
+    if name in df.columns:
+        return df[name]
+    return pd.Series('', index=df.index, dtype=object)
+
+
+def normalize_csv_dates(column):
+    # Пустая дата заменяется текущей, некорректная помечается как ошибка строки
+    import pandas as pd
+    raw = column.str.strip()
+    parsed = pd.to_datetime(raw, format="%d-%m-%Y", errors='coerce')
+    empty = raw.eq('')
+    today = datetime.datetime.now().strftime("%d-%m-%Y")
+    dates = parsed.dt.strftime("%d-%m-%Y").where(~empty, today)
+    return dates, parsed.notna() | empty
+
+
+def normalize_csv_date(value):
+    # Построчный вариант normalize_csv_dates для импорта без pandas
+    value = value.strip()
+    if not value:
+        return datetime.datetime.now().strftime("%d-%m-%Y"), True
+    ordinal = parse_date(value)
+    if ordinal is None:
+        return value, False
+    return datetime.date.fromordinal(ordinal).strftime("%d-%m-%Y"), True
+
+
+def report_import(checkpoint, processed, elapsed):
+    rate = processed / elapsed if elapsed > 0 else processed
+    print(f"Импортировано записей: {checkpoint['imported']}, отклонено строк: {checkpoint['rejected']} "
+          f"({rate:.0f} строк/с).")
+    if checkpoint['rejected']:
+        shown = ', '.join(str(line) for line in checkpoint['rejected_lines'])
+        print(f"Отклонённые строки CSV: {shown}{' ...' if checkpoint['rejected'] > 20 else ''}")
+
+
+@timed('csv.export')
+def write_csv_rows(csv_file, header, rows):
+    # Строки пишутся по одной из генератора, поэтому память не зависит от размера выгрузки
+    with open_csv_file(csv_file, 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        count = 0
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    if PROFILING:
+        METRICS.add_bytes(csv_file, 'written', os.path.getsize(csv_file))
+    return count
+
+
+def parse_amount(text):
+    # float() принимает и 'nan'/'inf': такая сумма навсегда испортила бы накопленные итоги
+    amount = float(text)
+    if not math.isfinite(amount):
+        raise ValueError(f"сумма должна быть конечным числом: {text}")
+    return amount
+
+
+def parse_date(date_str):
+    # Дата 'ДД-ММ-ГГГГ' -> порядковый номер дня (date.toordinal), None для некорректной даты
+    try:
+        return datetime.datetime.strptime(date_str, "%d-%m-%Y").toordinal()
+    except (TypeError, ValueError):
+        return None
+
+
+TASK_PRIORITY_RANKS = {"высокий": 0, "средний": 1, "низкий": 2}
+# Задачи без корректного срока идут в повестке после всех остальных
+UNDATED_ORDINAL = datetime.date.max.toordinal() + 1
+
+
+def task_priority_rank(priority):
+    return TASK_PRIORITY_RANKS.get((priority or '').strip().lower(), len(TASK_PRIORITY_RANKS))
+
+
+class Record:
+    # Записи хранят поля в __slots__ без словаря на экземпляр; to_dict собирает словарь для сохранения
+    __slots__ = ()
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+class Note(Record):
+    __slots__ = ('note_id', 'title', 'content', 'timestamp')
 
-class Note:
     def __init__(self, note_id, title, content, timestamp):
         self.note_id = note_id
         self.title = title
@@ -37,7 +1416,9 @@ class Note:
         self.timestamp = timestamp
 
 
-class Task:
+class Task(Record):
+    __slots__ = ('task_id', 'title', 'description', 'done', 'priority', 'due_date')
+
     def __init__(self, task_id, title, description, done=False, priority="Низкий", due_date=None):
         self.task_id = task_id
         self.title = title
@@ -47,7 +1428,9 @@ class Task:
         self.due_date = due_date
 
 
-class Contact:
+class Contact(Record):
+    __slots__ = ('contact_id', 'name', 'phone', 'email')
+
     def __init__(self, contact_id, name, phone=None, email=None):
         self.contact_id = contact_id
         self.name = name
@@ -55,7 +1438,9 @@ class Contact:
         self.email = email
 
 
-class FinanceRecord:
+class FinanceRecord(Record):
+    __slots__ = ('record_id', 'amount', 'category', 'date', 'description')
+
     def __init__(self, record_id, amount, category, date=None, description=None):
         self.record_id = record_id
         self.amount = amount
@@ -64,26 +1449,214 @@ class FinanceRecord:
         self.description = description
 
 
+class NoteSearchIndex:
+    # Инвертированный индекс по заголовку и тексту заметок с ранжированием BM25.
+    # Слова приводятся к нижнему регистру и грубо стеммируются (русские и английские окончания),
+    # последнее слово запроса дополнительно ищется как префикс.
+    TOKEN_PATTERN = re.compile(r'\w+')
+    SUFFIXES = {
+        3: {'ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'иях', 'ией', 'ать', 'ять', 'ить', 'ing'},
+        2: {'ах', 'ях', 'ов', 'ев', 'ей', 'ий', 'ый', 'ой', 'ая', 'яя', 'ое', 'ее', 'ие', 'ые', 'ом', 'ем', 'ам',
+            'ям', 'ую', 'юю', 'их', 'ых', 'ть', 'ed', 'es'},
+        1: {'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й', 's'},
+    }
+    TITLE_WEIGHT = 2
+    PREFIX_WEIGHT = 0.5
+    PREFIX_LIMIT = 50
+    K1 = 1.5
+    B = 0.75
+
+    stems = {}
+
+    def __init__(self):
+        self.doc_terms = {}
+        self.doc_lengths = {}
+        self.postings = {}
+        self.terms = []
+        self.total_length = 0
+
+    @classmethod
+    def stem(cls, word):
+        stem = cls.stems.get(word)
+        if stem is None:
+            stem = word.replace('ё', 'е')
+            for length in (3, 2, 1):
+                if len(stem) - length >= 3 and stem[-length:] in cls.SUFFIXES[length]:
+                    stem = stem[:-length]
+                    break
+            cls.stems[word] = stem
+        return stem
+
+    @classmethod
+    def tokenize(cls, text):
+        return [cls.stem(word) for word in cls.TOKEN_PATTERN.findall((text or '').casefold())]
+
+    def add(self, note):
+        terms = {}
+        for term in self.tokenize(note.title):
+            terms[term] = terms.get(term, 0) + self.TITLE_WEIGHT
+        for term in self.tokenize(note.content):
+            terms[term] = terms.get(term, 0) + 1
+        self.add_terms(note.note_id, terms)
+
+    def add_terms(self, note_id, terms):
+        self.doc_terms[note_id] = terms
+        self.doc_lengths[note_id] = sum(terms.values())
+        self.total_length += self.doc_lengths[note_id]
+        for term, frequency in terms.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = {}
+                bisect.insort(self.terms, term)
+            posting[note_id] = frequency
+
+    def remove(self, note_id):
+        terms = self.doc_terms.pop(note_id, None)
+        if terms is None:
+            return
+        self.total_length -= self.doc_lengths.pop(note_id)
+        for term in terms:
+            posting = self.postings[term]
+            del posting[note_id]
+            if not posting:
+                del self.postings[term]
+                del self.terms[bisect.bisect_left(self.terms, term)]
+
+    def update(self, note):
+        self.remove(note.note_id)
+        self.add(note)
+
+    def prefix_terms(self, prefix):
+        position = bisect.bisect_left(self.terms, prefix)
+        matches = []
+        while position < len(self.terms) and self.terms[position].startswith(prefix) and len(matches) < self.PREFIX_LIMIT:
+            matches.append(self.terms[position])
+            position += 1
+        return matches
+
+    @timed('notes.search')
+    def search(self, query, limit=10):
+        words = self.TOKEN_PATTERN.findall((query or '').casefold())
+        if not words or not self.doc_terms:
+            return []
+        weights = {}
+        for word in words:
+            term = self.stem(word)
+            weights[term] = max(weights.get(term, 0), 1)
+        for term in self.prefix_terms(words[-1].replace('ё', 'е')):
+            weights.setdefault(term, self.PREFIX_WEIGHT)
+
+        doc_count = len(self.doc_terms)
+        average_length = self.total_length / doc_count
+        scores = {}
+        for term, weight in weights.items():
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (doc_count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for note_id, frequency in posting.items():
+                length = self.doc_lengths[note_id]
+                score = idf * frequency * (self.K1 + 1) / (
+                    frequency + self.K1 * (1 - self.B + self.B * length / average_length))
+                scores[note_id] = scores.get(note_id, 0.0) + weight * score
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+    def save(self, file_path, signature):
+        with open(file_path, 'wb') as f:
+            f.write(encode_json({'signature': signature,
+                                 'docs': [[note_id, terms] for note_id, terms in self.doc_terms.items()]}))
+
+    @classmethod
+    def load(cls, file_path, signature):
+        # Индекс годится, только если файлы заметок не менялись с момента его сохранения
+        if signature is None or not os.path.exists(file_path):
+            return None
+        try:
+            with open(file_path, 'rb') as f:
+                data = decode_json(f.read())
+        except (OSError, json.JSONDecodeError):
+            return None
+        if data.get('signature') != signature:
+            return None
+        index = cls()
+        for note_id, terms in data['docs']:
+            index.add_terms(note_id, terms)
+        return index
+
+
 class NoteManager:
     def __init__(self):
-        self.notes = []
+        self.notes = RecordCollection('note_id')
+        self.search_index = None
+        self.search_index_dirty = False
         self.load_notes()
 
+    @timed('notes.load')
     def load_notes(self):
-        data = load_data(NOTES_FILE, [])
-        self.notes = [Note(**note) for note in data]
+        self.notes = open_collection(NOTES_FILE, 'note_id', Note)
+
+    def dump_notes(self):
+        return (note.to_dict() for note in self.notes)
 
-    def save_notes(self):
-        data = [note.__dict__ for note in self.notes]
-        save_data(NOTES_FILE, data)
+    def save_notes(self, op=None, *notes):
+        if op is None:
+            save_data(NOTES_FILE, self.dump_notes(), self.notes.meta())
+        else:
+            append_data(NOTES_FILE, op, 'note_id', [note.to_dict() for note in notes],
+                        self.dump_notes, self.notes.meta())
+
+    def get_search_index(self):
+        if self.search_index is None:
+            self.search_index = NoteSearchIndex.load(NOTES_FILE + SEARCH_INDEX_SUFFIX, data_signature(NOTES_FILE))
+            if self.search_index is None:
+                self.search_index = NoteSearchIndex()
+                for note in self.notes:
+                    self.search_index.add(note)
+                self.search_index_dirty = True
+        return self.search_index
+
+    def update_search_index(self, op, note):
+        # Индекс, который ещё не строился, не трогаем: при первом поиске он будет построен заново
+        if self.search_index is None:
+            return
+        if op == 'delete':
+            self.search_index.remove(note.note_id)
+        else:
+            self.search_index.update(note)
+        self.search_index_dirty = True
+
+    def warm_up(self):
+        # Всё, что менеджер строит лениво, строится заранее, и чтения потом ничего не меняют
+        self.notes.ensure_loaded()
+        self.get_search_index()
+
+    def save_search_index(self):
+        # Подпись снимается после записи отложенных изменений, иначе индекс сразу устареет
+        flush_pending(NOTES_FILE)
+        signature = data_signature(NOTES_FILE)
+        if self.search_index is not None and self.search_index_dirty and signature is not None:
+            self.search_index.save(NOTES_FILE + SEARCH_INDEX_SUFFIX, signature)
+            self.search_index_dirty = False
+
+    def search_notes(self, query, limit=10):
+        results = self.get_search_index().search(query, limit)
+        if not results:
+            print("Заметки не найдены.")
+            return
+        for note_id, score in results:
+            note = self.get_note_by_id(note_id)
+            print(f"{note.note_id}. {note.title} (дата: {note.timestamp}, релевантность: {score:.2f})")
 
+    @timed('notes.add')
     def add_note(self, title, content):
-        note_id = max([note.note_id for note in self.notes], default=0) + 1
+        note_id = self.notes.allocate_ids()
         timestamp = datetime.datetime.now().strftime("%d-%m-%Y %H:%M:%S")
         new_note = Note(note_id, title, content, timestamp)
-        self.notes.append(new_note)
-        self.save_notes()
+        self.notes.add(new_note)
+        self.save_notes('add', new_note)
+        self.update_search_index('add', new_note)
         print("Заметка успешно добавлена")
+        return new_note
 
     def list_notes(self):
         if not self.notes:
@@ -92,11 +1665,9 @@ class NoteManager:
         for note in self.notes:
             print(f"{note.note_id}. {note.title} (дата: {note.timestamp})")
 
+    @timed('notes.get')
     def get_note_by_id(self, note_id):
-        for note in self.notes:
-            if note.note_id == note_id:
-                return note
-        return None
+        return self.notes.get(note_id)
 
     def view_note(self, note_id):
         note = self.get_note_by_id(note_id)
@@ -107,66 +1678,136 @@ class NoteManager:
         else:
             print("Заметка не найдена.")
 
+    @timed('notes.edit')
     def edit_note(self, note_id, new_title, new_content):
         note = self.get_note_by_id(note_id)
         if note:
             note.title = new_title
             note.content = new_content
             note.timestamp = datetime.datetime.now().strftime("%d-%m-%Y %H:%M:%S")
-            self.save_notes()
+            self.save_notes('edit', note)
+            self.update_search_index('edit', note)
             print("Заметка успешно обновлена.")
         else:
             print("Заметка не найдена.")
 
+    @timed('notes.delete')
     def delete_note(self, note_id):
         note = self.get_note_by_id(note_id)
         if note:
             self.notes.remove(note)
-            self.save_notes()
+            self.save_notes('delete', note)
+            self.update_search_index('delete', note)
             print("Заметка успешно удалена.")
         else:
             print("Заметка не найдена.")
 
     def import_notes_from_csv(self, csv_file):
         try:
-            df = pd.read_csv(csv_file)
-            for _, row in df.iterrows():
-                self.add_note(row['title'], row['content'])
+            stats = import_csv_in_chunks(csv_file, NOTES_FILE, self.normalize_notes_chunk,
+                                         self.normalize_note_row, self.persist_notes_chunk)
             print("Заметки успешно импортированы из CSV.")
+            report_import(*stats)
+            return stats[0]
         except Exception as e:
             print(f"Ошибка при импорте заметок: {e}")
 
+    def normalize_notes_chunk(self, df):
+        import pandas as pd
+        frame = pd.DataFrame({'title': df['title'], 'content': csv_column(df, 'content')})
+        return frame, frame['title'].str.strip().ne('')
+
+    def normalize_note_row(self, row):
+        title = row.get('title') or ''
+        if not title.strip():
+            return None
+        return title, row.get('content') or ''
+
+    def persist_notes_chunk(self, rows):
+        first_id = self.notes.allocate_ids(len(rows))
+        timestamp = datetime.datetime.now().strftime("%d-%m-%Y %H:%M:%S")
+        new_notes = [Note(note_id, title, content, timestamp)
+                     for note_id, (title, content) in zip(itertools.count(first_id), rows)]
+        self.notes.extend(new_notes)
+        self.save_notes('add', *new_notes)
+        for note in new_notes:
+            self.update_search_index('add', note)
+        return len(new_notes)
+
     def export_notes_to_csv(self, csv_file):
         try:
-            data = [{'id': note.note_id, 'title': note.title, 'content': note.content, 'timestamp': note.timestamp} for note in self.notes]
-            df = pd.DataFrame(data)
-            df.to_csv(csv_file, index=False)
-            print("Заметки успешно экспортированы в CSV.")
+            rows = ((note.note_id, note.title, note.content, note.timestamp) for note in self.notes)
+            count = write_csv_rows(csv_file, ('id', 'title', 'content', 'timestamp'), rows)
+            print(f"Заметки успешно экспортированы в CSV ({count}).")
+            return count
         except Exception as e:
             print(f"Ошибка при экспорте заметок: {e}")
 
 
 class TaskManager:
     def __init__(self):
-        self.tasks = []
+        self.tasks = RecordCollection('task_id')
         self.load_tasks()
 
+    @timed('tasks.load')
     def load_tasks(self):
-        data = load_data(TASKS_FILE, [])
-        self.tasks = [Task(**task) for task in data]
+        self.tasks = open_collection(TASKS_FILE, 'task_id', Task, self.rebuild_agenda, self.index_task)
+        if self.tasks.loaded and not self.tasks.indexed:
+            self.rebuild_agenda()
+
+    def warm_up(self):
+        self.tasks.ensure_loaded()
+
+    @timed('tasks.index')
+    def rebuild_agenda(self):
+        # Повестка - два отсортированных списка только по невыполненным задачам:
+        # по (срок, приоритет, ID) и по (приоритет, срок, ID)
+        self.agenda_keys = {}
+        for task in self.tasks:
+            if not task.done:
+                self.agenda_keys[task.task_id] = self.task_agenda_keys(task)
+        self.by_due = sorted(due_key for due_key, _ in self.agenda_keys.values())
+        self.by_priority = sorted(priority_key for _, priority_key in self.agenda_keys.values())
+
+    def task_agenda_keys(self, task):
+        due = parse_date(task.due_date)
+        due = UNDATED_ORDINAL if due is None else due
+        rank = task_priority_rank(task.priority)
+        return (due, rank, task.task_id), (rank, due, task.task_id)
+
+    def index_task(self, task):
+        if self.tasks.indexed or not self.tasks.loaded or task.done:
+            return
+        due_key, priority_key = self.agenda_keys[task.task_id] = self.task_agenda_keys(task)
+        bisect.insort(self.by_due, due_key)
+        bisect.insort(self.by_priority, priority_key)
+
+    def unindex_task(self, task):
+        if self.tasks.indexed or not self.tasks.loaded:
+            return
+        keys = self.agenda_keys.pop(task.task_id, None)
+        if keys is None:
+            return
+        for agenda, key in zip((self.by_due, self.by_priority), keys):
+            del agenda[bisect.bisect_left(agenda, key)]
+
+    def dump_tasks(self):
+        return (task.to_dict() for task in self.tasks)
 
-    def save_tasks(self):
-        data = [task.__dict__ for task in self.tasks]
-        save_data(TASKS_FILE, data)
+    def save_tasks(self, op=None, *tasks):
+        if op is None:
+            save_data(TASKS_FILE, self.dump_tasks(), self.tasks.meta())
+        else:
+            append_data(TASKS_FILE, op, 'task_id', [task.to_dict() for task in tasks],
+                        self.dump_tasks, self.tasks.meta())
 
+    @timed('tasks.get')
     def get_task_by_id(self, task_id):
-        for task in self.tasks:
-            if task.task_id == task_id:
-                return task
-        return None
+        return self.tasks.get(task_id)
 
+    @timed('tasks.add')
     def add_task(self, title, description="", priority="Низкий", due_date=None):
-        task_id = max([task.task_id for task in self.tasks], default=0) + 1
+        task_id = self.tasks.allocate_ids()
         new_task = Task(task_id=task_id,
                         title=title,
                         description=description,
@@ -176,9 +1817,12 @@ class TaskManager:
         if due_date is None:
             new_task.due_date = datetime.datetime.now().strftime("%d-%m-%Y")
 
-        self.tasks.append(new_task)
-        self.save_tasks()
+        with self.tasks.lock:
+            self.tasks.add(new_task)
+            self.index_task(new_task)
+        self.save_tasks('add', new_task)
         print("Задача успешно добавлена.")
+        return new_task
 
     def list_tasks(self):
         if not self.tasks:
@@ -190,18 +1834,84 @@ class TaskManager:
             print(f"{task.task_id}. {task.title} - {status} (Приоритет: {task.priority},"
                   f" Срок: {task.due_date})")
 
+    def print_task_list(self, tasks):
+        if not tasks:
+            print("Задач нет.")
+            return
+        for task in tasks:
+            status = "Выполнена" if task.done else "Не выполнена"
+            print(f"{task.task_id}. {task.title} - {status} (Приоритет: {task.priority},"
+                  f" Срок: {task.due_date})")
+
+    def open_tasks_due(self, start_ordinal=None, end_ordinal=None):
+        # Невыполненные задачи со сроком в [start_ordinal, end_ordinal] по возрастанию срока и приоритета
+        if self.tasks.indexed:
+            # Задача без срока (NULL) - как UNDATED_ORDINAL в повестке: позже любой даты
+            conditions, params = ["done = 0"], []
+            if start_ordinal is not None:
+                conditions.append("(due_ordinal >= ? OR due_ordinal IS NULL)")
+                params.append(start_ordinal)
+            if end_ordinal is not None:
+                conditions.append("due_ordinal <= ?")
+                params.append(end_ordinal)
+            return list(self.tasks.select(' AND '.join(conditions), params,
+                                          "due_ordinal IS NULL, due_ordinal, priority_rank, task_id"))
+        self.tasks.ensure_loaded()
+        low = 0 if start_ordinal is None else bisect.bisect_left(self.by_due, (start_ordinal,))
+        high = (len(self.by_due) if end_ordinal is None
+                else bisect.bisect_left(self.by_due, (end_ordinal + 1,), low))
+        return [self.tasks.get(task_id) for _, _, task_id in self.by_due[low:high]]
+
+    @timed('tasks.top')
+    def top_open_tasks(self, limit=10):
+        if self.tasks.indexed:
+            return list(itertools.islice(
+                self.tasks.select("done = 0", (), "priority_rank, due_ordinal IS NULL, due_ordinal, task_id"), limit))
+        self.tasks.ensure_loaded()
+        return [self.tasks.get(task_id) for _, _, task_id in self.by_priority[:limit]]
+
+    @timed('tasks.overdue')
+    def overdue_tasks(self):
+        today = datetime.date.today().toordinal()
+        return self.open_tasks_due(end_ordinal=today - 1)
+
+    def tasks_due_today(self):
+        today = datetime.date.today().toordinal()
+        return self.open_tasks_due(today, today)
+
+    def tasks_due_this_week(self):
+        today = datetime.date.today()
+        end_of_week = today + datetime.timedelta(days=6 - today.weekday())
+        return self.open_tasks_due(today.toordinal(), end_of_week.toordinal())
+
+    def list_overdue_tasks(self):
+        self.print_task_list(self.overdue_tasks())
+
+    def list_tasks_due_today(self):
+        self.print_task_list(self.tasks_due_today())
+
+    def list_tasks_due_this_week(self):
+        self.print_task_list(self.tasks_due_this_week())
+
+    def list_top_tasks(self, limit=10):
+        self.print_task_list(self.top_open_tasks(limit))
+
+    @timed('tasks.done')
     def mark_task_as_done(self, task_id):
         task = self.get_task_by_id(task_id)
         if task:
+            self.unindex_task(task)
             task.done = True
-            self.save_tasks()
+            self.save_tasks('edit', task)
             print("Задача отмечена как выполненная.")
         else:
             print("Задача не найдена.")
 
+    @timed('tasks.edit')
     def edit_task(self, task_id, new_title=None, new_description=None, new_priority=None, new_due_date=None):
         task = self.get_task_by_id(task_id)
         if task:
+            self.unindex_task(task)
             if new_title is not None and new_title.strip() != "":
                 task.title = new_title
             if new_description is not None and new_description.strip() != "":
@@ -210,63 +1920,259 @@ class TaskManager:
                 task.priority = new_priority
             if new_due_date is not None and new_due_date.strip() != "":
                 task.due_date = new_due_date
-            self.save_tasks()
+            self.index_task(task)
+            self.save_tasks('edit', task)
             print("Задача успешно обновлена.")
         else:
             print("Задача не найдена.")
 
+    @timed('tasks.delete')
     def delete_task(self, task_id):
         task = self.get_task_by_id(task_id)
         if task:
             self.tasks.remove(task)
-            self.save_tasks()
+            self.unindex_task(task)
+            self.save_tasks('delete', task)
             print("Задача успешно удалена.")
         else:
             print("Задача не найдена.")
 
     def import_tasks_from_csv(self, csv_file):
         try:
-            df = pd.read_csv(csv_file)
-            for _, row in df.iterrows():
-                self.add_task(row['title'], row['description'], row['priority'], row['due_date'])
+            stats = import_csv_in_chunks(csv_file, TASKS_FILE, self.normalize_tasks_chunk,
+                                         self.normalize_task_row, self.persist_tasks_chunk)
             print("Задачи успешно импортированы из CSV.")
+            report_import(*stats)
+            return stats[0]
         except Exception as e:
             print(f"Ошибка при импорте задач: {e}")
 
-    def export_tasks_to_csv(self, csv_file):
+    def normalize_tasks_chunk(self, df):
+        import pandas as pd
+        due_dates, valid_dates = normalize_csv_dates(csv_column(df, 'due_date'))
+        priorities = csv_column(df, 'priority').str.strip()
+        frame = pd.DataFrame({'title': df['title'],
+                              'description': csv_column(df, 'description'),
+                              'priority': priorities.where(priorities.ne(''), "Низкий"),
+                              'due_date': due_dates})
+        return frame, frame['title'].str.strip().ne('') & valid_dates
+
+    def normalize_task_row(self, row):
+        title = row.get('title') or ''
+        due_date, valid_date = normalize_csv_date(row.get('due_date') or '')
+        if not title.strip() or not valid_date:
+            return None
+        return title, row.get('description') or '', (row.get('priority') or '').strip() or "Низкий", due_date
+
+    def persist_tasks_chunk(self, rows):
+        first_id = self.tasks.allocate_ids(len(rows))
+        new_tasks = [Task(task_id=task_id, title=title, description=description,
+                          priority=priority, due_date=due_date)
+                     for task_id, (title, description, priority, due_date) in zip(itertools.count(first_id), rows)]
+        with self.tasks.lock:
+            self.tasks.extend(new_tasks)
+            for task in new_tasks:
+                self.index_task(task)
+        self.save_tasks('add', *new_tasks)
+        return len(new_tasks)
+
+    def export_tasks_to_csv(self, csv_file, done=None):
+        # done: None - все задачи, True/False - только выполненные/невыполненные
         try:
-            data = [{'id': task.task_id,
-                     'title': task.title,
-                     'description': task.description,
-                     'done': task.done,
-                     'priority': task.priority,
-                     'due_date': task.due_date} for task in self.tasks]
-            df = pd.DataFrame(data)
-            df.to_csv(csv_file, index=False)
-            print("Задачи успешно экспортированы в CSV.")
+            if done is None:
+                tasks = iter(self.tasks)
+            elif self.tasks.indexed:
+                tasks = self.tasks.select("done = ?", (done,))
+            else:
+                tasks = (task for task in self.tasks if task.done == done)
+            rows = ((task.task_id, task.title, task.description, task.done, task.priority, task.due_date)
+                    for task in tasks)
+            count = write_csv_rows(csv_file, ('id', 'title', 'description', 'done', 'priority', 'due_date'), rows)
+            print(f"Задачи успешно экспортированы в CSV ({count}).")
+            return count
         except Exception as e:
             print(f"Ошибка при экспорте задач: {e}")
 
 
+def normalize_phone(phone):
+    # Только цифры; российские номера приводятся к виду 7XXXXXXXXXX (8XXXXXXXXXX и номер без кода страны)
+    digits = re.sub(r'\D', '', phone or '')
+    if len(digits) == 11 and digits[0] == '8':
+        digits = '7' + digits[1:]
+    elif len(digits) == 10:
+        digits = '7' + digits
+    return digits
+
+
+class ContactIndex:
+    # Хеш-индексы контактов по нормализованному телефону и по имени без учёта регистра,
+    # плюс триграммный индекс для поиска по части имени и с опечатками
+    SIMILARITY_THRESHOLD = 0.3
+    PREFIX_SCORE = 0.75
+    # В триграммном индексе хранится ID контакта со сдвигом и номер варианта имени в младших битах:
+    # 0 - всё имя, дальше его слова (больше 15 слов сравниваются только в составе имени)
+    VARIANT_BITS = 4
+
+    def __init__(self):
+        self.by_phone = {}
+        self.by_name = {}
+        self.trigrams = {}
+        self.keys = {}
+        self.variant_sizes = {}
+
+    @staticmethod
+    def name_key(name):
+        return ' '.join((name or '').casefold().split())
+
+    @staticmethod
+    def name_trigrams(key):
+        padded = f"  {key} "
+        return {padded[position:position + 3] for position in range(len(padded) - 2)}
+
+    @classmethod
+    def name_variants(cls, key):
+        # Триграммы всего имени и каждого слова в нём: короткий запрос сравнивается с отдельным словом,
+        # а не со всем именем, где его триграммы теряются среди чужих
+        variants = [cls.name_trigrams(key)]
+        words = key.split()
+        if len(words) > 1:
+            variants.extend(cls.name_trigrams(word) for word in words)
+        return variants[:1 << cls.VARIANT_BITS]
+
+    def add(self, contact):
+        name_key = self.name_key(contact.name)
+        phone_key = normalize_phone(contact.phone)
+        self.keys[contact.contact_id] = (name_key, phone_key)
+        # Вложенные dict служат упорядоченными множествами ID
+        self.by_name.setdefault(name_key, {})[contact.contact_id] = None
+        if phone_key:
+            self.by_phone.setdefault(phone_key, {})[contact.contact_id] = None
+        variants = self.name_variants(name_key)
+        self.variant_sizes[contact.contact_id] = [len(trigrams) for trigrams in variants]
+        for number, trigrams in enumerate(variants):
+            code = contact.contact_id << self.VARIANT_BITS | number
+            for trigram in trigrams:
+                self.trigrams.setdefault(trigram, set()).add(code)
+
+    def remove(self, contact):
+        name_key, phone_key = self.keys.pop(contact.contact_id)
+        for index, key in ((self.by_name, name_key), (self.by_phone, phone_key)):
+            ids = index.get(key)
+            if ids is not None:
+                ids.pop(contact.contact_id, None)
+                if not ids:
+                    del index[key]
+        del self.variant_sizes[contact.contact_id]
+        for number, trigrams in enumerate(self.name_variants(name_key)):
+            code = contact.contact_id << self.VARIANT_BITS | number
+            for trigram in trigrams:
+                codes = self.trigrams[trigram]
+                codes.discard(code)
+                if not codes:
+                    del self.trigrams[trigram]
+
+    def find_phone(self, phone):
+        return list(self.by_phone.get(normalize_phone(phone), ()))
+
+    def find_name(self, name):
+        return list(self.by_name.get(self.name_key(name), ()))
+
+    @timed('contacts.search')
+    def search(self, query, limit=20):
+        # Сходство - коэффициент Дайса по триграммам со всем именем или с лучшим из его слов; совпадение
+        # начала имени или слова в нём поднимает оценку до PREFIX_SCORE, точное совпадение имени даёт 1
+        query_key = self.name_key(query)
+        if not query_key:
+            return []
+        query_trigrams = self.name_trigrams(query_key)
+        shared = {}
+        for trigram in query_trigrams:
+            for code in self.trigrams.get(trigram, ()):
+                shared[code] = shared.get(code, 0) + 1
+
+        scores = {}
+        mask = (1 << self.VARIANT_BITS) - 1
+        for code, count in shared.items():
+            contact_id, number = code >> self.VARIANT_BITS, code & mask
+            score = 2 * count / (len(query_trigrams) + self.variant_sizes[contact_id][number])
+            if number:
+                # Слово, как и начало слова, оценивается не выше PREFIX_SCORE: 1 - только за всё имя
+                score = min(score, self.PREFIX_SCORE)
+            if score > scores.get(contact_id, -1.0):
+                scores[contact_id] = score
+
+        results = []
+        for contact_id, score in scores.items():
+            name_key = self.keys[contact_id][0]
+            if name_key == query_key:
+                score = 1.0
+            elif f" {name_key}".find(f" {query_key}") != -1:
+                score = max(score, self.PREFIX_SCORE)
+            if score >= self.SIMILARITY_THRESHOLD:
+                results.append((contact_id, score))
+        results.sort(key=lambda item: (-item[1], item[0]))
+        return results[:limit]
+
+
 class ContactManager:
     def __init__(self):
-        self.contacts = []
+        self.contacts = RecordCollection('contact_id')
+        self.contact_index = None
         self.load_contacts()
 
+    @timed('contacts.load')
     def load_contacts(self):
-        data = load_data(CONTACTS_FILE, [])
-        self.contacts = [Contact(**contact) for contact in data]
-
-    def save_contacts(self):
-        data = [contact.__dict__ for contact in self.contacts]
-        save_data(CONTACTS_FILE, data)
+        self.contacts = open_collection(CONTACTS_FILE, 'contact_id', Contact, self.rebuild_contact_index,
+                                        self.index_contact)
+        self.contact_index = None
+        if self.contacts.loaded and not self.contacts.indexed:
+            self.rebuild_contact_index()
+
+    def warm_up(self):
+        self.get_contact_index()
+
+    @timed('contacts.index')
+    def rebuild_contact_index(self):
+        self.contact_index = ContactIndex()
+        for contact in self.contacts:
+            self.contact_index.add(contact)
+
+    def get_contact_index(self):
+        # Ленивая коллекция строит индекс при загрузке (возможно, в фоне), для SQLite он нужен только нечёткому поиску
+        self.contacts.ensure_loaded()
+        if self.contact_index is None:
+            self.rebuild_contact_index()
+        return self.contact_index
+
+    def index_contact(self, contact):
+        # Индекс, который ещё строится при загрузке, получит запись из самой коллекции
+        if self.contacts.loaded and self.contact_index is not None:
+            self.contact_index.add(contact)
+
+    def unindex_contact(self, contact):
+        if self.contacts.loaded and self.contact_index is not None:
+            self.contact_index.remove(contact)
+
+    def dump_contacts(self):
+        return (contact.to_dict() for contact in self.contacts)
+
+    def save_contacts(self, op=None, *contacts):
+        if op is None:
+            save_data(CONTACTS_FILE, self.dump_contacts(), self.contacts.meta())
+        else:
+            append_data(CONTACTS_FILE, op, 'contact_id', [contact.to_dict() for contact in contacts],
+                        self.dump_contacts, self.contacts.meta())
 
+    @timed('contacts.add')
     def add_contact(self, name, phone=None, email=None):
-        contact_id = max([contact.contact_id for contact in self.contacts], default=0) + 1
+        contact_id = self.contacts.allocate_ids()
         new_contact = Contact(contact_id=contact_id, name=name, phone=phone, email=email)
-        self.contacts.append(new_contact)
-        self.save_contacts()
+        with self.contacts.lock:
+            self.contacts.add(new_contact)
+            self.index_contact(new_contact)
+        self.save_contacts('add', new_contact)
         print("Контакт успешно добавлен.")
+        return new_contact
 
     def list_contacts(self):
         if not self.contacts:
@@ -276,124 +2182,558 @@ class ContactManager:
             print(f"{contact.contact_id}. {contact.name} (Телефон: {contact.phone}, Email: {contact.email})")
 
     def get_contact_by_name(self, name):
-        for contact in self.contacts:
-            if contact.name.lower() == name.lower():
-                return contact
-        return None
+        if self.contacts.indexed:
+            return self.contacts.first("name_key = ?", (ContactIndex.name_key(name),))
+        contact_ids = self.get_contact_index().find_name(name)
+        return self.contacts.get(contact_ids[0]) if contact_ids else None
 
+    @timed('contacts.find_phone')
     def get_contact_by_phone(self, phone):
-        for contact in self.contacts:
-            if contact.phone == phone:
-                return contact
-        return None
+        if not normalize_phone(phone):
+            return None
+        if self.contacts.indexed:
+            return self.contacts.first("phone_key = ?", (normalize_phone(phone),))
+        contact_ids = self.get_contact_index().find_phone(phone)
+        return self.contacts.get(contact_ids[0]) if contact_ids else None
+
+    def find_contacts(self, query, limit=20):
+        return [self.contacts.get(contact_id) for contact_id, _ in self.get_contact_index().search(query, limit)]
 
+    @timed('contacts.get')
     def get_contact_by_id(self, contact_id):
-        for contact in self.contacts:
-            if contact.contact_id == contact_id:
-                return contact
-        return None
+        return self.contacts.get(contact_id)
 
+    @timed('contacts.edit')
     def edit_contact(self, contact_id, new_name=None, new_phone=None, new_email=None):
         contact = self.get_contact_by_id(contact_id)
         if contact:
+            self.unindex_contact(contact)
             if new_name is not None and new_name.strip() != "":
                 contact.name = new_name
             if new_phone is not None and new_phone.strip() != "":
                 contact.phone = new_phone
             if new_email is not None and new_email.strip() != "":
                 contact.email = new_email
-            self.save_contacts()
+            self.index_contact(contact)
+            self.save_contacts('edit', contact)
             print("Контакт успешно обновлен.")
         else:
             print("Контакт не найден.")
 
+    @timed('contacts.delete')
     def delete_contact(self, contact_id):
         contact = self.get_contact_by_id(contact_id)
         if contact:
             self.contacts.remove(contact)
-            self.save_contacts()
+            self.unindex_contact(contact)
+            self.save_contacts('delete', contact)
             print("Контакт успешно удален.")
         else:
             print("Контакт не найден.")
 
     def import_contacts_from_csv(self, csv_file):
         try:
-            df = pd.read_csv(csv_file)
-            for _, row in df.iterrows():
-                self.add_contact(row['name'], row['phone'], row['email'])
+            stats = import_csv_in_chunks(csv_file, CONTACTS_FILE, self.normalize_contacts_chunk,
+                                         self.normalize_contact_row, self.persist_contacts_chunk)
             print("Контакты успешно импортированы из CSV.")
+            report_import(*stats)
+            return stats[0]
         except Exception as e:
             print(f"Ошибка при импорте контактов: {e}")
 
+    def normalize_contacts_chunk(self, df):
+        import pandas as pd
+        frame = pd.DataFrame({'name': df['name'],
+                              'phone': csv_column(df, 'phone'),
+                              'email': csv_column(df, 'email')})
+        return frame, frame['name'].str.strip().ne('')
+
+    def normalize_contact_row(self, row):
+        name = row.get('name') or ''
+        if not name.strip():
+            return None
+        return name, row.get('phone') or '', row.get('email') or ''
+
+    def persist_contacts_chunk(self, rows):
+        first_id = self.contacts.allocate_ids(len(rows))
+        new_contacts = [Contact(contact_id=contact_id, name=name, phone=phone or None, email=email or None)
+                        for contact_id, (name, phone, email) in zip(itertools.count(first_id), rows)]
+        with self.contacts.lock:
+            self.contacts.extend(new_contacts)
+            for contact in new_contacts:
+                self.index_contact(contact)
+        self.save_contacts('add', *new_contacts)
+        return len(new_contacts)
+
     def export_contacts_to_csv(self, csv_file):
         try:
-            data = [{'id': contact.contact_id,
-                     'name': contact.name,
-                     'phone': contact.phone,
-                     'email': contact.email} for contact in self.contacts]
-            df = pd.DataFrame(data)
-            df.to_csv(csv_file, index=False)
-            print("Контакты успешно экспортированы в CSV.")
+            rows = ((contact.contact_id, contact.name, contact.phone, contact.email) for contact in self.contacts)
+            count = write_csv_rows(csv_file, ('id', 'name', 'phone', 'email'), rows)
+            print(f"Контакты успешно экспортированы в CSV ({count}).")
+            return count
         except Exception as e:
             print(f"Ошибка при экспорте контактов: {e}")
 
 
+class FinanceColumns:
+    # Колоночное представление финансовых записей: суммы float64, даты datetime64[D],
+    # категории - коды в отсортированном списке названий. Отчёты считаются векторно масками и bincount.
+    UNIX_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+    def __init__(self, records, date_ordinals):
+        import numpy as np
+        records = list(records)
+        self.amounts = np.fromiter((record.amount for record in records), dtype=np.float64, count=len(records))
+        # Записи без даты отмечены отдельной маской: любое число дней, взятое как признак, - чья-то настоящая дата
+        self.dated = np.fromiter((date_ordinals[record.record_id] is not None for record in records),
+                                 dtype=bool, count=len(records))
+        days = np.fromiter((date_ordinals[record.record_id] - self.UNIX_EPOCH_ORDINAL if dated else 0
+                            for record, dated in zip(records, self.dated)), dtype=np.int64, count=len(records))
+        self.dates = days.astype('datetime64[D]')
+        names, codes = np.unique(np.array([record.category for record in records], dtype=object),
+                                 return_inverse=True)
+        self.category_codes = codes.reshape(-1)
+        self.category_names = names.tolist()
+
+    def period_mask(self, start_ordinal=None, end_ordinal=None):
+        import numpy as np
+        if start_ordinal is None and end_ordinal is None:
+            return np.ones(len(self.amounts), dtype=bool)
+        mask = self.dated.copy()
+        if start_ordinal is not None:
+            mask &= self.dates >= np.datetime64(start_ordinal - self.UNIX_EPOCH_ORDINAL, 'D')
+        if end_ordinal is not None:
+            mask &= self.dates <= np.datetime64(end_ordinal - self.UNIX_EPOCH_ORDINAL, 'D')
+        return mask
+
+    def totals(self, mask):
+        amounts = self.amounts[mask]
+        return float(amounts[amounts > 0].sum()), float(amounts[amounts < 0].sum())
+
+    def split_sums(self, mask, group_codes, group_count):
+        import numpy as np
+        amounts = self.amounts[mask]
+        codes = group_codes[mask]
+        income = np.bincount(codes, weights=np.where(amounts > 0, amounts, 0), minlength=group_count)
+        expense = np.bincount(codes, weights=np.where(amounts < 0, amounts, 0), minlength=group_count)
+        return income, expense
+
+    def by_category(self, mask):
+        import numpy as np
+        income, expense = self.split_sums(mask, self.category_codes, len(self.category_names))
+        counts = np.bincount(self.category_codes[mask], minlength=len(self.category_names))
+        return [(name, float(income[code]), float(expense[code]))
+                for code, name in enumerate(self.category_names) if counts[code]]
+
+    def by_month(self, mask):
+        import numpy as np
+        mask = mask & self.dated
+        months, month_codes = np.unique(self.dates[mask].astype('datetime64[M]'), return_inverse=True)
+        full_codes = np.zeros(len(self.amounts), dtype=np.int64)
+        full_codes[mask] = month_codes
+        income, expense = self.split_sums(mask, full_codes, len(months))
+        # Месяц datetime64[M] печатается как 'ГГГГ-ММ', в отчёте нужен 'ММ-ГГГГ'
+        return [(f"{str(month)[5:]}-{str(month)[:4]}", float(income[code]), float(expense[code]))
+                for code, month in enumerate(months)]
+
+
+class FenwickTree:
+    # Дерево Фенвика: прибавление к элементу и сумма префикса за O(log n)
+    def __init__(self, values):
+        self.tree = [0] + list(values)
+        for index in range(1, len(self.tree)):
+            parent = index + (index & -index)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[index]
+
+    def __len__(self):
+        return len(self.tree) - 1
+
+    def add(self, index, value):
+        index += 1
+        while index < len(self.tree):
+            self.tree[index] += value
+            index += index & -index
+
+    def prefix_sum(self, index):
+        # Сумма элементов [0, index]; при index < 0 - ноль
+        total = 0
+        index = min(index, len(self) - 1) + 1
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+
+def exact_amount(amount):
+    # Суммы копятся в Decimal по десятичной записи числа: после удаления записей итог совпадает
+    # с пересчётом с нуля, без хвостов вроде 0.20000000000000007
+    return decimal.Decimal(repr(amount))
+
+
+class FinanceAggregates:
+    # Накопительные доходы и расходы: по дням (деревья Фенвика) и по категориям за всё время.
+    # Деревья построены только по дням, где есть записи (отсортированный список days и bisect), поэтому
+    # опечатка в годе не раздувает их. Запись в уже известный день обновляет деревья за O(log D),
+    # новый день помечает их устаревшими, и они перестраиваются один раз при следующем отчёте.
+    def __init__(self):
+        self.day_totals = {}
+        self.days = []
+        self.income = FenwickTree([])
+        self.expense = FenwickTree([])
+        self.stale = False
+        self.undated_income = decimal.Decimal(0)
+        self.undated_expense = decimal.Decimal(0)
+        self.category_totals = {}
+
+    def rebuild_trees(self):
+        self.days = sorted(self.day_totals)
+        self.income = FenwickTree(self.day_totals[ordinal][0] for ordinal in self.days)
+        self.expense = FenwickTree(self.day_totals[ordinal][1] for ordinal in self.days)
+        self.stale = False
+
+    def add(self, ordinal, category, amount, sign=1):
+        value = exact_amount(amount) * sign
+        zero = decimal.Decimal(0)
+        income, expense = (value, zero) if amount > 0 else (zero, value)
+        totals = self.category_totals.setdefault(category, [zero, zero, 0])
+        totals[0] += income
+        totals[1] += expense
+        totals[2] += sign
+        if totals[2] == 0:
+            del self.category_totals[category]
+
+        if ordinal is None:
+            self.undated_income += income
+            self.undated_expense += expense
+            return
+        day = self.day_totals.get(ordinal)
+        if day is None:
+            day = self.day_totals[ordinal] = [zero, zero]
+            self.stale = True
+        day[0] += income
+        day[1] += expense
+        if not self.stale:
+            position = bisect.bisect_left(self.days, ordinal)
+            self.income.add(position, income)
+            self.expense.add(position, expense)
+
+    def remove(self, ordinal, category, amount):
+        self.add(ordinal, category, amount, sign=-1)
+
+    def period_totals(self, start_ordinal=None, end_ordinal=None):
+        if self.stale:
+            self.rebuild_trees()
+        if start_ordinal is None and end_ordinal is None:
+            return (float(self.income.prefix_sum(len(self.income)) + self.undated_income),
+                    float(self.expense.prefix_sum(len(self.expense)) + self.undated_expense))
+        low = 0 if start_ordinal is None else bisect.bisect_left(self.days, start_ordinal)
+        high = len(self.days) if end_ordinal is None else bisect.bisect_right(self.days, end_ordinal)
+        if high <= low:
+            return 0.0, 0.0
+        return (float(self.income.prefix_sum(high - 1) - self.income.prefix_sum(low - 1)),
+                float(self.expense.prefix_sum(high - 1) - self.expense.prefix_sum(low - 1)))
+
+    def category_rows(self):
+        return sorted((name, float(income), float(expense))
+                      for name, (income, expense, _) in self.category_totals.items())
+
+
+class QueryCache:
+    # LRU-кэш результатов запросов за период. Ключ начинается с (вид запроса, первый день, последний день),
+    # дни - порядковые номера, None - без границы. Изменение записи с датой d сбрасывает только результаты,
+    # чей период содержит d; запись без даты попадает лишь в запросы вообще без границ периода.
+    def __init__(self, name, max_size=QUERY_CACHE_SIZE):
+        self.name = name
+        self.max_size = max_size
+        self.entries = {}
+        self.signature = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        METRICS.register_cache(self)
+
+    def get(self, key, compute):
+        with self.lock:
+            if key in self.entries:
+                self.hits += 1
+                # Словарь помнит порядок вставки: переставленный в конец ключ вытесняется последним
+                result = self.entries[key] = self.entries.pop(key)
+                return result
+            self.misses += 1
+        result = compute()
+        with self.lock:
+            self.entries[key] = result
+            if len(self.entries) > self.max_size:
+                del self.entries[next(iter(self.entries))]
+        return result
+
+    def validate(self, signature):
+        # Подпись данных, которые меняются и в обход менеджера: при её смене сбрасывается всё
+        with self.lock:
+            if signature != self.signature:
+                self.entries.clear()
+                self.signature = signature
+
+    def invalidate(self, ordinal):
+        with self.lock:
+            stale = [key for key in self.entries
+                     if key[1] is None and key[2] is None
+                     or ordinal is not None and (key[1] is None or key[1] <= ordinal)
+                     and (key[2] is None or ordinal <= key[2])]
+            for key in stale:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def counters(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+def cached_query(kind):
+    # Запрос FinanceManager за период (и категорию) кэшируется в его query_cache.
+    # Категория в ключе без учёта регистра, как и в самом фильтре
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(self, start_ordinal=None, end_ordinal=None, category=None):
+            key = (kind, start_ordinal, end_ordinal, category.lower() if category else None)
+            args = (start_ordinal, end_ordinal, category) if category else (start_ordinal, end_ordinal)
+            return self.cached_result(key, lambda: function(self, *args))
+        return wrapper
+    return decorate
+
+
 class FinanceManager:
     def __init__(self):
-        self.records = []
+        self.records = RecordCollection('record_id')
+        self.columns = None
+        self.query_cache = QueryCache('finance')
         self.load_finance_records()
 
+    @timed('finance.load')
     def load_finance_records(self):
-        data = load_data(FINANCE_FILE, [])
-        self.records = [FinanceRecord(**record) for record in data]
+        self.records = open_collection(FINANCE_FILE, 'record_id', FinanceRecord, self.rebuild_indexes,
+                                       self.index_record)
+        self.columns = None
+        # Для SQLite индексы по дате и категории есть в самой базе, ленивая коллекция построит их при загрузке
+        if self.records.loaded and not self.records.indexed:
+            self.rebuild_indexes()
+
+    def warm_up(self):
+        # Колонки для numpy здесь не строятся: иначе меню импортировало бы numpy при каждом запуске
+        self.records.ensure_loaded()
+
+    def columnar(self):
+        # Колонки строятся при первом отчёте и сбрасываются при любом изменении записей; None - нет numpy
+        if not NUMPY_AVAILABLE:
+            return None
+        if self.columns is None:
+            self.records.ensure_loaded()
+            self.columns = FinanceColumns(self.records, self.date_ordinals)
+        return self.columns
+
+    @timed('finance.index')
+    def rebuild_indexes(self):
+        # Даты разбираются один раз; индекс - отсортированный список пар (номер дня, ID записи)
+        self.query_cache.clear()
+        self.date_ordinals = {}
+        self.aggregates = FinanceAggregates()
+        for record in self.records:
+            ordinal = parse_date(record.date)
+            self.date_ordinals[record.record_id] = ordinal
+            self.aggregates.add(ordinal, record.category, record.amount)
+        self.date_index = sorted((ordinal, record_id) for record_id, ordinal in self.date_ordinals.items()
+                                 if ordinal is not None)
+
+    def index_record(self, record):
+        self.invalidate_queries(record)
+        if self.records.indexed or not self.records.loaded:
+            return
+        self.columns = None
+        ordinal = parse_date(record.date)
+        self.date_ordinals[record.record_id] = ordinal
+        self.aggregates.add(ordinal, record.category, record.amount)
+        if ordinal is not None:
+            bisect.insort(self.date_index, (ordinal, record.record_id))
+
+    def unindex_record(self, record):
+        self.invalidate_queries(record)
+        if self.records.indexed or not self.records.loaded:
+            return
+        self.columns = None
+        ordinal = self.date_ordinals.pop(record.record_id, None)
+        self.aggregates.remove(ordinal, record.category, record.amount)
+        if ordinal is not None:
+            position = bisect.bisect_left(self.date_index, (ordinal, record.record_id))
+            del self.date_index[position]
+
+    def invalidate_queries(self, record):
+        # Дата разбирается, только если в кэше есть что сбрасывать
+        if self.query_cache.entries:
+            self.query_cache.invalidate(parse_date(record.date))
+
+    def cached_result(self, key, compute):
+        if self.records.indexed:
+            # Базу SQLite могут менять и другие процессы: кэш живёт, пока не изменились файлы базы
+            self.query_cache.validate(file_signature(STORAGE.db_path, STORAGE.db_path + '-wal'))
+        return self.query_cache.get(key, compute)
+
+    def sql_period(self, start_ordinal=None, end_ordinal=None, category=None):
+        conditions, params = [], []
+        if start_ordinal is not None:
+            conditions.append("date_ordinal >= ?")
+            params.append(start_ordinal)
+        if end_ordinal is not None:
+            conditions.append("date_ordinal <= ?")
+            params.append(end_ordinal)
+        if category:
+            conditions.append("category_key = ?")
+            params.append(category.lower())
+        return ' AND '.join(conditions), params
+
+    @timed('finance.filter')
+    @cached_query('records')
+    def records_in_period(self, start_ordinal=None, end_ordinal=None, category=None):
+        # Кортеж: один и тот же результат из кэша получают разные вызывающие
+        return tuple(self.iter_records_in_period(start_ordinal, end_ordinal, category))
+
+    def iter_records_in_period(self, start_ordinal=None, end_ordinal=None, category=None):
+        if self.records.indexed:
+            where, params = self.sql_period(start_ordinal, end_ordinal, category)
+            order_by = 'record_id' if start_ordinal is None and end_ordinal is None else 'date_ordinal, record_id'
+            yield from self.records.select(where, params, order_by)
+            return
+
+        self.records.ensure_loaded()
+        if start_ordinal is None and end_ordinal is None:
+            records = iter(self.records)
+        else:
+            # ID записей начинаются с 1, поэтому (день, 0) стоит раньше всех записей этого дня
+            low = 0 if start_ordinal is None else bisect.bisect_left(self.date_index, (start_ordinal, 0))
+            high = (len(self.date_index) if end_ordinal is None
+                    else bisect.bisect_left(self.date_index, (end_ordinal + 1, 0), low))
+            records = (self.records.get(self.date_index[position][1]) for position in range(low, high))
+        if category:
+            records = (record for record in records if record.category.lower() == category.lower())
+        yield from records
+
+    @timed('finance.totals')
+    @cached_query('totals')
+    def period_totals(self, start_ordinal=None, end_ordinal=None):
+        if not self.records.indexed:
+            self.records.ensure_loaded()
+            return self.aggregates.period_totals(start_ordinal, end_ordinal)
+        where, params = self.sql_period(start_ordinal, end_ordinal)
+        (income, expense), = self.records.execute(
+            "SELECT COALESCE(SUM(CASE WHEN amount > 0 THEN amount END), 0.0), "
+            "COALESCE(SUM(CASE WHEN amount < 0 THEN amount END), 0.0) FROM finance"
+            + (f" WHERE {where}" if where else ""), params)
+        return float(income), float(expense)
+
+    def grouped_totals(self, group_sql, start_ordinal=None, end_ordinal=None, extra_condition=None):
+        where, params = self.sql_period(start_ordinal, end_ordinal)
+        where = ' AND '.join(condition for condition in (where, extra_condition) if condition)
+        rows = self.records.execute(
+            f"SELECT {group_sql} AS name, "
+            "COALESCE(SUM(CASE WHEN amount > 0 THEN amount END), 0.0), "
+            "COALESCE(SUM(CASE WHEN amount < 0 THEN amount END), 0.0) FROM finance"
+            + (f" WHERE {where}" if where else "") + f" GROUP BY {group_sql} ORDER BY {group_sql}", params)
+        return [(name, float(income), float(expense)) for name, income, expense in rows]
+
+    @timed('finance.category_totals')
+    @cached_query('categories')
+    def category_totals(self, start_ordinal=None, end_ordinal=None):
+        if self.records.indexed:
+            return self.grouped_totals("category", start_ordinal, end_ordinal)
+        if start_ordinal is None and end_ordinal is None:
+            self.records.ensure_loaded()
+            return self.aggregates.category_rows()
+        columns = self.columnar()
+        if columns is None:
+            return self.loop_grouped_totals(lambda record, ordinal: record.category, start_ordinal, end_ordinal)
+        return columns.by_category(columns.period_mask(start_ordinal, end_ordinal))
+
+    @timed('finance.month_totals')
+    @cached_query('months')
+    def month_totals(self, start_ordinal=None, end_ordinal=None):
+        if self.records.indexed:
+            # Порядковый номер дня Python -> юлианский день SQLite; группируем по 'ГГГГ-ММ', выводим 'ММ-ГГГГ'
+            rows = self.grouped_totals("strftime('%Y-%m', date_ordinal + 1721424.5)", start_ordinal, end_ordinal,
+                                       "date_ordinal IS NOT NULL")
+            return [(f"{name[5:]}-{name[:4]}", income, expense) for name, income, expense in rows]
+        columns = self.columnar()
+        if columns is None:
+            rows = self.loop_grouped_totals(
+                lambda record, ordinal: datetime.date.fromordinal(ordinal).strftime("%Y-%m") if ordinal else None,
+                start_ordinal, end_ordinal)
+            return [(f"{name[5:]}-{name[:4]}", income, expense) for name, income, expense in rows]
+        return columns.by_month(columns.period_mask(start_ordinal, end_ordinal))
+
+    def loop_grouped_totals(self, group_key, start_ordinal=None, end_ordinal=None):
+        # Запасной расчёт без numpy: один проход по записям периода, группы по ключу group_key
+        groups = {}
+        for record in self.iter_records_in_period(start_ordinal, end_ordinal):
+            name = group_key(record, self.date_ordinals[record.record_id])
+            if name is None:
+                continue
+            totals = groups.setdefault(name, [0.0, 0.0])
+            totals[0 if record.amount > 0 else 1] += record.amount
+        return [(name, income, expense) for name, (income, expense) in sorted(groups.items())]
+
+    def parse_period(self, start_date=None, end_date=None):
+        start_ordinal = end_ordinal = None
+        if start_date:
+            start_ordinal = parse_date(start_date)
+            if start_ordinal is None:
+                print("Некорректный формат начальной даты.")
+                return None
+        if end_date:
+            end_ordinal = parse_date(end_date)
+            if end_ordinal is None:
+                print("Некорректный формат конечной даты.")
+                return None
+        return start_ordinal, end_ordinal
+
+    def dump_finance_records(self):
+        return (record.to_dict() for record in self.records)
 
-    def save_finance_records(self):
-        data = [record.__dict__ for record in self.records]
-        save_data(FINANCE_FILE, data)
+    def save_finance_records(self, op=None, *records):
+        if op is None:
+            save_data(FINANCE_FILE, self.dump_finance_records(), self.records.meta())
+        else:
+            append_data(FINANCE_FILE, op, 'record_id', [record.to_dict() for record in records],
+                        self.dump_finance_records, self.records.meta())
 
+    @timed('finance.get')
     def get_record_by_id(self, record_id):
-        for record in self.records:
-            if record.record_id == record_id:
-                return record
-        return None
+        return self.records.get(record_id)
 
+    @timed('finance.add')
     def add_finance_record(self, amount, category, date=None, description=None):
-        record_id = max([record.record_id for record in self.records], default=0) + 1
+        if not math.isfinite(amount):
+            raise ValueError("Сумма должна быть конечным числом.")
+        record_id = self.records.allocate_ids()
         new_record = FinanceRecord(record_id=record_id,
                                    amount=amount,
                                    category=category,
                                    date=date,
                                    description=description)
-        self.records.append(new_record)
-        self.save_finance_records()
+        with self.records.lock:
+            self.records.add(new_record)
+            self.index_record(new_record)
+        self.save_finance_records('add', new_record)
         print("Финансовая запись успешно добавлена.")
+        return new_record
 
+    @timed('finance.view_filtered')
     def view_filtered_records(self, start_date=None, end_date=None, category=None):
-        filtered_records = self.records
-
-        # Преобразование строковых дат в объекты datetime для корректного сравнения
-        def parse_date(date_str):
-            try:
-                return datetime.datetime.strptime(date_str, "%d-%m-%Y")
-            except:
-                return None
-
-        if start_date:
-            start_dt = parse_date(start_date)
-            if not start_dt:
-                print("Некорректный формат начальной даты.")
-                return
-            filtered_records = [record for record in filtered_records if parse_date(record.date) and parse_date(record.date) >= start_dt]
-
-        if end_date:
-            end_dt = parse_date(end_date)
-            if not end_dt:
-                print("Некорректный формат конечной даты.")
-                return
-            filtered_records = [record for record in filtered_records if parse_date(record.date) and parse_date(record.date) <= end_dt]
-
-        if category:
-            filtered_records = [record for record in filtered_records if record.category.lower() == category.lower()]
+        period = self.parse_period(start_date, end_date)
+        if period is None:
+            return
+        filtered_records = self.records_in_period(*period, category)
 
         if not filtered_records:
             print("Нет записей, соответствующих заданным критериям.")
@@ -403,76 +2743,123 @@ class FinanceManager:
         for record in filtered_records:
             print(f"{record.record_id}. {record.category} - {record.amount} (Дата: {record.date})")
 
+    @timed('finance.report')
     def generate_report(self, start_date=None, end_date=None):
-        # Преобразование строковых дат в объекты datetime для корректного сравнения
-        def parse_date(date_str):
-            try:
-                return datetime.datetime.strptime(date_str, "%d-%m-%Y")
-            except:
-                return None
-
-        filtered_records = self.records
-
-        if start_date:
-            start_dt = parse_date(start_date)
-            if not start_dt:
-                print("Некорректный формат начальной даты.")
-                return
-            filtered_records = [record for record in filtered_records if parse_date(record.date) and parse_date(record.date) >= start_dt]
-
-        if end_date:
-            end_dt = parse_date(end_date)
-            if not end_dt:
-                print("Некорректный формат конечной даты.")
-                return
-            filtered_records = [record for record in filtered_records if parse_date(record.date) and parse_date(record.date) <= end_dt]
-
-        total_income = sum(record.amount for record in filtered_records if record.amount > 0)
-        total_expense = sum(record.amount for record in filtered_records if record.amount < 0)
+        period = self.parse_period(start_date, end_date)
+        if period is None:
+            return
+        total_income, total_expense = self.period_totals(*period)
 
         print(f"Отчет за период с {start_date or 'начала'} по {end_date or 'конец'}:")
         print(f"Общий доход: {total_income}")
         print(f"Общие расходы: {total_expense}")
         print(f"Баланс: {total_income + total_expense}")
 
+    def print_grouped_report(self, title, rows):
+        if not rows:
+            print("Нет записей, соответствующих заданным критериям.")
+            return
+        print(title)
+        for name, income, expense in rows:
+            print(f"{name}: доход {income}, расходы {expense}, баланс {income + expense}")
+
+    def category_report(self, start_date=None, end_date=None):
+        period = self.parse_period(start_date, end_date)
+        if period is None:
+            return
+        self.print_grouped_report("Итоги по категориям:", self.category_totals(*period))
+
+    def monthly_report(self, start_date=None, end_date=None):
+        period = self.parse_period(start_date, end_date)
+        if period is None:
+            return
+        self.print_grouped_report("Итоги по месяцам:", self.month_totals(*period))
+
+    def apply_formula(self, expression, start_date=None, end_date=None, category=None):
+        # Формула над суммами записей периода, сумма записи в формуле - переменная amount
+        period = self.parse_period(start_date, end_date)
+        if period is None:
+            return
+        records = self.records_in_period(*period, category=category)
+        try:
+            results = evaluate_column(expression, [record.amount for record in records], name='amount')
+        except (ValueError, ArithmeticError, TypeError) as e:
+            print(f"Ошибка в формуле: {e}")
+            return
+        print(f"Записей: {len(records)}, итог по формуле: {math.fsum(results):.2f}")
+
+    @timed('finance.delete')
     def delete_finance_record(self, record_id):
         record = self.get_record_by_id(record_id)
         if record:
             self.records.remove(record)
-            self.save_finance_records()
+            self.unindex_record(record)
+            self.save_finance_records('delete', record)
             print("Финансовая запись успешно удалена.")
         else:
             print("Финансовая запись не найдена.")
 
     def import_finance_records_from_csv(self, csv_file):
         try:
-            df = pd.read_csv(csv_file)
-            for _, row in df.iterrows():
-                amount = float(row['amount'])
-                category = row['category']
-                date = row['date']
-                description = row['description']
-                self.add_finance_record(amount, category, date, description)
+            stats = import_csv_in_chunks(csv_file, FINANCE_FILE, self.normalize_finance_chunk,
+                                         self.normalize_finance_row, self.persist_finance_chunk)
             print("Финансовые записи успешно импортированы из CSV.")
+            report_import(*stats)
+            return stats[0]
         except Exception as e:
             print(f"Ошибка при импорте финансовых записей: {e}")
 
-    def export_finance_records_to_csv(self, csv_file):
+    def normalize_finance_chunk(self, df):
+        import pandas as pd
+        amounts = pd.to_numeric(df['amount'].str.strip(), errors='coerce')
+        dates, valid_dates = normalize_csv_dates(csv_column(df, 'date'))
+        frame = pd.DataFrame({'amount': amounts,
+                              'category': df['category'],
+                              'date': dates,
+                              'description': csv_column(df, 'description')})
+        return frame, amounts.abs().lt(float('inf')) & frame['category'].str.strip().ne('') & valid_dates
+
+    def normalize_finance_row(self, row):
+        try:
+            amount = float((row.get('amount') or '').strip())
+        except ValueError:
+            return None
+        category = row.get('category') or ''
+        date, valid_date = normalize_csv_date(row.get('date') or '')
+        if not math.isfinite(amount) or not category.strip() or not valid_date:
+            return None
+        return amount, category, date, row.get('description') or ''
+
+    def persist_finance_chunk(self, rows):
+        first_id = self.records.allocate_ids(len(rows))
+        new_records = [FinanceRecord(record_id=record_id, amount=float(amount), category=category,
+                                     date=date, description=description or None)
+                       for record_id, (amount, category, date, description) in zip(itertools.count(first_id), rows)]
+        # Пачка записей затрагивает много дат: кэш сбрасывается целиком, а не по записи
+        self.query_cache.clear()
+        with self.records.lock:
+            self.records.extend(new_records)
+            for record in new_records:
+                self.index_record(record)
+        self.save_finance_records('add', *new_records)
+        return len(new_records)
+
+    def export_finance_records_to_csv(self, csv_file, start_date=None, end_date=None, category=None):
+        period = self.parse_period(start_date, end_date)
+        if period is None:
+            return
         try:
-            data = [{'id': record.record_id,
-                     'amount': record.amount,
-                     'category': record.category,
-                     'date': record.date,
-                     'description': record.description} for record in self.records]
-            df = pd.DataFrame(data)
-            df.to_csv(csv_file, index=False)
-            print("Финансовые записи успешно экспортированы в CSV.")
+            records = self.iter_records_in_period(*period, category=category)
+            rows = ((record.record_id, record.amount, record.category, record.date, record.description)
+                    for record in records)
+            count = write_csv_rows(csv_file, ('id', 'amount', 'category', 'date', 'description'), rows)
+            print(f"Финансовые записи успешно экспортированы в CSV ({count}).")
+            return count
         except Exception as e:
             print(f"Ошибка при экспорте финансовых записей: {e}")
 
 
-def notes_menu():
-    manager = NoteManager()
+def notes_menu(manager):
     while True:
         print("\nУправление заметками:")
         print("1. Добавить новую заметку")
@@ -482,12 +2869,13 @@ def notes_menu():
         print("5. Удалить заметку")
         print("6. Экспорт заметок в CSV")
         print("7. Импорт заметок из CSV")
-        print("8. Назад")
+        print("8. Поиск заметок")
+        print("9. Назад")
 
         try:
             user_choice = int(input("Введите номер действия: "))
         except ValueError:
-            print("Некорректный ввод. Пожалуйста, введите число от 1 до 8.")
+            print("Некорректный ввод. Пожалуйста, введите число от 1 до 9.")
             continue
 
         if user_choice == 1:
@@ -522,7 +2910,7 @@ def notes_menu():
                 print("Некорректный ввод ID.")
 
         elif user_choice == 6:
-            csv_file = input("Введите имя CSV-файла для экспорта: ")
+            csv_file = input("Введите имя CSV-файла для экспорта (.gz - со сжатием): ")
             manager.export_notes_to_csv(csv_file)
 
         elif user_choice == 7:
@@ -530,13 +2918,18 @@ def notes_menu():
             manager.import_notes_from_csv(csv_file)
 
         elif user_choice == 8:
+            query = input("Введите слова для поиска: ")
+            manager.search_notes(query)
+
+        elif user_choice == 9:
+            manager.save_search_index()
+            flush_pending()
             break
         else:
             print("Нет такого варианта ответа. Попробуйте ещё раз.")
 
 
-def tasks_menu():
-    manager = TaskManager()
+def tasks_menu(manager):
     while True:
         print("\nУправление задачами:")
         print("1. Добавить новую задачу")
@@ -546,12 +2939,16 @@ def tasks_menu():
         print("5. Удалить задачу")
         print("6. Экспорт задач в CSV")
         print("7. Импорт задач из CSV")
-        print("8. Назад")
+        print("8. Просроченные задачи")
+        print("9. Задачи на сегодня")
+        print("10. Задачи на эту неделю")
+        print("11. Самые приоритетные задачи")
+        print("12. Назад")
 
         try:
             user_choice = int(input("Введите номер действия: "))
         except ValueError:
-            print("Некорректный ввод. Пожалуйста, введите число от 1 до 8.")
+            print("Некорректный ввод. Пожалуйста, введите число от 1 до 12.")
             continue
 
         if user_choice == 1:
@@ -591,21 +2988,38 @@ def tasks_menu():
                 print("Некорректный ввод ID.")
 
         elif user_choice == 6:
-            csv_file = input("Введите имя CSV-файла для экспорта задач: ")
-            manager.export_tasks_to_csv(csv_file)
+            csv_file = input("Введите имя CSV-файла для экспорта задач (.gz - со сжатием): ")
+            done_filter = input("Какие задачи выгрузить: 1 - все, 2 - невыполненные, 3 - выполненные: ")
+            manager.export_tasks_to_csv(csv_file, {'2': False, '3': True}.get(done_filter.strip()))
 
         elif user_choice == 7:
             csv_file = input('Введите имя CSV-файла для импорта задач: ')
             manager.import_tasks_from_csv(csv_file)
 
         elif user_choice == 8:
+            manager.list_overdue_tasks()
+
+        elif user_choice == 9:
+            manager.list_tasks_due_today()
+
+        elif user_choice == 10:
+            manager.list_tasks_due_this_week()
+
+        elif user_choice == 11:
+            try:
+                limit = int(input("Сколько задач показать: ") or 10)
+                manager.list_top_tasks(limit)
+            except ValueError:
+                print("Некорректный ввод числа.")
+
+        elif user_choice == 12:
+            flush_pending()
             break
         else:
             print("Нет такого варианта ответа. Попробуйте ещё раз.")
 
 
-def contacts_menu():
-    manager = ContactManager()
+def contacts_menu(manager):
     while True:
         print("\nУправление контактами:")
         print("1. Добавить новый контакт")
@@ -637,11 +3051,11 @@ def contacts_menu():
                 print("Контакт не найден.")
 
         elif user_choice == 3:
-            name = input("Введите имя для поиска: ")
-            contact = manager.get_contact_by_name(name)
-            if contact:
+            name = input("Введите имя или его часть для поиска: ")
+            contacts = manager.find_contacts(name)
+            for contact in contacts:
                 print(f"Найден контакт: {contact.name} (Телефон: {contact.phone}, Email: {contact.email})")
-            else:
+            if not contacts:
                 print("Контакт не найден.")
 
         elif user_choice == 4:
@@ -662,7 +3076,7 @@ def contacts_menu():
                 print("Некорректный ввод ID.")
 
         elif user_choice == 6:
-            csv_file = input("Введите имя CSV-файла для экспорта: ")
+            csv_file = input("Введите имя CSV-файла для экспорта (.gz - со сжатием): ")
             manager.export_contacts_to_csv(csv_file)
 
         elif user_choice == 7:
@@ -670,13 +3084,13 @@ def contacts_menu():
             manager.import_contacts_from_csv(csv_file)
 
         elif user_choice == 8:
+            flush_pending()
             break
         else:
             print("Нет такого варианта ответа. Попробуйте ещё раз.")
 
 
-def finance_menu():
-    manager = FinanceManager()
+def finance_menu(manager):
     while True:
         print("\nУправление финансами:")
         print("1. Добавить новую финансовую запись")
@@ -686,17 +3100,20 @@ def finance_menu():
         print("5. Сгенерировать отчёт за определённый период")
         print("6. Экспорт финансовых записей в CSV")
         print("7. Импорт финансовых записей из CSV")
-        print("8. Назад")
+        print("8. Итоги по категориям за период")
+        print("9. Итоги по месяцам за период")
+        print("10. Применить формулу к суммам за период")
+        print("11. Назад")
         try:
             user_choice = int(input("Введите номер действия: "))
         except ValueError:
-            print("Некорректный ввод. Пожалуйста, введите число от 1 до 8.")
+            print("Некорректный ввод. Пожалуйста, введите число от 1 до 11.")
             continue
 
         if user_choice == 1:
             try:
-                amount = float(input("Введите сумму операции"
-                                   " (положительное число для доходов, отрицательное для расходов): "))
+                amount = parse_amount(input("Введите сумму операции"
+                                          " (положительное число для доходов, отрицательное для расходов): "))
             except ValueError:
                 print("Некорректный ввод суммы.")
                 continue
@@ -755,34 +3172,255 @@ def finance_menu():
                                    end_date=end_target_date or None)
 
         elif user_choice == 6:
-            csv_file = input("Введите имя CSV-файла для экспорта: ")
-            manager.export_finance_records_to_csv(csv_file)
+            csv_file = input("Введите имя CSV-файла для экспорта (.gz - со сжатием): ")
+            start_target_date = input("Введите дату начала периода в формате 'ДД-ММ-ГГГГ' или оставьте пустым: ")
+            end_target_date = input("Введите дату конца периода в формате 'ДД-ММ-ГГГГ' или оставьте пустым: ")
+            category = input("Введите категорию или оставьте пустым: ")
+            manager.export_finance_records_to_csv(csv_file, start_date=start_target_date or None,
+                                                  end_date=end_target_date or None, category=category or None)
 
         elif user_choice == 7:
             csv_file = input("Введите имя CSV-файла для импорта: ")
             manager.import_finance_records_from_csv(csv_file)
 
-        elif user_choice == 8:
+        elif user_choice in (8, 9):
+            start_target_date = input("Введите дату начала периода в формате 'ДД-ММ-ГГГГ' или оставьте пустым: ")
+            end_target_date = input("Введите дату конца периода в формате 'ДД-ММ-ГГГГ' или оставьте пустым: ")
+            report = manager.category_report if user_choice == 8 else manager.monthly_report
+            report(start_date=start_target_date or None, end_date=end_target_date or None)
+
+        elif user_choice == 10:
+            expression = input("Введите формулу от суммы записи amount (например, amount * 0.87): ")
+            start_target_date = input("Введите дату начала периода в формате 'ДД-ММ-ГГГГ' или оставьте пустым: ")
+            end_target_date = input("Введите дату конца периода в формате 'ДД-ММ-ГГГГ' или оставьте пустым: ")
+            category = input("Введите категорию или оставьте пустым: ")
+            manager.apply_formula(expression, start_date=start_target_date or None,
+                                  end_date=end_target_date or None, category=category or None)
+
+        elif user_choice == 11:
+            flush_pending()
             break
         else:
             print("Нет такого варианта ответа. Попробуйте ещё раз.")
 
 
+class CalculatorError(ValueError):
+    pass
+
+
+def scalar_extreme(function):
+    # Встроенные min/max с одним аргументом перебирали бы его как последовательность
+    def apply(*args):
+        if len(args) < 2:
+            raise TypeError("min и max ожидают не меньше двух аргументов")
+        return function(args)
+    return apply
+
+
+CALC_CONSTANTS = {'pi': math.pi, 'e': math.e, 'tau': math.tau}
+CALC_FUNCTIONS = {name: getattr(math, name)
+                  for name in ('sqrt', 'exp', 'log', 'log10', 'log2', 'sin', 'cos', 'tan',
+                               'asin', 'acos', 'atan', 'floor', 'ceil', 'fabs')}
+
+CALC_FUNCTIONS.update(abs=abs, round=round, min=scalar_extreme(min), max=scalar_extreme(max))
+
+
+def limit_int(value):
+    # Целые Python не ограничены по размеру: слишком длинные числа считаются ошибкой, а не вешают программу
+    if isinstance(value, int) and value.bit_length() > CALC_MAX_INT_BITS:
+        raise CalculatorError("Слишком большое число.")
+    return value
+
+
+def checked_power(base, exponent):
+    # Размер результата оценивается до вычисления: 9**9**9 отклоняется сразу
+    if isinstance(base, int) and isinstance(exponent, int) and exponent > 0 and abs(base) > 1:
+        if exponent * math.log2(abs(base)) > CALC_MAX_INT_BITS:
+            raise CalculatorError("Слишком большая степень.")
+    return base ** exponent
+
+
+CALC_BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: checked_power,
+}
+CALC_UNARY_OPERATORS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+
+def vector_unary(function):
+    # Лишний позиционный аргумент ufunc numpy принял бы за массив для результата (out) и записал бы
+    # в него ответ, поэтому, как и функции math, обёртка принимает ровно один аргумент
+    def apply(x):
+        return function(x)
+    return apply
+
+
+def vector_extreme(function):
+    # min/max от двух и более аргументов, как встроенные min/max над числами: np.minimum/np.maximum
+    # двуместны, и третий аргумент стал бы массивом для результата
+    def apply(*args):
+        if len(args) < 2:
+            raise TypeError("min и max ожидают не меньше двух аргументов")
+        return functools.reduce(function, args)
+    return apply
+
+
+@functools.lru_cache(maxsize=1)
+def vector_functions():
+    # Те же функции для массивов numpy - для вычисления формулы по целой колонке
+    import numpy as np
+    functions = {name: vector_unary(getattr(np, name))
+                 for name in ('sqrt', 'exp', 'log10', 'log2', 'sin', 'cos', 'tan', 'floor', 'ceil', 'fabs')}
+    functions.update(asin=vector_unary(np.arcsin), acos=vector_unary(np.arccos), atan=vector_unary(np.arctan),
+                     abs=vector_unary(np.abs), min=vector_extreme(np.minimum), max=vector_extreme(np.maximum),
+                     round=lambda x, ndigits=0: np.round(x, ndigits),
+                     log=lambda x, base=None: np.log(x) if base is None else np.log(x) / np.log(base))
+    return functions
+
+
+class CompiledExpression:
+    # Выражение разбирается в AST один раз и превращается в дерево замыканий. Разрешены только числа,
+    # арифметика, переменные и функции из CALC_FUNCTIONS; поддеревья без переменных вычисляются сразу.
+    def __init__(self, text):
+        if len(text) > CALC_MAX_LENGTH:
+            raise CalculatorError("Слишком длинное выражение.")
+        try:
+            tree = ast.parse(text, mode='eval')
+        except SyntaxError:
+            raise CalculatorError("Некорректное выражение.")
+        if sum(1 for _ in ast.walk(tree)) > CALC_MAX_NODES:
+            raise CalculatorError("Слишком сложное выражение.")
+        self.variables = set()
+        self.run, _ = self.compile_node(tree.body)
+
+    def evaluate(self, variables=None, functions=CALC_FUNCTIONS):
+        return self.run(variables or {}, functions)
+
+    def compile_node(self, node):
+        # Возвращает (функция (переменные, функции) -> значение, признак константы)
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            value = node.value
+            return (lambda variables, functions: value), True
+
+        if isinstance(node, ast.Name):
+            name = node.id
+            if name in CALC_CONSTANTS:
+                value = CALC_CONSTANTS[name]
+                return (lambda variables, functions: value), True
+            self.variables.add(name)
+
+            def load(variables, functions):
+                if name not in variables:
+                    raise CalculatorError(f"Неизвестная переменная: {name}")
+                return variables[name]
+            return load, False
+
+        if isinstance(node, ast.BinOp) and type(node.op) in CALC_BINARY_OPERATORS:
+            apply = CALC_BINARY_OPERATORS[type(node.op)]
+            (left, left_constant), (right, right_constant) = self.compile_node(node.left), self.compile_node(node.right)
+            run = lambda variables, functions: limit_int(apply(left(variables, functions), right(variables, functions)))
+            return self.fold(run, left_constant and right_constant)
+
+        if isinstance(node, ast.UnaryOp) and type(node.op) in CALC_UNARY_OPERATORS:
+            apply = CALC_UNARY_OPERATORS[type(node.op)]
+            operand, constant = self.compile_node(node.operand)
+            return self.fold(lambda variables, functions: apply(operand(variables, functions)), constant)
+
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+                and node.func.id in CALC_FUNCTIONS and not node.keywords):
+            name = node.func.id
+            arguments = [self.compile_node(argument) for argument in node.args]
+            run = lambda variables, functions: limit_int(functions[name](
+                *[argument(variables, functions) for argument, _ in arguments]))
+            return self.fold(run, all(constant for _, constant in arguments))
+
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+            raise CalculatorError(f"Неизвестная функция: {node.func.id}")
+        raise CalculatorError(f"Недопустимый элемент выражения: {type(node).__name__}")
+
+    def fold(self, run, constant):
+        if not constant:
+            return run, False
+        value = run({}, CALC_FUNCTIONS)
+        return (lambda variables, functions: value), True
+
+
+@functools.lru_cache(maxsize=CALC_CACHE_SIZE)
+def compile_expression(text):
+    return CompiledExpression(text.strip())
+
+
+def evaluate_column(text, values, name='x', variables=None):
+    # Векторный режим: одно выражение над колонкой значений. С numpy выражение считается один раз
+    # над массивом, без numpy - по значению.
+    compiled = compile_expression(text)
+    if NUMPY_AVAILABLE:
+        import numpy as np
+        column = np.asarray(values, dtype=np.float64)
+        with np.errstate(all='ignore'):
+            result = compiled.evaluate(dict(variables or {}, **{name: column}), vector_functions())
+        return np.broadcast_to(np.asarray(result, dtype=np.float64), column.shape)
+    return [compiled.evaluate(dict(variables or {}, **{name: value})) for value in values]
+
+
+def split_assignment(text):
+    # 'имя = выражение' сохраняет результат в переменную калькулятора
+    match = re.match(r'\s*([A-Za-z_]\w*)\s*=(?!=)(.*)$', text)
+    if not match:
+        return None, text
+    name = match.group(1)
+    if name in CALC_CONSTANTS or name in CALC_FUNCTIONS:
+        raise CalculatorError(f"Имя {name} занято.")
+    return name, match.group(2)
+
+
 def calculator():
+    # Результат последнего вычисления доступен как ans
+    variables = {}
     while True:
         expression = input("\nВведите выражение для вычисления (или 'выход' для выхода): ")
         if expression.lower() == "выход":
             break
         try:
-            # Безопасный способ вычисления выражений
-            allowed_names = {"__builtins__": None}
-            result = eval(expression, allowed_names, {})
+            name, expression = split_assignment(expression)
+            result = compile_expression(expression).evaluate(variables)
+            variables['ans'] = result
+            if name:
+                variables[name] = result
             print(f"Результат: {result}")
-        except Exception as e:
+        except (ValueError, ArithmeticError, TypeError) as e:
             print(f"Ошибка: {e}")
 
 
+def show_stats():
+    # Попадания в кэш считаются всегда, задержки и ввод-вывод - только с PA_PROFILE=1
+    stats = METRICS.snapshot()
+    if not PROFILING:
+        print("Сбор задержек и объёма ввода-вывода выключен. Запустите программу с переменной окружения PA_PROFILE=1.")
+    elif not stats['operations']:
+        print("Операций пока не было.")
+    for name, operation in stats['operations'].items():
+        print(f"{name}: вызовов {operation['count']}, всего {operation['total_s']:.3f} с, "
+              f"p50 {operation['p50_ms']} мс, p95 {operation['p95_ms']} мс, p99 {operation['p99_ms']} мс, "
+              f"макс. {operation['max_ms']} мс")
+    for file_path, counters in stats['files'].items():
+        print(f"{file_path}: прочитано {counters['read']} байт, записано {counters['written']} байт")
+    for name, counters in stats['caches'].items():
+        print(f"Кэш запросов {name}: попаданий {counters['hits']}, промахов {counters['misses']}")
+
+
 def main_menu():
+    # Коллекции загружаются в фоне сразу при запуске и остаются в памяти между заходами в разделы
+    session = CommandSession()
+    session.start_loading()
     while True:
         print("\nДобро пожаловать в Персональный помощник!")
         print("Выберите действие:")
@@ -791,30 +3429,804 @@ def main_menu():
         print("3. Управление контактами")
         print("4. Управление финансовыми записями")
         print("5. Калькулятор")
-        print("6. Выход")
+        print("6. Статистика производительности")
+        print("7. Выход")
 
         try:
             user_choice = int(input("Введите номер действия: "))
         except ValueError:
-            print("Некорректный ввод. Пожалуйста, введите число от 1 до 6.")
+            print("Некорректный ввод. Пожалуйста, введите число от 1 до 7.")
             continue
 
         if user_choice == 1:
-            notes_menu()
+            notes_menu(session.revalidate('notes'))
+            session.checkpoint('notes')
         elif user_choice == 2:
-            tasks_menu()
+            tasks_menu(session.revalidate('tasks'))
+            session.checkpoint('tasks')
         elif user_choice == 3:
-            contacts_menu()
+            contacts_menu(session.revalidate('contacts'))
+            session.checkpoint('contacts')
         elif user_choice == 4:
-            finance_menu()
+            finance_menu(session.revalidate('finance'))
+            session.checkpoint('finance')
         elif user_choice == 5:
             calculator()
         elif user_choice == 6:
+            show_stats()
+        elif user_choice == 7:
+            session.close()
             print("Выход из программы. До свидания!")
             break
         else:
             print("Нет такого варианта ответа. Попробуйте ещё раз.")
 
 
-if __name__ == '__main__':
+class CommandError(ValueError):
+    pass
+
+
+class CommandParser(argparse.ArgumentParser):
+    # Ошибка разбора не завершает процесс: в пакетном режиме она становится ответом на одну команду
+    def error(self, message):
+        raise CommandError(message)
+
+
+class CommandSession:
+    # Менеджеры создаются при первой команде к коллекции и живут до конца сеанса:
+    # пакет команд читает каждый файл один раз и сбрасывает изменения на диск один раз в конце
+    MANAGERS = {
+        'notes': NoteManager,
+        'tasks': TaskManager,
+        'contacts': ContactManager,
+        'finance': FinanceManager,
+    }
+    FILES = {
+        'notes': NOTES_FILE,
+        'tasks': TASKS_FILE,
+        'contacts': CONTACTS_FILE,
+        'finance': FINANCE_FILE,
+    }
+    COLLECTIONS = {
+        'notes': 'notes',
+        'tasks': 'tasks',
+        'contacts': 'contacts',
+        'finance': 'records',
+    }
+
+    def __init__(self):
+        self.managers = {}
+        self.loading = {}
+        self.signatures = {}
+
+    def start_loading(self, names=None):
+        # Менеджеры открываются сразу, а их коллекции фоновый поток читает одну за другой: разбор JSON
+        # и построение индексов держат GIL, и отдельный поток на каждую лишь отодвинул бы готовность
+        # всех четырёх к концу общей загрузки. Добавление записи фоновую загрузку не ждёт
+        from concurrent.futures import ThreadPoolExecutor
+        names = [name for name in names or self.MANAGERS if name not in self.loading]
+        if not names:
+            return
+        collections = [self.collection(name) for name in names]
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='load')
+        for name, collection in zip(names, collections):
+            self.loading[name] = executor.submit(collection.ensure_loaded)
+        executor.shutdown(wait=False)
+
+    def collection(self, name):
+        return getattr(self.manager(name), self.COLLECTIONS[name])
+
+    def manager(self, name):
+        # Подпись снимается до того, как ленивый менеджер прочитает файл: изменение между ними
+        # лишь откроет коллекцию заново
+        if name not in self.managers:
+            self.signatures[name] = data_signature(self.FILES[name])
+            self.managers[name] = self.MANAGERS[name]()
+        return self.managers[name]
+
+    def revalidate(self, name):
+        # Менеджер из памяти годен, пока размер и время изменения файла совпадают с запомненными.
+        # Файл, изменённый другим процессом, открывается заново; у SQLite подписи нет, записи и так читаются запросами
+        manager = self.manager(name)
+        if data_signature(self.FILES[name]) != self.signatures[name]:
+            del self.managers[name]
+            manager = self.manager(name)
+        return manager
+
+    def refresh(self, name):
+        # Коллекция, которую изменил другой процесс, открывается заново; свои отложенные изменения
+        # перед этим сливаются с файлом
+        file_path = self.FILES[name]
+        if name not in self.managers or not changed_elsewhere(file_path):
+            return False
+        flush_pending(file_path)
+        del self.managers[name]
+        self.manager(name)
+        return True
+
+    def checkpoint(self, name):
+        # Свои изменения записываются сразу, чтобы новая подпись файла не выглядела чужим изменением
+        flush_pending(self.FILES[name])
+        self.signatures[name] = data_signature(self.FILES[name])
+
+    def run(self, argv):
+        # Сообщения менеджеров для человека уходят в stderr, stdout остаётся чистым JSON
+        with contextlib.redirect_stdout(sys.stderr):
+            return self.execute(command_parser().parse_args(argv))
+
+    def run_line(self, line):
+        return self.run(parse_command_line(line))
+
+    def execute(self, args):
+        if not hasattr(args, 'handler'):
+            raise CommandError("Не указана команда.")
+        return args.handler(self, args)
+
+    def close(self):
+        # Незагруженные коллекции не нужны, и выход ждёт только ту, что загружается сейчас
+        for future in self.loading.values():
+            future.cancel()
+        with contextlib.redirect_stdout(sys.stderr):
+            if 'notes' in self.managers:
+                self.managers['notes'].save_search_index()
+            flush_pending()
+
+
+def record_output(record):
+    if record is None:
+        raise CommandError("Запись не найдена.")
+    return record.to_dict()
+
+
+def period_arguments(manager, args):
+    period = manager.parse_period(args.start, args.end)
+    if period is None:
+        raise CommandError("Некорректный формат даты.")
+    return period
+
+
+def totals_output(rows):
+    return [{'name': name, 'income': income, 'expense': expense, 'balance': income + expense}
+            for name, income, expense in rows]
+
+
+def existing_record(get_record, record_id):
+    record = get_record(record_id)
+    if record is None:
+        raise CommandError("Запись не найдена.")
+    return record
+
+
+def cmd_notes_add(session, args):
+    return record_output(session.manager('notes').add_note(args.title, args.content))
+
+
+def cmd_notes_get(session, args):
+    return record_output(session.manager('notes').get_note_by_id(args.id))
+
+
+def cmd_notes_list(session, args):
+    return [note.to_dict() for note in session.manager('notes').notes]
+
+
+def cmd_notes_edit(session, args):
+    manager = session.manager('notes')
+    note = existing_record(manager.get_note_by_id, args.id)
+    manager.edit_note(args.id, note.title if args.title is None else args.title,
+                      note.content if args.content is None else args.content)
+    return note.to_dict()
+
+
+def cmd_notes_delete(session, args):
+    manager = session.manager('notes')
+    existing_record(manager.get_note_by_id, args.id)
+    manager.delete_note(args.id)
+    return {'deleted': args.id}
+
+
+def cmd_notes_search(session, args):
+    manager = session.manager('notes')
+    return [dict(manager.get_note_by_id(note_id).to_dict(), score=score)
+            for note_id, score in manager.get_search_index().search(args.query, args.limit)]
+
+
+def cmd_tasks_add(session, args):
+    return record_output(session.manager('tasks').add_task(args.title, args.description, args.priority, args.due))
+
+
+def cmd_tasks_get(session, args):
+    return record_output(session.manager('tasks').get_task_by_id(args.id))
+
+
+def cmd_tasks_list(session, args):
+    manager = session.manager('tasks')
+    agenda = {
+        'overdue': manager.overdue_tasks,
+        'today': manager.tasks_due_today,
+        'week': manager.tasks_due_this_week,
+        'top': lambda: manager.top_open_tasks(args.limit),
+    }
+    tasks = agenda[args.agenda]() if args.agenda else manager.tasks
+    return [task.to_dict() for task in tasks]
+
+
+def cmd_tasks_done(session, args):
+    manager = session.manager('tasks')
+    task = existing_record(manager.get_task_by_id, args.id)
+    manager.mark_task_as_done(args.id)
+    return task.to_dict()
+
+
+def cmd_tasks_edit(session, args):
+    manager = session.manager('tasks')
+    task = existing_record(manager.get_task_by_id, args.id)
+    manager.edit_task(args.id, args.title, args.description, args.priority, args.due)
+    return task.to_dict()
+
+
+def cmd_tasks_delete(session, args):
+    manager = session.manager('tasks')
+    existing_record(manager.get_task_by_id, args.id)
+    manager.delete_task(args.id)
+    return {'deleted': args.id}
+
+
+def cmd_contacts_add(session, args):
+    return record_output(session.manager('contacts').add_contact(args.name, args.phone, args.email))
+
+
+def cmd_contacts_get(session, args):
+    return record_output(session.manager('contacts').get_contact_by_id(args.id))
+
+
+def cmd_contacts_list(session, args):
+    return [contact.to_dict() for contact in session.manager('contacts').contacts]
+
+
+def cmd_contacts_find(session, args):
+    manager = session.manager('contacts')
+    if args.phone:
+        contact = manager.get_contact_by_phone(args.query)
+        return [contact.to_dict()] if contact else []
+    return [contact.to_dict() for contact in manager.find_contacts(args.query, args.limit)]
+
+
+def cmd_contacts_edit(session, args):
+    manager = session.manager('contacts')
+    contact = existing_record(manager.get_contact_by_id, args.id)
+    manager.edit_contact(args.id, args.name, args.phone, args.email)
+    return contact.to_dict()
+
+
+def cmd_contacts_delete(session, args):
+    manager = session.manager('contacts')
+    existing_record(manager.get_contact_by_id, args.id)
+    manager.delete_contact(args.id)
+    return {'deleted': args.id}
+
+
+def cmd_finance_add(session, args):
+    return record_output(session.manager('finance').add_finance_record(args.amount, args.category,
+                                                                       args.date, args.description))
+
+
+def cmd_finance_get(session, args):
+    return record_output(session.manager('finance').get_record_by_id(args.id))
+
+
+def cmd_finance_list(session, args):
+    manager = session.manager('finance')
+    return [record.to_dict() for record in
+            manager.records_in_period(*period_arguments(manager, args), category=args.category)]
+
+
+def cmd_finance_delete(session, args):
+    manager = session.manager('finance')
+    existing_record(manager.get_record_by_id, args.id)
+    manager.delete_finance_record(args.id)
+    return {'deleted': args.id}
+
+
+def cmd_finance_report(session, args):
+    manager = session.manager('finance')
+    period = period_arguments(manager, args)
+    if args.by == 'category':
+        return totals_output(manager.category_totals(*period))
+    if args.by == 'month':
+        return totals_output(manager.month_totals(*period))
+    income, expense = manager.period_totals(*period)
+    return {'income': income, 'expense': expense, 'balance': income + expense}
+
+
+def cmd_finance_formula(session, args):
+    manager = session.manager('finance')
+    records = manager.records_in_period(*period_arguments(manager, args), category=args.category)
+    results = evaluate_column(args.expression, [record.amount for record in records], name='amount')
+    return {'records': len(records), 'total': math.fsum(results)}
+
+
+# Методы импорта и экспорта CSV каждой коллекции
+CSV_METHODS = {
+    'notes': ('import_notes_from_csv', 'export_notes_to_csv'),
+    'tasks': ('import_tasks_from_csv', 'export_tasks_to_csv'),
+    'contacts': ('import_contacts_from_csv', 'export_contacts_to_csv'),
+    'finance': ('import_finance_records_from_csv', 'export_finance_records_to_csv'),
+}
+
+
+def cmd_export(session, args):
+    export = getattr(session.manager(args.collection), CSV_METHODS[args.collection][1])
+    count = export(args.file)
+    if count is None:
+        raise CommandError("Экспорт не удался.")
+    return {'exported': count}
+
+
+def cmd_import(session, args):
+    import_csv = getattr(session.manager(args.collection), CSV_METHODS[args.collection][0])
+    stats = import_csv(args.file)
+    if stats is None:
+        raise CommandError("Импорт не удался.")
+    return {name: stats[name] for name in ('imported', 'rejected', 'rejected_lines')}
+
+
+def cmd_calc(session, args):
+    return compile_expression(args.expression).evaluate()
+
+
+def cmd_stats(session, args):
+    # Статистика процесса, выполнившего команду: с запущенным сервером - статистика сервера
+    return METRICS.prometheus() if args.prometheus else METRICS.snapshot()
+
+
+def cmd_migrate_sqlite(session, args):
+    migrate_json_to_sqlite()
+    return {'migrated': True}
+
+
+# Действия, меняющие коллекцию: на сервере они выполняются по одному на коллекцию
+COMMAND_WRITE_ACTIONS = ('add', 'edit', 'delete', 'done', 'import')
+
+
+@functools.lru_cache(maxsize=None)
+def command_parser():
+    # Разбор строится при первой команде: меню и импорт модуля его не ждут
+    parser = CommandParser(prog='personal_assistant.py',
+                           description="Персональный помощник. Без аргументов запускается интерактивное меню.")
+    commands = parser.add_subparsers(metavar='команда')
+
+    def command(group, name, handler, help_text):
+        subparser = group.add_parser(name, help=help_text)
+        subparser.set_defaults(handler=handler, writes=name in COMMAND_WRITE_ACTIONS)
+        return subparser
+
+    def collection(name, help_text):
+        subparser = commands.add_parser(name, help=help_text)
+        subparser.set_defaults(collection=name)
+        group = subparser.add_subparsers(metavar='действие')
+        command(group, 'export', cmd_export, "экспорт в CSV (.gz - со сжатием)").add_argument('file')
+        command(group, 'import', cmd_import, "импорт из CSV").add_argument('file')
+        return group
+
+    def period(subparser):
+        subparser.add_argument('--from', dest='start', help="дата начала ДД-ММ-ГГГГ")
+        subparser.add_argument('--to', dest='end', help="дата конца ДД-ММ-ГГГГ")
+
+    notes = collection('notes', "заметки")
+    subparser = command(notes, 'add', cmd_notes_add, "добавить заметку")
+    subparser.add_argument('--title', required=True)
+    subparser.add_argument('--content', default='')
+    command(notes, 'get', cmd_notes_get, "заметка по ID").add_argument('id', type=int)
+    command(notes, 'list', cmd_notes_list, "все заметки")
+    subparser = command(notes, 'edit', cmd_notes_edit, "изменить заметку")
+    subparser.add_argument('id', type=int)
+    subparser.add_argument('--title')
+    subparser.add_argument('--content')
+    command(notes, 'delete', cmd_notes_delete, "удалить заметку").add_argument('id', type=int)
+    subparser = command(notes, 'search', cmd_notes_search, "полнотекстовый поиск")
+    subparser.add_argument('query')
+    subparser.add_argument('--limit', type=int, default=10)
+
+    tasks = collection('tasks', "задачи")
+    subparser = command(tasks, 'add', cmd_tasks_add, "добавить задачу")
+    subparser.add_argument('--title', required=True)
+    subparser.add_argument('--description', default='')
+    subparser.add_argument('--priority', default="Низкий")
+    subparser.add_argument('--due', help="срок ДД-ММ-ГГГГ, по умолчанию сегодня")
+    command(tasks, 'get', cmd_tasks_get, "задача по ID").add_argument('id', type=int)
+    subparser = command(tasks, 'list', cmd_tasks_list, "задачи целиком или повестка")
+    subparser.add_argument('--agenda', choices=('overdue', 'today', 'week', 'top'))
+    subparser.add_argument('--limit', type=int, default=10)
+    command(tasks, 'done', cmd_tasks_done, "отметить выполненной").add_argument('id', type=int)
+    subparser = command(tasks, 'edit', cmd_tasks_edit, "изменить задачу")
+    subparser.add_argument('id', type=int)
+    subparser.add_argument('--title')
+    subparser.add_argument('--description')
+    subparser.add_argument('--priority')
+    subparser.add_argument('--due')
+    command(tasks, 'delete', cmd_tasks_delete, "удалить задачу").add_argument('id', type=int)
+
+    contacts = collection('contacts', "контакты")
+    subparser = command(contacts, 'add', cmd_contacts_add, "добавить контакт")
+    subparser.add_argument('--name', required=True)
+    subparser.add_argument('--phone')
+    subparser.add_argument('--email')
+    command(contacts, 'get', cmd_contacts_get, "контакт по ID").add_argument('id', type=int)
+    command(contacts, 'list', cmd_contacts_list, "все контакты")
+    subparser = command(contacts, 'find', cmd_contacts_find, "поиск по имени или телефону")
+    subparser.add_argument('query')
+    subparser.add_argument('--phone', action='store_true', help="искать по номеру телефона")
+    subparser.add_argument('--limit', type=int, default=20)
+    subparser = command(contacts, 'edit', cmd_contacts_edit, "изменить контакт")
+    subparser.add_argument('id', type=int)
+    subparser.add_argument('--name')
+    subparser.add_argument('--phone')
+    subparser.add_argument('--email')
+    command(contacts, 'delete', cmd_contacts_delete, "удалить контакт").add_argument('id', type=int)
+
+    finance = collection('finance', "финансовые записи")
+    subparser = command(finance, 'add', cmd_finance_add, "добавить запись")
+    subparser.add_argument('--amount', type=parse_amount, required=True)
+    subparser.add_argument('--category', required=True)
+    subparser.add_argument('--date')
+    subparser.add_argument('--description')
+    command(finance, 'get', cmd_finance_get, "запись по ID").add_argument('id', type=int)
+    subparser = command(finance, 'list', cmd_finance_list, "записи за период")
+    period(subparser)
+    subparser.add_argument('--category')
+    command(finance, 'delete', cmd_finance_delete, "удалить запись").add_argument('id', type=int)
+    subparser = command(finance, 'report', cmd_finance_report, "итоги за период")
+    period(subparser)
+    subparser.add_argument('--by', choices=('category', 'month'))
+    subparser = command(finance, 'formula', cmd_finance_formula, "формула от суммы amount по записям периода")
+    subparser.add_argument('expression')
+    period(subparser)
+    subparser.add_argument('--category')
+
+    command(commands, 'calc', cmd_calc, "вычислить выражение").add_argument('expression')
+    subparser = command(commands, 'stats', cmd_stats, "попадания в кэш, задержки операций и объём ввода-вывода (последние - с PA_PROFILE=1)")
+    subparser.add_argument('--prometheus', action='store_true', help="в текстовом формате Prometheus")
+    command(commands, 'migrate-sqlite', cmd_migrate_sqlite, "перенести JSON-файлы в SQLite").set_defaults(local=True)
+    subparser = commands.add_parser('batch', help="выполнить команды из файла или stdin (по одной в строке)")
+    subparser.add_argument('file', nargs='?', default='-')
+    subparser.set_defaults(batch=True, local=True)
+    subparser = commands.add_parser('serve', help="запустить сервер с данными в памяти")
+    subparser.add_argument('--address', default=DAEMON_ADDRESS,
+                           help="путь к Unix-сокету или хост:порт, по умолчанию PA_DAEMON или assistant.sock")
+    subparser.set_defaults(serve=True, local=True)
+    commands.add_parser('menu', help="интерактивное меню").set_defaults(menu=True, local=True)
+    return parser
+
+
+def command_result(run, *args):
+    try:
+        return {'ok': True, 'result': run(*args)}
+    except (ValueError, ArithmeticError, TypeError, OSError, sqlite3.Error) as e:
+        return {'ok': False, 'error': str(e)}
+    except SystemExit:
+        # argparse завершает процесс после вывода справки (-h)
+        return {'ok': False, 'error': "Справка выводится только при запуске из командной строки."}
+
+
+def parse_command_line(line):
+    # Команда в синтаксисе командной строки или JSON-массив аргументов
+    line = line.strip()
+    if line.startswith('['):
+        argv = json.loads(line)
+        if not isinstance(argv, list) or not all(isinstance(arg, str) for arg in argv):
+            raise CommandError("Ожидается JSON-массив строк.")
+        return argv
+    return shlex.split(line)
+
+
+def resolve_client_paths(argv):
+    # Путь к CSV отсчитывается от текущего каталога клиента, а не сервера: серверу передаётся абсолютный путь
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            args = command_parser().parse_args(argv)
+    except (CommandError, SystemExit):
+        return argv
+    if getattr(args, 'batch', False) or not getattr(args, 'file', None):
+        return argv
+    argv = list(argv)
+    position = len(argv) - 1 - argv[::-1].index(args.file)
+    argv[position] = os.path.abspath(args.file)
+    return argv
+
+
+def client_request(line):
+    # Строка команды для сервера; неразобранная строка уходит как есть, и ошибку вернёт сервер
+    try:
+        argv = parse_command_line(line)
+    except ValueError:
+        return line
+    return json.dumps(resolve_client_paths(argv), ensure_ascii=False)
+
+
+def batch_lines(file_name):
+    # Пустые строки и строки с # пропускаются
+    with (contextlib.nullcontext(sys.stdin) if file_name == '-' else open(file_name, encoding='utf-8')) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line
+
+
+def parse_daemon_address(address):
+    # хост:порт - TCP-сокет (пустой хост - localhost), иначе путь к Unix-сокету
+    host, separator, port = address.rpartition(':')
+    if not separator or not port.isdigit():
+        return address
+    return host or '127.0.0.1', int(port)
+
+
+class DaemonClient:
+    def __init__(self, connection):
+        self.connection = connection
+        self.stream = connection.makefile('rwb')
+
+    def request(self, line):
+        self.stream.write(line.encode('utf-8') + b'\n')
+        self.stream.flush()
+        response = self.stream.readline()
+        if not response:
+            raise ConnectionError("Сервер закрыл соединение.")
+        return json.loads(response)
+
+    def close(self):
+        self.stream.close()
+        self.connection.close()
+
+
+def connect_daemon(address=DAEMON_ADDRESS):
+    # None - сервер не запущен, тогда команды выполняются в своём процессе
+    if not address:
+        return None
+    target = parse_daemon_address(address)
+    if isinstance(target, str) and not os.path.exists(target):
+        return None
+    import socket
+    connection = socket.socket(socket.AF_UNIX if isinstance(target, str) else socket.AF_INET)
+    try:
+        connection.connect(target)
+    except OSError:
+        connection.close()
+        return None
+    return DaemonClient(connection)
+
+
+class CollectionLock:
+    # Чтения коллекции идут параллельно, изменение ждёт их окончания и выполняется одно.
+    # Пока изменение ждёт, новые чтения не начинаются, иначе поток чтений задержал бы его надолго
+    def __init__(self):
+        import asyncio
+        self.changed = asyncio.Condition()
+        self.readers = 0
+        self.writers_waiting = 0
+        self.writing = False
+
+    @contextlib.asynccontextmanager
+    async def read(self):
+        async with self.changed:
+            await self.changed.wait_for(lambda: not self.writing and not self.writers_waiting)
+            self.readers += 1
+        try:
+            yield
+        finally:
+            async with self.changed:
+                self.readers -= 1
+                self.changed.notify_all()
+
+    @contextlib.asynccontextmanager
+    async def write(self):
+        async with self.changed:
+            self.writers_waiting += 1
+            try:
+                await self.changed.wait_for(lambda: not self.writing and not self.readers)
+            finally:
+                self.writers_waiting -= 1
+            self.writing = True
+        try:
+            yield
+        finally:
+            async with self.changed:
+                self.writing = False
+                self.changed.notify_all()
+
+
+class AssistantDaemon:
+    # Сервер держит менеджеры всех коллекций в памяти, принимает команды CLI построчно (JSON Lines)
+    # и выполняет их в пуле потоков под блокировкой своей коллекции
+    def __init__(self, address):
+        self.address = address
+        # По TCP подключиться может любой локальный пользователь, поэтому файлы через такой сервер не читаются
+        # и не пишутся
+        self.network = not isinstance(parse_daemon_address(address), str)
+        self.session = CommandSession()
+        self.locks = {name: CollectionLock() for name in CommandSession.FILES}
+
+    def warm_up(self):
+        # Фоновая загрузка и этот поток вместе загружают коллекции целиком до приёма команд
+        self.session.start_loading()
+        for name in CommandSession.FILES:
+            self.prepare(self.session.manager(name))
+
+    def prepare(self, manager):
+        # Всё, что менеджер строит лениво, строится заранее, чтобы параллельные чтения ничего не меняли
+        manager.warm_up()
+        if isinstance(manager, FinanceManager) and not manager.records.indexed:
+            manager.columnar()
+
+    def refresh(self, name):
+        if self.session.refresh(name):
+            self.prepare(self.session.manager(name))
+
+    def parse_request(self, line):
+        args = command_parser().parse_args(parse_command_line(line.decode('utf-8')))
+        if getattr(args, 'local', False) or not hasattr(args, 'handler'):
+            raise CommandError("Команда недоступна через сервер.")
+        if self.network and hasattr(args, 'file'):
+            raise CommandError("Импорт и экспорт через TCP-сервер недоступны: выполните команду с PA_DAEMON=.")
+        return args
+
+    async def dispatch(self, line):
+        import asyncio
+        parsed = command_result(self.parse_request, line)
+        if not parsed['ok']:
+            return parsed
+        args = parsed['result']
+        name = getattr(args, 'collection', None)
+        lock = self.locks.get(name)
+        if lock is None:
+            guard = contextlib.nullcontext()
+        else:
+            # Файл коллекции изменил другой процесс (например, меню): она перечитывается до выполнения команды
+            if await asyncio.to_thread(changed_elsewhere, CommandSession.FILES[name]):
+                async with lock.write():
+                    await asyncio.to_thread(self.refresh, name)
+            guard = lock.write() if args.writes else lock.read()
+        async with guard:
+            return await asyncio.to_thread(command_result, self.session.execute, args)
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    writer.write(json.dumps({'ok': False, 'error': "Слишком длинная команда."},
+                                            ensure_ascii=False).encode('utf-8') + b'\n')
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                result = await self.dispatch(line)
+                writer.write(json.dumps(result, ensure_ascii=False).encode('utf-8') + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def flush_periodically(self):
+        # Для журнала изменения пишет таймер очереди, снимки JSON и SQLite сбрасываются здесь
+        import asyncio
+        while True:
+            await asyncio.sleep(DAEMON_FLUSH_INTERVAL)
+            for name, lock in self.locks.items():
+                async with lock.write():
+                    await asyncio.to_thread(flush_pending, CommandSession.FILES[name])
+
+    async def start_server(self):
+        import asyncio
+        target = parse_daemon_address(self.address)
+        if not isinstance(target, str):
+            return await asyncio.start_server(self.handle_client, *target, limit=DAEMON_MAX_REQUEST)
+        if not hasattr(asyncio, 'start_unix_server'):
+            raise CommandError("Unix-сокеты недоступны, укажите адрес в виде хост:порт.")
+        if os.path.exists(target):
+            # Сокет остался от завершившегося сервера; обычный файл не трогаем
+            if not stat.S_ISSOCK(os.stat(target).st_mode):
+                raise CommandError(f"Файл {target} не является сокетом.")
+            os.remove(target)
+        return await asyncio.start_unix_server(self.handle_client, target, limit=DAEMON_MAX_REQUEST)
+
+    async def serve(self):
+        import asyncio
+        import signal
+        client = connect_daemon(self.address)
+        if client is not None:
+            client.close()
+            raise CommandError(f"Сервер уже запущен: {self.address}")
+        await asyncio.to_thread(self.warm_up)
+        server = await self.start_server()
+        stopped = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signal_number, stopped.set)
+            except NotImplementedError:
+                pass
+        flusher = asyncio.create_task(self.flush_periodically())
+        print(f"Сервер запущен: {self.address}")
+        try:
+            async with server:
+                await stopped.wait()
+        finally:
+            flusher.cancel()
+            target = parse_daemon_address(self.address)
+            if isinstance(target, str) and os.path.exists(target):
+                os.remove(target)
+            self.session.close()
+            print("Сервер остановлен.")
+
+
+def run_daemon(address):
+    import asyncio
+    try:
+        asyncio.run(AssistantDaemon(address).serve())
+    except CommandError as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def run_batch(file_name, client=None):
+    # Ответы выводятся JSON Lines, по одному на команду, в порядке команд; с запущенным сервером
+    # строки пакета передаются ему с путями к файлам, разрешёнными в каталоге клиента
+    session = CommandSession()
+    failed = 0
+    try:
+        for line in batch_lines(file_name):
+            result = client.request(client_request(line)) if client else command_result(session.run_line, line)
+            failed += not result['ok']
+            print(json.dumps(result, ensure_ascii=False))
+    finally:
+        session.close()
+    return 1 if failed else 0
+
+
+def run_menu():
+    # Меню работает с файлами напрямую. Запущенный сервер замечает его изменения по версии в штампе файла
+    # и перечитывает коллекцию, а записи обоих процессов сливаются под блокировкой файла
     main_menu()
+    return 0
+
+
+def run_cli(argv):
+    if not argv:
+        return run_menu()
+    try:
+        args = command_parser().parse_args(argv)
+    except CommandError as e:
+        command_parser().print_usage(sys.stderr)
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 2
+    if getattr(args, 'menu', False):
+        return run_menu()
+    if getattr(args, 'serve', False):
+        return run_daemon(args.address)
+    client = None if getattr(args, 'local', False) and not getattr(args, 'batch', False) else connect_daemon()
+    try:
+        if getattr(args, 'batch', False):
+            return run_batch(args.file, client)
+        if client is not None:
+            result = client.request(json.dumps(resolve_client_paths(argv), ensure_ascii=False))
+        else:
+            session = CommandSession()
+            try:
+                result = command_result(session.run, argv)
+            finally:
+                session.close()
+    finally:
+        if client is not None:
+            client.close()
+    print(json.dumps(result, ensure_ascii=False))
+    return 0 if result['ok'] else 1
+
+
+if __name__ == '__main__':
+    if CPROFILE_FILE:
+        start_cprofile(CPROFILE_FILE)
+    sys.exit(run_cli(sys.argv[1:]))
@@ -0,0 +1,109 @@
+import os
+import sys
+import math
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import personal_assistant as pa
+
+
+# Значения из области определения каждой функции: (выражение, значения x)
+PARITY_CASES = {
+    'sqrt': ('sqrt(x)', [0.0, 2.0, 9.5]),
+    'exp': ('exp(x)', [-1.5, 0.0, 3.0]),
+    'log': ('log(x) + log(x, 2)', [0.5, 1.0, 100.0]),
+    'log10': ('log10(x)', [0.1, 1.0, 1000.0]),
+    'log2': ('log2(x)', [0.25, 1.0, 1024.0]),
+    'sin': ('sin(x)', [-2.0, 0.0, 1.0]),
+    'cos': ('cos(x)', [-2.0, 0.0, 1.0]),
+    'tan': ('tan(x)', [-1.0, 0.0, 0.5]),
+    'asin': ('asin(x)', [-1.0, 0.0, 0.5]),
+    'acos': ('acos(x)', [-1.0, 0.0, 0.5]),
+    'atan': ('atan(x)', [-10.0, 0.0, 2.0]),
+    'floor': ('floor(x)', [-1.5, 0.0, 2.7]),
+    'ceil': ('ceil(x)', [-1.5, 0.0, 2.2]),
+    'fabs': ('fabs(x)', [-3.5, 0.0, 2.0]),
+    'abs': ('abs(x)', [-3.5, 0.0, 2.0]),
+    'round': ('round(x) + round(x, 2)', [-1.256, 0.5, 2.5]),
+    'min': ('min(x, 0) + min(x, 0, 5, -1)', [-3.0, 0.0, 7.0]),
+    'max': ('max(x, 0) + max(x, 0, x, 5)', [-3.0, 0.0, 7.0]),
+}
+
+
+class SandboxTest(unittest.TestCase):
+    # Всё, кроме чисел, арифметики, переменных и функций из CALC_FUNCTIONS, отклоняется ещё при разборе
+    def assertRejected(self, text):
+        with self.assertRaises(pa.CalculatorError):
+            pa.CompiledExpression(text).evaluate({'x': 1})
+
+    def test_attribute_access(self):
+        self.assertRejected('x.__class__')
+        self.assertRejected('(1).real')
+
+    def test_dunder_names(self):
+        self.assertRejected('__import__("os")')
+        self.assertRejected('__builtins__')
+
+    def test_unknown_calls(self):
+        self.assertRejected('open("x")')
+        self.assertRejected('eval("1")')
+        self.assertRejected('sqrt.__call__(4)')
+
+    def test_other_syntax(self):
+        for text in ('[x]', 'lambda: 1', 'x if x else 1', '"text"', 'x[0]', '(y := 1)'):
+            with self.subTest(text=text):
+                self.assertRejected(text)
+
+    def test_oversized_expressions(self):
+        self.assertRejected('1' + ' ' * pa.CALC_MAX_LENGTH)
+        self.assertRejected('+'.join(['x'] * (pa.CALC_MAX_NODES // 2)))
+        self.assertEqual(pa.CompiledExpression('+'.join(['x'] * 10)).evaluate({'x': 2}), 20)
+
+    def test_huge_powers(self):
+        for text in ('9**9**9', '2**5000', '(x + 1)**100000', '(10**1000)**5'):
+            with self.subTest(text=text):
+                self.assertRejected(text)
+        self.assertEqual(pa.CompiledExpression('2**100').evaluate(), 2 ** 100)
+
+    def test_min_max_need_two_arguments(self):
+        for text in ('min(x)', 'max(x)'):
+            with self.subTest(text=text):
+                with self.assertRaises(TypeError):
+                    pa.CompiledExpression(text).evaluate({'x': 1})
+
+
+@unittest.skipUnless(pa.NUMPY_AVAILABLE, "numpy не установлен")
+class VectorParityTest(unittest.TestCase):
+    # Формула над колонкой numpy даёт то же, что и поэлементное вычисление функциями CALC_FUNCTIONS
+    def test_every_function(self):
+        self.assertEqual(set(PARITY_CASES), set(pa.CALC_FUNCTIONS))
+        self.assertEqual(set(pa.vector_functions()), set(pa.CALC_FUNCTIONS))
+        for name, (text, values) in PARITY_CASES.items():
+            with self.subTest(function=name):
+                compiled = pa.CompiledExpression(text)
+                expected = [compiled.evaluate({'x': value}) for value in values]
+                result = pa.evaluate_column(text, values)
+                for got, want in zip(result, expected):
+                    self.assertTrue(math.isclose(got, want, rel_tol=1e-12, abs_tol=1e-12), (got, want))
+
+    def test_column_not_mutated(self):
+        import numpy as np
+        column = np.array([-3.0, 1.0, 7.0])
+        result = pa.evaluate_column('max(amount, 0, amount)', column, 'amount')
+        self.assertEqual(list(column), [-3.0, 1.0, 7.0])
+        self.assertEqual(list(result), [0.0, 1.0, 7.0])
+        self.assertEqual(list(pa.evaluate_column('min(amount, 0, 5)', column, 'amount')), [-3.0, 0.0, 0.0])
+
+    def test_extra_arguments_rejected(self):
+        import numpy as np
+        column = np.array([4.0, 9.0])
+        for text in ('sqrt(x, x)', 'abs(x, x)', 'min(x)'):
+            with self.subTest(text=text):
+                with self.assertRaises(TypeError):
+                    pa.evaluate_column(text, column)
+        self.assertEqual(list(column), [4.0, 9.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import io
+import os
+import sys
+import tempfile
+import unittest
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import personal_assistant as pa
+
+
+NAMES = ['Иван Петров', 'Пётр Иванов', 'Анна Смирнова', 'Иванов', 'Maria  GARCÍA', 'Straße Müller']
+
+
+class NormalizePhoneTest(unittest.TestCase):
+    def test_russian_numbers(self):
+        for phone in ('+7 (900) 123-45-67', '8 900 123 45 67', '9001234567', '7-900-123-45-67'):
+            with self.subTest(phone=phone):
+                self.assertEqual(pa.normalize_phone(phone), '79001234567')
+
+    def test_other_numbers(self):
+        self.assertEqual(pa.normalize_phone('+44 20 7946 0958'), '442079460958')
+        self.assertEqual(pa.normalize_phone('112'), '112')
+        self.assertEqual(pa.normalize_phone(''), '')
+        self.assertEqual(pa.normalize_phone(None), '')
+
+
+class ContactIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = pa.ContactIndex()
+        self.contacts = [pa.Contact(contact_id, name, f"8 900 000-00-{contact_id:02d}")
+                         for contact_id, name in enumerate(NAMES, 1)]
+        for contact in self.contacts:
+            self.index.add(contact)
+
+    def found(self, query):
+        return [contact_id for contact_id, _ in self.index.search(query)]
+
+    def test_phone_lookup(self):
+        self.assertEqual(self.index.find_phone('+7 (900) 000-00-03'), [3])
+        self.assertEqual(self.index.find_phone('9000000003'), [3])
+        self.assertEqual(self.index.find_phone('8 900 000-00-99'), [])
+
+    def test_casefolded_name_lookup(self):
+        self.assertEqual(self.index.find_name('иван  ПЕТРОВ'), [1])
+        self.assertEqual(self.index.find_name(' maria garcía '), [5])
+        self.assertEqual(self.index.find_name('STRASSE MÜLLER'), [6])
+        self.assertEqual(self.index.find_name('Иван'), [])
+
+    def test_typo_in_one_word(self):
+        # Запрос сравнивается и с отдельными словами: у "Ивн" со всем именем "Иван Петров" сходство 0.235
+        self.assertEqual(self.found('Ивн')[0], 1)
+        self.assertIn(1, self.found('петрв'))
+        self.assertEqual(self.found('Смирнва'), [3])
+        self.assertEqual(self.found('гарсия'), [])
+        self.assertEqual(self.found('garcia')[0], 5)
+
+    def test_ranking(self):
+        # Точное совпадение всего имени выше совпадения слова, слово - не выше начала слова
+        scores = dict(self.index.search('Иванов'))
+        self.assertEqual(scores[4], 1.0)
+        self.assertEqual(scores[2], pa.ContactIndex.PREFIX_SCORE)
+        self.assertLess(scores[1], scores[2])
+        self.assertEqual(self.found('иван петров')[0], 1)
+        self.assertEqual(self.found('xyz'), [])
+        self.assertEqual(self.found('  '), [])
+
+    def test_remove(self):
+        for contact in self.contacts:
+            self.index.remove(contact)
+        self.assertEqual((self.index.trigrams, self.index.by_name, self.index.by_phone, self.index.variant_sizes),
+                         ({}, {}, {}, {}))
+
+    def test_many_words(self):
+        contact = pa.Contact(100, ' '.join(f"слово{number}" for number in range(40)) + ' Ивановский')
+        self.index.add(contact)
+        self.assertIn(100, self.found(contact.name))
+        self.index.remove(contact)
+        self.assertNotIn(100, self.found(contact.name))
+
+
+class ContactManagerTest(unittest.TestCase):
+    # Поиск менеджера идёт через индекс (или SQL) и видит правки контакта
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+        self.output = contextlib.redirect_stdout(io.StringIO())
+        self.output.__enter__()
+        self.manager = pa.ContactManager()
+        self.contact = self.manager.add_contact('Евлампий Кукушкин', '+7 (911) 555-01-02')
+
+    def tearDown(self):
+        self.output.__exit__(None, None, None)
+        pa.flush_pending()
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def test_lookups_follow_edits(self):
+        contact_id = self.contact.contact_id
+        self.assertEqual(self.manager.get_contact_by_phone('89115550102').contact_id, contact_id)
+        self.assertEqual(self.manager.get_contact_by_name('евлампий КУКУШКИН').contact_id, contact_id)
+        self.assertIn(contact_id, [contact.contact_id for contact in self.manager.find_contacts('Евлмп')])
+        self.manager.edit_contact(contact_id, new_name='Евлампия Соловьёва', new_phone='8 911 555 01 03')
+        self.assertIsNone(self.manager.get_contact_by_phone('89115550102'))
+        self.assertIsNone(self.manager.get_contact_by_name('Евлампий Кукушкин'))
+        self.assertEqual(self.manager.get_contact_by_phone('+79115550103').contact_id, contact_id)
+        found = [contact.contact_id for contact in self.manager.find_contacts('Соловёва')]
+        self.assertIn(contact_id, found)
+        self.assertNotIn(contact_id, [contact.contact_id for contact in self.manager.find_contacts('Кукушкин')])
+        pa.flush_pending()
+        self.assertEqual(pa.ContactManager().get_contact_by_name('евлампия соловьёва').contact_id, contact_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import io
+import os
+import sys
+import tempfile
+import contextlib
+import collections
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import personal_assistant as pa
+
+
+# Строки с маркерами пропусков pandas ("NA", "null", "n/a", "NaN"), пустыми и некорректными полями
+CSV_FILES = {
+    'notes': (pa.NoteManager, 'normalize_notes_chunk', 'normalize_note_row',
+              'title,content\n'
+              'NA,null\n'
+              'n/a,\n'
+              ',x\n'
+              'NaN,"N/A\nвторая строка"\n'
+              'None,-nan\n'),
+    'tasks': (pa.TaskManager, 'normalize_tasks_chunk', 'normalize_task_row',
+              'title,description,priority,due_date\n'
+              'NA,null,,01-02-2024\n'
+              'n/a,NaN,Высокий,31-12-1969\n'
+              'null,,NA,\n'
+              'x,,,32-01-2024\n'
+              ',y,,\n'),
+    'contacts': (pa.ContactManager, 'normalize_contacts_chunk', 'normalize_contact_row',
+                 'name,phone,email\n'
+                 'NA,+7 900 000-00-00,null\n'
+                 'null,n/a,NA\n'
+                 'n/a,,\n'
+                 ',89000000000,x@example.com\n'),
+    'finance': (pa.FinanceManager, 'normalize_finance_chunk', 'normalize_finance_row',
+                'amount,category,date,description\n'
+                '10,NA,01-01-2024,null\n'
+                '-5,n/a,,NA\n'
+                'NA,food,,\n'
+                'nan,food,,\n'
+                '7.5,null,29-02-2023,\n'
+                '1e3,,01-01-2024,n/a\n'),
+}
+
+
+class CsvImportParityTest(unittest.TestCase):
+    # Импорт через pandas и построчный импорт модулем csv должны давать одинаковые записи и отказы
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+        self.pandas_available = pa.PANDAS_AVAILABLE
+
+    def tearDown(self):
+        pa.PANDAS_AVAILABLE = self.pandas_available
+        pa.flush_pending()
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def read_chunks(self, csv_file, manager, frame_method, row_method, use_pandas):
+        pa.PANDAS_AVAILABLE = use_pandas
+        return list(pa.read_csv_chunks(csv_file, getattr(manager, frame_method), getattr(manager, row_method),
+                                       chunk_size=2))
+
+    @unittest.skipUnless(pa.PANDAS_AVAILABLE, "pandas не установлен")
+    def test_pandas_matches_csv_module(self):
+        for name, (manager_class, frame_method, row_method, content) in CSV_FILES.items():
+            with self.subTest(collection=name):
+                csv_file = name + '.csv'
+                with open(csv_file, 'w', encoding='utf-8', newline='') as f:
+                    f.write(content)
+                manager = manager_class()
+                expected = self.read_chunks(csv_file, manager, frame_method, row_method, False)
+                actual = self.read_chunks(csv_file, manager, frame_method, row_method, True)
+                self.assertEqual(actual, expected)
+                self.assertTrue(any(rows for _, _, rows, _ in expected))
+
+    @unittest.skipUnless(pa.PANDAS_AVAILABLE, "pandas не установлен")
+    def test_na_tokens_are_text(self):
+        with open('notes.csv', 'w', encoding='utf-8', newline='') as f:
+            f.write(CSV_FILES['notes'][3])
+        manager = pa.NoteManager()
+        chunks = self.read_chunks('notes.csv', manager, 'normalize_notes_chunk', 'normalize_note_row', True)
+        titles = [row[0] for _, _, rows, _ in chunks for row in rows]
+        self.assertEqual(titles, ['NA', 'n/a', 'NaN', 'None'])
+
+
+class Interrupted(Exception):
+    pass
+
+
+class ImportCheckpointTest(unittest.TestCase):
+    # Контрольная точка лежит рядом с файлом данных и относится к одному CSV и одной коллекции
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+        os.mkdir('source')
+        self.csv_file = os.path.join('source', 'notes.csv')
+        with open(self.csv_file, 'w', encoding='utf-8', newline='') as f:
+            f.write('title,content\n' + ''.join(f"n{index},\n" for index in range(6)))
+        self.manager = pa.NoteManager()
+        # Соединение SQLite открывается один раз на процесс и остаётся в каталоге первого теста,
+        # поэтому проверяются только записи, добавленные самим тестом
+        self.existing = collections.Counter(note.title for note in self.manager.notes)
+
+    def tearDown(self):
+        pa.flush_pending()
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def run_import(self, persist_limit=None):
+        persisted = []
+
+        def persist(rows):
+            if persist_limit is not None and len(persisted) == persist_limit:
+                raise Interrupted()
+            persisted.append(len(rows))
+            return self.manager.persist_notes_chunk(rows)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            pa.import_csv_in_chunks(self.csv_file, pa.NOTES_FILE, self.manager.normalize_notes_chunk,
+                                    self.manager.normalize_note_row, persist, chunk_size=2)
+        return persisted
+
+    def titles(self):
+        added = collections.Counter(note.title for note in pa.NoteManager().notes) - self.existing
+        return sorted(added.elements())
+
+    def test_resumes_without_duplicates(self):
+        with self.assertRaises(Interrupted):
+            self.run_import(persist_limit=1)
+        self.assertTrue(os.path.exists(pa.NOTES_FILE + pa.CHECKPOINT_SUFFIX))
+        self.assertEqual(os.listdir('source'), ['notes.csv'])
+        self.assertEqual(self.run_import(), [2, 2])
+        self.assertFalse(os.path.exists(pa.NOTES_FILE + pa.CHECKPOINT_SUFFIX))
+        self.assertEqual(self.titles(), [f"n{index}" for index in range(6)])
+
+    def test_foreign_checkpoint_ignored(self):
+        with self.assertRaises(Interrupted):
+            self.run_import(persist_limit=1)
+        checkpoint = pa.read_import_checkpoint(self.csv_file, pa.NOTES_FILE)
+        self.assertEqual(checkpoint['rows'], 2)
+        # Тот же CSV в другую коллекцию и другой CSV с той же подписью в эту коллекцию начинают с нуля
+        for field, value in (('collection', 'tasks'), ('data_file', os.path.abspath(pa.TASKS_FILE)),
+                             ('csv', os.path.abspath('other.csv')), ('storage', 'other')):
+            with self.subTest(field=field):
+                pa.write_import_checkpoint(pa.NOTES_FILE, dict(checkpoint, owner=dict(checkpoint['owner'],
+                                                                                       **{field: value})))
+                self.assertIsNone(pa.read_import_checkpoint(self.csv_file, pa.NOTES_FILE))
+        self.assertIsNone(pa.read_import_checkpoint(self.csv_file, pa.TASKS_FILE))
+
+    def test_unwritable_checkpoint_persists_nothing(self):
+        # Точку нельзя записать - импорт останавливается до первого сохранения, и повтор не задваивает строки
+        os.mkdir(pa.NOTES_FILE + pa.CHECKPOINT_SUFFIX + '.tmp')
+        with self.assertRaises(OSError):
+            self.run_import()
+        self.assertEqual(self.titles(), [])
+        os.rmdir(pa.NOTES_FILE + pa.CHECKPOINT_SUFFIX + '.tmp')
+        self.run_import()
+        self.assertEqual(self.titles(), [f"n{index}" for index in range(6)])
+
+
+if __name__ == '__main__':
+    unittest.main()
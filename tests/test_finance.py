@@ -0,0 +1,309 @@
+import io
+import os
+import sys
+import random
+import json
+import decimal
+import tempfile
+import subprocess
+import unittest
+import contextlib
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+import personal_assistant as pa
+
+
+# Процесс-читатель: кэширует итоги января, затем другой процесс добавляет запись в январь.
+# Печатает итоги до и после и счётчики кэша
+CACHE_READER = '''
+import io, sys, json, subprocess, contextlib
+sys.path.insert(0, sys.argv[1])
+import personal_assistant as pa
+WRITER = "import sys; sys.path.insert(0, sys.argv[1]); import personal_assistant as pa; " \\
+         "pa.FinanceManager().add_finance_record(5.0, 'b', '06-01-2024'); pa.flush_pending()"
+session = pa.CommandSession()
+january = (pa.parse_date('01-01-2024'), pa.parse_date('31-01-2024'))
+with contextlib.redirect_stdout(io.StringIO()):
+    manager = session.manager('finance')
+    manager.add_finance_record(10.0, 'a', '05-01-2024')
+    session.checkpoint('finance')
+    before = [manager.period_totals(*january), manager.period_totals(*january)]
+    subprocess.run([sys.executable, '-c', WRITER, sys.argv[1]], check=True, stdout=subprocess.DEVNULL)
+    session.refresh('finance')
+    manager = session.manager('finance')
+    after = [manager.period_totals(*january), manager.period_totals(*january)]
+print(json.dumps([before, after]))
+'''
+
+
+@unittest.skipUnless(pa.NUMPY_AVAILABLE, "numpy не установлен")
+class FinanceColumnsTest(unittest.TestCase):
+    def setUp(self):
+        dates = ['без даты', '31-12-1969', '01-01-1970', '15-03-2024']
+        self.records = [pa.FinanceRecord(record_id=record_id, amount=amount, category='x', date=date)
+                        for record_id, (amount, date) in enumerate(zip((3.0, 4.0, -2.0, 10.0), dates), 1)]
+        self.ordinals = {record.record_id: pa.parse_date(record.date) for record in self.records}
+        self.columns = pa.FinanceColumns(self.records, self.ordinals)
+
+    def test_day_before_epoch_is_a_date(self):
+        # 31-12-1969 - день -1 от начала эпохи Unix, раньше он совпадал с признаком записи без даты
+        mask = self.columns.period_mask(pa.parse_date('01-12-1969'), pa.parse_date('31-12-1969'))
+        self.assertEqual(self.columns.totals(mask), (4.0, 0.0))
+        self.assertEqual(self.columns.by_month(self.columns.period_mask()),
+                         [('12-1969', 4.0, 0.0), ('01-1970', 0.0, -2.0), ('03-2024', 10.0, 0.0)])
+
+    def test_undated_records_only_in_unbounded_totals(self):
+        self.assertEqual(self.columns.totals(self.columns.period_mask()), (17.0, -2.0))
+        self.assertEqual(self.columns.totals(self.columns.period_mask(pa.parse_date('01-01-1900'))), (14.0, -2.0))
+
+
+class FenwickTreeTest(unittest.TestCase):
+    def setUp(self):
+        generator = random.Random(6)
+        self.values = [generator.randint(-50, 50) for _ in range(37)]
+        self.tree = pa.FenwickTree(self.values)
+
+    def check(self):
+        for index in range(-1, len(self.values) + 2):
+            self.assertEqual(self.tree.prefix_sum(index), sum(self.values[:index + 1]))
+
+    def test_prefix_sums(self):
+        self.assertEqual(len(self.tree), len(self.values))
+        self.check()
+        self.assertEqual(pa.FenwickTree([]).prefix_sum(5), 0)
+
+    def test_range_sums_after_updates(self):
+        generator = random.Random(7)
+        for _ in range(100):
+            index, value = generator.randrange(len(self.values)), generator.randint(-20, 20)
+            self.values[index] += value
+            self.tree.add(index, value)
+        self.check()
+        for low in range(len(self.values)):
+            for high in range(low, len(self.values)):
+                self.assertEqual(self.tree.prefix_sum(high) - self.tree.prefix_sum(low - 1),
+                                 sum(self.values[low:high + 1]))
+
+
+class FinanceAggregatesTest(unittest.TestCase):
+    # Итоги за период совпадают с суммой Decimal по самим записям - без погрешностей float,
+    # после правок и удалений тоже
+    PERIODS = [(None, None), ('01-01-2024', '31-01-2024'), ('15-01-2024', None), (None, '10-02-2024'),
+               ('05-01-2024', '05-01-2024'), ('01-03-2024', '31-03-2024'), ('01-02-2024', '01-01-2024')]
+
+    def setUp(self):
+        generator = random.Random(5)
+        dates = [f"{day:02d}-{month:02d}-2024" for month in (1, 2) for day in range(1, 29, 3)] + [None]
+        self.records = {}
+        self.aggregates = pa.FinanceAggregates()
+        for record_id in range(1, 201):
+            self.add(record_id, generator.choice((0.1, 0.2, -0.3, 0.7, -1.1, 12.34, -0.01)),
+                     generator.choice('abc'), generator.choice(dates))
+
+    def add(self, record_id, amount, category, date):
+        self.records[record_id] = (amount, category, date)
+        self.aggregates.add(pa.parse_date(date) if date else None, category, amount)
+
+    def remove(self, record_id):
+        amount, category, date = self.records.pop(record_id)
+        self.aggregates.remove(pa.parse_date(date) if date else None, category, amount)
+
+    def expected_totals(self, start=None, end=None):
+        income = expense = decimal.Decimal(0)
+        for amount, _, date in self.records.values():
+            if start or end:
+                ordinal = pa.parse_date(date) if date else None
+                if (ordinal is None or (start and ordinal < pa.parse_date(start))
+                        or (end and ordinal > pa.parse_date(end))):
+                    continue
+            if amount > 0:
+                income += decimal.Decimal(str(amount))
+            else:
+                expense += decimal.Decimal(str(amount))
+        return float(income), float(expense)
+
+    def check(self):
+        for start, end in self.PERIODS:
+            with self.subTest(start=start, end=end):
+                self.assertEqual(self.aggregates.period_totals(pa.parse_date(start) if start else None,
+                                                               pa.parse_date(end) if end else None),
+                                 self.expected_totals(start, end))
+        categories = {}
+        for amount, category, _ in self.records.values():
+            totals = categories.setdefault(category, [decimal.Decimal(0), decimal.Decimal(0)])
+            totals[0 if amount > 0 else 1] += decimal.Decimal(str(amount))
+        self.assertEqual(self.aggregates.category_rows(),
+                         sorted((name, float(income), float(expense)) for name, (income, expense) in categories.items()))
+
+    def test_totals(self):
+        self.check()
+
+    def test_edit(self):
+        # Правка записи - удаление старой версии и добавление новой, в том числе в новый день
+        self.aggregates.period_totals()
+        for record_id, (amount, date) in ((3, (-0.3, '05-01-2024')), (4, (0.1, '20-03-2024')),
+                                          (5, (7.0, None)), (6, (0.2, '04-01-2024'))):
+            category = self.records[record_id][1]
+            self.remove(record_id)
+            self.add(record_id, amount, category, date)
+            self.check()
+
+    def test_delete(self):
+        for record_id in range(1, 201, 3):
+            self.remove(record_id)
+        self.check()
+        for record_id in list(self.records):
+            self.remove(record_id)
+        self.assertEqual(self.aggregates.period_totals(), (0.0, 0.0))
+        self.assertEqual(self.aggregates.category_rows(), [])
+
+
+@unittest.skipIf(pa.STORAGE.indexed, "итоги считает SQLite")
+class FinanceManagerTotalsTest(unittest.TestCase):
+    # Отчёты менеджера идут через агрегаты и должны совпадать с суммой по записям
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+
+    def tearDown(self):
+        pa.flush_pending()
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def test_add_and_delete(self):
+        manager = pa.FinanceManager()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for index in range(30):
+                manager.add_finance_record((0.1, -0.2, 0.3)[index % 3], 'c', f"{index % 9 + 1:02d}-01-2024")
+            self.assertEqual(manager.period_totals(), (4.0, -2.0))
+            self.assertEqual(manager.period_totals(pa.parse_date('02-01-2024'), pa.parse_date('03-01-2024')),
+                             (1.2, -0.8))
+            for record_id in range(1, 31, 2):
+                manager.delete_finance_record(record_id)
+        income = sum(decimal.Decimal(str(record.amount)) for record in manager.records if record.amount > 0)
+        expense = sum(decimal.Decimal(str(record.amount)) for record in manager.records if record.amount < 0)
+        self.assertEqual(manager.period_totals(), (float(income), float(expense)))
+        self.assertEqual(pa.FinanceManager().period_totals(), (float(income), float(expense)))
+
+
+class QueryCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = pa.QueryCache('test', max_size=4)
+        self.day = pa.parse_date('15-01-2024')
+        for key in (('totals', None, None), ('totals', self.day - 10, self.day + 10),
+                    ('totals', self.day + 1, None), ('totals', None, self.day - 1)):
+            self.cache.get(key, lambda: key)
+
+    def test_invalidates_only_periods_containing_the_day(self):
+        self.cache.invalidate(self.day)
+        self.assertEqual(set(self.cache.entries), {('totals', None, self.day - 1), ('totals', self.day + 1, None)})
+        self.cache.invalidate(self.day + 1)
+        self.assertEqual(list(self.cache.entries), [('totals', None, self.day - 1)])
+
+    def test_undated_record_invalidates_unbounded_queries(self):
+        self.cache.invalidate(None)
+        self.assertEqual(len(self.cache.entries), 3)
+        self.assertNotIn(('totals', None, None), self.cache.entries)
+
+    def test_signature_change_clears_everything(self):
+        self.cache.validate(('db', 1))
+        self.assertEqual(self.cache.entries, {})
+        self.cache.get(('totals', None, None), lambda: 1)
+        self.cache.validate(('db', 1))
+        self.assertEqual(len(self.cache.entries), 1)
+        self.cache.validate(('db', 2))
+        self.assertEqual(self.cache.entries, {})
+
+    def test_lru_and_counters(self):
+        # Счётчики продолжают счёт прежнего кэша с тем же именем, поэтому сравнивается прирост
+        before = self.cache.counters()
+        self.cache.get(('totals', None, None), lambda: self.fail("результат есть в кэше"))
+        self.cache.get(('months', None, None), lambda: 0)
+        self.assertNotIn(('totals', self.day - 10, self.day + 10), self.cache.entries)
+        self.assertIn(('totals', None, None), self.cache.entries)
+        after = self.cache.counters()
+        self.assertEqual((after['hits'] - before['hits'], after['misses'] - before['misses']), (1, 1))
+
+
+@unittest.skipIf(pa.STORAGE.indexed, "кэш SQLite сбрасывается по подписи базы при любой записи")
+class FinanceQueryCacheTest(unittest.TestCase):
+    # Добавление и удаление записи сбрасывают только закэшированные периоды, в которые попадает её дата
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+        self.output = contextlib.redirect_stdout(io.StringIO())
+        self.output.__enter__()
+        self.manager = pa.FinanceManager()
+        for amount, date in ((10.0, '05-01-2024'), (-4.0, '20-01-2024'), (7.0, '10-03-2024'), (1.0, None)):
+            self.manager.add_finance_record(amount, 'a', date)
+        self.periods = {'january': (pa.parse_date('01-01-2024'), pa.parse_date('31-01-2024')),
+                        'march': (pa.parse_date('01-03-2024'), pa.parse_date('31-03-2024')),
+                        'all': (None, None)}
+
+    def tearDown(self):
+        self.output.__exit__(None, None, None)
+        pa.flush_pending()
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def warm_up(self):
+        for period in self.periods.values():
+            self.manager.period_totals(*period)
+
+    def assertCachedPeriods(self, names):
+        keys = {('totals', start, end, None): name for name, (start, end) in self.periods.items()}
+        self.assertEqual(sorted(keys[key] for key in self.manager.query_cache.entries if key in keys), sorted(names))
+        fresh = pa.FinanceManager()
+        for name, period in self.periods.items():
+            self.assertEqual(self.manager.period_totals(*period), fresh.period_totals(*period), name)
+
+    def test_add_and_delete(self):
+        self.warm_up()
+        self.manager.add_finance_record(2.0, 'a', '31-03-2024')
+        self.assertCachedPeriods(['january'])
+        self.manager.add_finance_record(2.0, 'a', '01-06-2024')
+        self.assertCachedPeriods(['january', 'march'])
+        self.manager.delete_finance_record(2)
+        self.assertCachedPeriods(['march'])
+        self.manager.add_finance_record(3.0, 'a', 'без даты')
+        self.assertCachedPeriods(['january', 'march'])
+        self.manager.delete_finance_record(4)
+        self.assertCachedPeriods(['january', 'march'])
+        pa.flush_pending()
+        self.assertEqual(self.manager.period_totals(), pa.FinanceManager().period_totals())
+
+    def test_import_clears_cache(self):
+        self.warm_up()
+        with open('finance.csv', 'w', encoding='utf-8') as f:
+            f.write('amount,category,date\n1,b,01-06-2024\n')
+        self.manager.import_finance_records_from_csv('finance.csv')
+        self.assertCachedPeriods([])
+
+
+class CrossProcessQueryCacheTest(unittest.TestCase):
+    # Запись другого процесса (штамп .lock для файлов, подпись базы для SQLite) сбрасывает кэш итогов
+    def check(self, backend):
+        with tempfile.TemporaryDirectory() as directory:
+            reader = subprocess.run([sys.executable, '-c', CACHE_READER, PROJECT_DIR], cwd=directory,
+                                    env=dict(os.environ, PA_STORAGE=backend), capture_output=True, text=True)
+        self.assertEqual(reader.returncode, 0, reader.stderr)
+        before, after = json.loads(reader.stdout.splitlines()[-1])
+        self.assertEqual(before, [[10.0, 0.0], [10.0, 0.0]])
+        self.assertEqual(after, [[15.0, 0.0], [15.0, 0.0]])
+
+    def test_journal(self):
+        self.check('journal')
+
+    def test_json(self):
+        self.check('json')
+
+    def test_sqlite(self):
+        self.check('sqlite')
+
+
+if __name__ == '__main__':
+    unittest.main()
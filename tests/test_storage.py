@@ -0,0 +1,133 @@
+import os
+import sys
+import json
+import subprocess
+import tempfile
+import unittest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+import personal_assistant as pa
+
+
+# Процесс-писатель: добавляет записи и удаляет часть из них, с маленьким порогом сжатия журнала,
+# чтобы снимок переписывался, пока другие процессы дописывают журнал. Печатает ID оставшихся записей
+WRITER = '''
+import io, sys, json, contextlib
+sys.path.insert(0, sys.argv[1])
+import personal_assistant as pa
+if pa.STORAGE.journaled:
+    pa.STORAGE.compact_threshold = 5
+worker, count = sys.argv[2], int(sys.argv[3])
+manager = pa.FinanceManager()
+kept = []
+with contextlib.redirect_stdout(io.StringIO()):
+    for index in range(count):
+        kept.append(manager.add_finance_record(1.0, worker, "01-01-2024", str(index)).record_id)
+        if index % 7 == 3:
+            manager.delete_finance_record(kept.pop(0))
+pa.flush_pending()
+print(json.dumps(kept))
+'''
+
+
+class ConcurrentWritersTest(unittest.TestCase):
+    # Несколько процессов пишут в один файл: ни одна запись не теряется, ID не повторяются
+    WORKERS = 4
+    RECORDS = 40
+
+    def run_writers(self, backend):
+        with tempfile.TemporaryDirectory() as directory:
+            environment = dict(os.environ, PA_STORAGE=backend)
+            writers = [subprocess.Popen([sys.executable, '-c', WRITER, PROJECT_DIR, f"w{worker}", str(self.RECORDS)],
+                                        cwd=directory, env=environment, stdout=subprocess.PIPE, text=True)
+                       for worker in range(self.WORKERS)]
+            kept = {}
+            for worker, writer in enumerate(writers):
+                output, _ = writer.communicate(timeout=120)
+                self.assertEqual(writer.returncode, 0)
+                kept[f"w{worker}"] = json.loads(output.splitlines()[-1])
+            reader = subprocess.run([sys.executable, '-c', (
+                'import sys, json; sys.path.insert(0, sys.argv[1]); import personal_assistant as pa; '
+                'print(json.dumps([[r.record_id, r.category] for r in pa.FinanceManager().records]))'),
+                PROJECT_DIR], cwd=directory, env=environment, capture_output=True, text=True, check=True)
+            records = json.loads(reader.stdout.splitlines()[-1])
+        ids = [record_id for record_id, _ in records]
+        self.assertEqual(len(ids), len(set(ids)))
+        for worker, worker_ids in kept.items():
+            self.assertEqual(sorted(record_id for record_id, category in records if category == worker),
+                             sorted(worker_ids))
+
+    def test_journal(self):
+        self.run_writers('journal')
+
+    def test_json(self):
+        self.run_writers('json')
+
+
+class CorruptSnapshotRecoveryTest(unittest.TestCase):
+    # Повреждённый снимок восстанавливается из предыдущего поколения (.bak), свёрнутого в него журнала
+    # (.journal.bak) и текущего журнала
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def write_notes(self, count):
+        storage = pa.JournalStorage(compact_threshold=4)
+        storage.save(pa.NOTES_FILE, [], {'next_id': 1})
+        notes = [{'note_id': note_id, 'title': f"n{note_id}", 'content': '', 'timestamp': '01-01-2024 00:00:00'}
+                 for note_id in range(1, count + 1)]
+        for note in notes:
+            storage.append(pa.NOTES_FILE, 'add', 'note_id', [note],
+                           lambda: notes[:note['note_id']], {'next_id': note['note_id'] + 1})
+        storage.append(pa.NOTES_FILE, 'delete', 'note_id', [notes[0]], lambda: notes[1:], {'next_id': count + 1})
+        return notes[1:]
+
+    def load_notes(self):
+        return pa.JournalStorage().load(pa.NOTES_FILE, [], 'note_id')
+
+    def test_recovers_from_backup_and_journals(self):
+        expected = self.write_notes(10)
+        self.assertTrue(os.path.exists(pa.NOTES_FILE + pa.BACKUP_SUFFIX))
+        self.assertTrue(os.path.exists(pa.NOTES_FILE + pa.JOURNAL_SUFFIX))
+        with open(pa.NOTES_FILE, 'rb') as f:
+            content = bytearray(f.read())
+        content[content.index(b'"n5"') + 2] = ord('x')
+        with open(pa.NOTES_FILE, 'wb') as f:
+            f.write(content)
+
+        data, meta = self.load_notes()
+        self.assertEqual(sorted(data, key=lambda note: note['note_id']), expected)
+        self.assertEqual(meta['next_id'], 11)
+        self.assertTrue(os.path.exists(pa.NOTES_FILE + pa.CORRUPT_SUFFIX))
+        # Восстановленный снимок записан заново и читается без восстановления
+        data, _ = self.load_notes()
+        self.assertEqual(len(data), len(expected))
+
+    def test_truncated_snapshot(self):
+        expected = self.write_notes(7)
+        with open(pa.NOTES_FILE, 'rb') as f:
+            content = f.read()
+        with open(pa.NOTES_FILE, 'wb') as f:
+            f.write(content[:len(content) // 2])
+        data, _ = self.load_notes()
+        self.assertEqual(sorted(data, key=lambda note: note['note_id']), expected)
+
+    def test_without_backup_starts_empty(self):
+        pa.JournalStorage().save(pa.NOTES_FILE, [{'note_id': 1, 'title': 'a', 'content': '',
+                                                  'timestamp': '01-01-2024 00:00:00'}], {'next_id': 2})
+        with open(pa.NOTES_FILE, 'wb') as f:
+            f.write(b'{"meta": {')
+        data, _ = self.load_notes()
+        self.assertEqual(data, [])
+        self.assertTrue(os.path.exists(pa.NOTES_FILE + pa.CORRUPT_SUFFIX))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import io
+import os
+import sys
+import random
+import tempfile
+import unittest
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import personal_assistant as pa
+
+
+PRIORITIES = ("Высокий", "средний", "НИЗКИЙ", "Срочно", "")
+DUE_DATES = ("01-03-2024", "15-03-2024", "31-03-2024", "01-04-2024", "29-02-2024", "скоро", "01-01-1970")
+PERIODS = [(None, "31-03-2024"), ("01-03-2024", "31-03-2024"), ("15-03-2024", "15-03-2024"),
+           ("01-04-2024", None), ("01-01-1900", "31-12-2100")]
+
+
+class TaskAgendaTest(unittest.TestCase):
+    # Повестка (by_due и by_priority) после любых изменений совпадает с сортировкой самих задач
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+        self.output = contextlib.redirect_stdout(io.StringIO())
+        self.output.__enter__()
+        self.generator = random.Random(11)
+        self.manager = pa.TaskManager()
+        self.added = [self.add_task(self.manager) for _ in range(40)]
+
+    def tearDown(self):
+        self.output.__exit__(None, None, None)
+        pa.flush_pending()
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def add_task(self, manager):
+        return manager.add_task("t", "", self.generator.choice(PRIORITIES), self.generator.choice(DUE_DATES)).task_id
+
+    def due(self, task):
+        ordinal = pa.parse_date(task.due_date)
+        return pa.UNDATED_ORDINAL if ordinal is None else ordinal
+
+    def check(self, manager):
+        open_tasks = [task for task in manager.tasks if not task.done]
+        for start, end in PERIODS:
+            with self.subTest(start=start, end=end):
+                low = pa.parse_date(start) if start else None
+                high = pa.parse_date(end) if end else None
+                expected = sorted((task for task in open_tasks
+                                   if (low is None or self.due(task) >= low) and (high is None or self.due(task) <= high)),
+                                  key=lambda task: (self.due(task), pa.task_priority_rank(task.priority), task.task_id))
+                self.assertEqual([task.task_id for task in manager.open_tasks_due(low, high)],
+                                 [task.task_id for task in expected])
+        expected = sorted(open_tasks, key=lambda task: (pa.task_priority_rank(task.priority), self.due(task), task.task_id))
+        self.assertEqual([task.task_id for task in manager.top_open_tasks(len(open_tasks) + 1)],
+                         [task.task_id for task in expected])
+        if not manager.tasks.indexed:
+            self.assertEqual(len(manager.by_due), len(open_tasks))
+            self.assertEqual(manager.by_priority, sorted(manager.by_priority))
+
+    def test_add(self):
+        self.check(self.manager)
+        self.assertEqual([task.task_id for task in self.manager.top_open_tasks(3)],
+                         [task.task_id for task in self.manager.top_open_tasks()[:3]])
+
+    def test_edit_due_date_and_priority(self):
+        for task_id in self.added[::3]:
+            self.manager.edit_task(task_id, new_due_date=self.generator.choice(DUE_DATES))
+        for task_id in self.added[1::3]:
+            self.manager.edit_task(task_id, new_priority=self.generator.choice(PRIORITIES[:4]))
+        for task_id in self.added[2::5]:
+            self.manager.edit_task(task_id, new_title="x", new_priority="Высокий", new_due_date="14-03-2024")
+        self.check(self.manager)
+
+    def test_mark_done_and_delete(self):
+        for task_id in self.added[::4]:
+            self.manager.mark_task_as_done(task_id)
+        # Правка выполненной задачи не возвращает её в повестку
+        self.manager.edit_task(self.added[0], new_priority="Высокий")
+        for task_id in self.added[1::6]:
+            self.manager.delete_task(task_id)
+        self.check(self.manager)
+        pa.flush_pending()
+        self.check(pa.TaskManager())
+
+    @unittest.skipUnless(pa.LAZY_LOAD and not pa.STORAGE.indexed, "нужна ленивая загрузка из файла")
+    def test_lazy_load_merges_pending_adds(self):
+        pa.flush_pending()
+        manager = pa.TaskManager()
+        self.assertFalse(manager.tasks.loaded)
+        # До загрузки задачи копятся в pending, во время построения повестки - попадают в неё через on_index
+        early = [self.add_task(manager) for _ in range(5)]
+        rebuild_agenda = manager.tasks.on_load
+        late = []
+
+        def on_load():
+            rebuild_agenda()
+            late.extend(self.add_task(manager) for _ in range(5))
+
+        manager.tasks.on_load = on_load
+        manager.tasks.ensure_loaded()
+        self.assertTrue(manager.tasks.loaded)
+        self.assertEqual(len(late), 5)
+        self.assertEqual(len(manager.tasks), len(self.added) + len(early) + len(late))
+        self.check(manager)
+        pa.flush_pending()
+        self.check(pa.TaskManager())
+
+
+if __name__ == '__main__':
+    unittest.main()